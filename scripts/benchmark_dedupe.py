@@ -0,0 +1,56 @@
+"""Compare dedupe() with a check_then_add() loop over a skewed stream
+
+Run from the repository root:
+
+    python -m scripts.benchmark_dedupe
+"""
+import argparse
+import random
+import time
+
+from src.profusion import Bloom, ScalableBloom
+
+
+def best_time(fn, repeat: int = 3) -> float:
+    """Best seconds taken by fn() over repeat runs"""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--keys", type=int, default=300000)
+    parser.add_argument("--distinct", type=int, default=100000)
+    parser.add_argument("--error-ratio", type=float, default=1e-4)
+    parser.add_argument("--batch-size", type=int, default=10000)
+    args = parser.parse_args()
+
+    keys = [f"key_{random.randrange(args.distinct)}" for _ in range(args.keys)]
+
+    def bloom():
+        return Bloom(capacity=args.distinct, error_ratio=args.error_ratio)
+
+    def scalable():
+        return ScalableBloom(max_error=args.error_ratio)
+
+    for name, new in (("Bloom", bloom), ("ScalableBloom", scalable)):
+
+        def loop():
+            f = new()
+            return [s for s in keys if not f.check_then_add(s)]
+
+        def dedupe():
+            return list(new().dedupe(keys, batch_size=args.batch_size))
+
+        assert loop() == dedupe()
+        for label, fn in (("check_then_add loop", loop), ("dedupe", dedupe)):
+            rate = args.keys / best_time(fn)
+            print(f"{name:>14} {label:>20}: {rate:10.0f} keys/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+"""Compare batched adds and checks of Bloom and PartitionedBloom
+
+Run from the repository root:
+
+    python -m scripts.benchmark_partitioned
+"""
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+import os
+import time
+
+from src.profusion import Bloom, PartitionedBloom
+
+
+def best_time(fn, repeat: int = 3) -> float:
+    """Best seconds taken by fn() over repeat runs"""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--keys", type=int, default=200000)
+    parser.add_argument("--error-ratio", type=float, default=1e-4)
+    parser.add_argument("--threads", type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+
+    keys = [f"key_{i}" for i in range(args.keys)]
+    absent = [f"absent_{i}" for i in range(args.keys)]
+    params = {"capacity": args.keys, "error_ratio": args.error_ratio}
+    executor = ThreadPoolExecutor(args.threads)
+
+    for name, cls, kwargs in (
+        ("Bloom", Bloom, {}),
+        ("PartitionedBloom", PartitionedBloom, {}),
+        (
+            f"PartitionedBloom ({args.threads} threads)",
+            PartitionedBloom,
+            {"executor": executor},
+        ),
+    ):
+        bloom = cls(**params)
+        add = best_time(lambda: bloom.add_many(keys, **kwargs))
+        hit = best_time(lambda: bloom.check_many(keys, **kwargs))
+        miss = best_time(lambda: bloom.check_many(absent, **kwargs))
+        fpr = sum(bloom.check_many(absent)) / args.keys
+        print(
+            f"{name:>30}: add {args.keys / add:9.0f}/s, "
+            f"present {args.keys / hit:9.0f}/s, "
+            f"absent {args.keys / miss:9.0f}/s, fpr {fpr:.2e}"
+        )
+    executor.shutdown()
+
+
+if __name__ == "__main__":
+    main()
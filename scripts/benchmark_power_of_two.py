@@ -0,0 +1,81 @@
+"""Compare modulo and power-of-two indexing, and shrinking by fold()
+
+Run from the repository root:
+
+    python -m scripts.benchmark_power_of_two
+"""
+import argparse
+import random
+import time
+
+from src.profusion import Bloom
+
+
+def time_per_call(fn, items, repeat: int = 3) -> float:
+    """Best nanoseconds per call of fn over items"""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for item in items:
+            fn(item)
+        best = min(best, time.perf_counter() - start)
+    return best / len(items) * 1e9
+
+
+def false_positive_rate(bloom: Bloom, probes: int) -> float:
+    """Measured false positive rate over keys never added"""
+    misses = [f"absent_{i}" for i in range(probes)]
+    return sum(bloom.check_many(misses)) / probes
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--capacity", type=int, default=100000)
+    parser.add_argument("--error-ratio", type=float, default=1e-3)
+    parser.add_argument("--keys", type=int, default=100000)
+    parser.add_argument(
+        "--oversize", type=int, default=8, help="creation capacity multiple"
+    )
+    args = parser.parse_args()
+
+    modulo = Bloom(capacity=args.capacity, error_ratio=args.error_ratio)
+    masked = Bloom(
+        capacity=args.capacity,
+        error_ratio=args.error_ratio,
+        power_of_two=True,
+    )
+    digests = [random.getrandbits(32) - (1 << 31) for _ in range(args.keys)]
+    keys = [f"key_{i}" for i in range(args.keys)]
+
+    print("Per-probe index computation (_digest2index)")
+    for name, bloom in (("modulo", modulo), ("power of two", masked)):
+        ns = time_per_call(bloom._digest2index, digests)
+        print(f"  {name:>14}: {ns:7.1f} ns/probe, {bloom.bins} bins")
+
+    print("Per-key add and check")
+    for name, bloom in (("modulo", modulo), ("power of two", masked)):
+        add = time_per_call(bloom.add, keys)
+        check = time_per_call(bloom.check, keys)
+        print(f"  {name:>14}: add {add:7.0f} ns, check {check:7.0f} ns")
+
+    print(f"Oversized {args.oversize}x at creation, then folded to fit")
+    bloom = Bloom(
+        capacity=args.capacity * args.oversize,
+        error_ratio=args.error_ratio,
+        power_of_two=True,
+    )
+    bloom.add_many(keys[: args.capacity])
+    while bloom.bins >= 16:
+        saturation = bloom._saturation()
+        fpr = false_positive_rate(bloom, 20000)
+        print(
+            f"  {len(bloom.bf):>10} bytes, saturation {saturation:.3f}, "
+            f"measured FPR {fpr:.5f}"
+        )
+        if fpr > args.error_ratio:
+            break
+        bloom.fold()
+
+
+if __name__ == "__main__":
+    main()
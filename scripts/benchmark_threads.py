@@ -0,0 +1,75 @@
+"""Measure thread-safe Bloom and CountingBloom adds on 1..N threads
+
+Checks that the result matches a single-threaded build, so no bits or
+counts were lost. Throughput only scales with threads on free-threaded
+Python (3.13t); with the GIL it shows the locking overhead.
+
+Run from the repository root:
+
+    python -m scripts.benchmark_threads
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+
+from src.profusion import Bloom, CountingBloom
+
+
+def run_threads(threads: int, target, keys: list) -> float:
+    """Seconds taken by threads running target over slices of keys"""
+    workers = [
+        threading.Thread(target=target, args=(keys[i::threads],))
+        for i in range(threads)
+    ]
+    start = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return time.perf_counter() - start
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--keys", type=int, default=400000)
+    parser.add_argument("--error-ratio", type=float, default=1e-4)
+    parser.add_argument("--batch-size", type=int, default=10000)
+    parser.add_argument("--threads", type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+
+    gil = getattr(sys, "_is_gil_enabled", lambda: True)()
+    print(f"Python {sys.version.split()[0]}, GIL {'on' if gil else 'off'}")
+    keys = [f"key_{i}" for i in range(args.keys)]
+    params = {"capacity": args.keys, "error_ratio": args.error_ratio}
+
+    expected_bloom = Bloom(**params)
+    expected_bloom.add_many(keys)
+    expected_counts = CountingBloom(**params)
+    expected_counts.add_many(keys)
+
+    threads = 1
+    while threads <= args.threads:
+        bloom = Bloom(thread_safe=True, **params)
+        counts = CountingBloom(thread_safe=True, **params)
+
+        def add_batches(batch):
+            for start in range(0, len(batch), args.batch_size):
+                bloom.add_many(batch[start : start + args.batch_size])
+
+        for name, target, built, expected in (
+            ("Bloom.add_many", add_batches, bloom, expected_bloom),
+            ("CountingBloom.add", counts.add_many, counts, expected_counts),
+        ):
+            seconds = run_threads(threads, target, keys)
+            lost = "none" if built.bf == expected.bf else "LOST UPDATES"
+            print(
+                f"{name:>18} {threads:3d} threads: "
+                f"{args.keys / seconds:10.0f} keys/s, lost: {lost}"
+            )
+        threads *= 2
+
+
+if __name__ == "__main__":
+    main()
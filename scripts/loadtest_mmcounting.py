@@ -0,0 +1,65 @@
+"""Load-test one MMCountingBloom from several processes
+
+Spawns processes against a filter in /dev/shm with a mix of add() and
+value() calls on uniform or Zipf-distributed keys, and prints throughput,
+latency percentiles, lock-wait time and count-loss checks as JSON.
+
+Run from the repository root:
+
+    python -m scripts.loadtest_mmcounting --processes 8 --distribution zipf
+"""
+
+import argparse
+import json
+
+from src.profusion import loadtest
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--processes", type=int, default=loadtest.PROCESSES)
+    parser.add_argument(
+        "--operations",
+        type=int,
+        default=loadtest.OPERATIONS,
+        help="keys per process, in calls of --batch-size keys",
+    )
+    parser.add_argument("--keys", type=int, default=loadtest.KEYS)
+    parser.add_argument(
+        "--distribution", choices=loadtest.DISTRIBUTIONS, default="uniform"
+    )
+    parser.add_argument(
+        "--zipf-exponent", type=float, default=loadtest.ZIPF_EXPONENT
+    )
+    parser.add_argument("--add-ratio", type=float, default=loadtest.ADD_RATIO)
+    parser.add_argument("--batch-size", type=int, default=1)
+    parser.add_argument("--capacity", type=float, default=loadtest.CAPACITY)
+    parser.add_argument(
+        "--error-ratio", type=float, default=loadtest.ERROR_RATIO
+    )
+    parser.add_argument("--dir", default=loadtest.DIR)
+    parser.add_argument(
+        "--name", help="existing filter to use instead of a fresh one"
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    result = loadtest.load_test(
+        processes=args.processes,
+        operations=args.operations,
+        keys=args.keys,
+        distribution=args.distribution,
+        add_ratio=args.add_ratio,
+        batch_size=args.batch_size,
+        zipf_exponent=args.zipf_exponent,
+        capacity=args.capacity,
+        error_ratio=args.error_ratio,
+        dir=args.dir,
+        name=args.name,
+        seed=args.seed,
+    )
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
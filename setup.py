@@ -23,16 +23,22 @@ setup(
         "License :: CC0 1.0 Universal (CC0 1.0) Public Domain Dedication",
         "Operating System :: OS Independent",
         "Programming Language :: Python :: 3",
-        "Programming Language :: Python :: 3.6",
-        "Programming Language :: Python :: 3.7",
         "Programming Language :: Python :: 3.8",
         "Programming Language :: Python :: 3.9",
     ],
-    python_requires=">=3.6",
+    python_requires=">=3.8",
+    entry_points={
+        "console_scripts": [
+            "profusion=profusion.cli:main",
+        ],
+    },
     install_requires=[
         "mmh3",
     ],
     extras_require={
+        "numpy": [
+            "numpy",
+        ],
         "dev": [
             "black",
             "pytest>=3.7",
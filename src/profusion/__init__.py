@@ -4,12 +4,26 @@ __program__ = "profusion"
 from .bloom import Bloom, BloomException
 from .counting_bloom import CountingBloom
 from .scalable_bloom import ScalableBloom
+from .partitioned_bloom import PartitionedBloom
 from .mmapped_counting_bloom import MMCountingBloom
+from .mmapped_scalable_bloom import MMScalableBloom
+from .arena import BloomArena
+from .tiered_bloom import TieredBloom
+from .persist import Checkpointer, inspect
+from .planner import Plan, plan
 
 __all__ = [
     "Bloom",
     "BloomException",
     "CountingBloom",
     "ScalableBloom",
+    "PartitionedBloom",
     "MMCountingBloom",
+    "MMScalableBloom",
+    "BloomArena",
+    "TieredBloom",
+    "Checkpointer",
+    "inspect",
+    "Plan",
+    "plan",
 ]
@@ -1,16 +1,64 @@
+from concurrent.futures import Executor, Future, wait
+import contextlib
+import hashlib
 import json
 import math
 import os
-from typing import Any, Tuple
+from typing import (
+    Any,
+    Callable,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Tuple,
+)
+import uuid
+import weakref
 import zipfile
 
 import mmh3
 
 from . import __version__, __program__
+from . import delta
+from . import persist
+from . import shared
+from . import ingest as _ingest
+from .cache import CACHE_POLICIES, index_cache
+from .keys import iter_keys, np, to_key
+from .locks import LOCK_STRIPES, StripedLock
+from .sparse import SPARSE_SATURATION, SparseBits, dense
 
 
 CAPACITY = 1e6
 ERROR_RATIO = 1e-15
+CACHE_SIZE = 0
+CACHE_POLICY = "lru"
+NO_LOCK = contextlib.nullcontext()
+MERGE_CHUNK_SIZE = 1 << 20  # 1MiB
+# Hash functions: mmh3 seeded with the hash number, or SHA-256 of the
+# element followed by the hash number's digits as MMCountingBloom uses
+HASH_SCHEME = "murmur3"
+HASH_SCHEMES = ("murmur3", "sha256")
+
+
+def popcount(buffer: Any) -> int:
+    """Count the bits set in a buffer, one chunk at a time"""
+    if isinstance(buffer, SparseBits):
+        return buffer.count
+    view = memoryview(buffer).cast("B")
+    total = 0
+    for start in range(0, len(view), MERGE_CHUNK_SIZE):
+        chunk = int.from_bytes(view[start : start + MERGE_CHUNK_SIZE], "big")
+        total += bin(chunk).count("1")
+    return total
+
+
+def sha256_hash(s: Any, seed: int) -> int:
+    """SHA-256 digest of an element salted with the seed's digits"""
+    digest = hashlib.sha256(s)
+    digest.update(str(seed).encode())
+    return int.from_bytes(digest.digest(), "big")
 
 
 class BloomException(Exception):
@@ -20,17 +68,76 @@ class BloomException(Exception):
 class Bloom:
     """Bloom filter implementation"""
 
+    type = "bloom"
+    # Striped locks guarding writes in thread-safe mode, see __init__()
+    locks: Optional[StripedLock] = None
+    hash_scheme = HASH_SCHEME
+    # Saturation up to which buffers are SparseBits, None unless sparse
+    sparse_saturation: Optional[float] = None
+    # Random id of the last base file saved or loaded; delta log frames
+    # written against another base file are skipped on load
+    generation: Optional[str] = None
+
     def __init__(self, **kwargs: Any) -> None:
         self.type = "bloom"
         self.capacity = kwargs.get("capacity", CAPACITY)
         self.error_ratio = kwargs.get("error_ratio", ERROR_RATIO)
         self.path = kwargs.get("path", None)
+        self.power_of_two = kwargs.get("power_of_two", False)
+        cache_size = kwargs.get("cache_size", CACHE_SIZE)
+        cache_policy = kwargs.get("cache_policy", CACHE_POLICY)
+        thread_safe = kwargs.get("thread_safe", False)
+        lock_stripes = kwargs.get("lock_stripes", LOCK_STRIPES)
+        self.hash_scheme = kwargs.get("hash_scheme", HASH_SCHEME)
+        sparse = kwargs.get("sparse", False)
+        sparse_saturation = kwargs.get("sparse_saturation", SPARSE_SATURATION)
 
         # Validate initialization parameters
         if self.capacity <= 0:
             raise BloomException("capacity must be > 0")
         if not 0 < self.error_ratio < 1:
             raise BloomException("error_ratio must be between 0 and 1")
+        if cache_size < 0:
+            raise BloomException("cache_size must be >= 0")
+        if cache_policy not in CACHE_POLICIES:
+            raise BloomException(f"cache_policy must be in {CACHE_POLICIES}")
+        if lock_stripes <= 0 or lock_stripes & (lock_stripes - 1):
+            raise BloomException("lock_stripes must be a power of two")
+        if thread_safe and cache_size:
+            raise BloomException("cache_size can't be used with thread_safe")
+        if self.hash_scheme not in HASH_SCHEMES:
+            raise BloomException(f"hash_scheme must be in {HASH_SCHEMES}")
+        if not 0 < sparse_saturation <= 1:
+            raise BloomException("sparse_saturation must be between 0 and 1")
+        if thread_safe and sparse:
+            raise BloomException("sparse can't be used with thread_safe")
+
+        # Mostly empty buffers store only their set bits until
+        # sparse_saturation of their bits are set, then turn dense
+        if sparse:
+            self.sparse_saturation = sparse_saturation
+
+        # Opt-in locking of writes from several threads. Each lock guards
+        # interleaved 64-byte ranges; checks read without locking, and
+        # bulk operations (merge, fold, load) must not run concurrently.
+        if thread_safe:
+            self.locks = StripedLock(lock_stripes)
+
+        # Optional hot-key cache of precomputed indexes
+        self.cache = index_cache(cache_size, cache_policy)
+
+        # Chunks modified since the last save or checkpoint
+        self._dirty = set()
+        self._resized = False
+
+        # Shared memory segments holding the buffers, see share()
+        self._shm = None
+        self._shm_owned = set()
+
+        # Background save started by save_async()
+        self._saving = None
+        # Background check of a file loaded with verify="lazy"
+        self.verification = None
 
         if self.path is not None and os.path.isfile(self.path):
             self.load(self.path)
@@ -40,16 +147,26 @@ class Bloom:
     def _init_bloom(self) -> None:
         """Initialize new Bloom filter properties"""
         self.capacity = int(self.capacity)
-        self.hashes = self._hashes(self.error_ratio)
-        bins = self.hashes * self.capacity / math.log(2)
-        self.bins = int(math.ceil(bins))
-        self.bytes = (self.bins // 8) + 1
-        self.bf = bytearray(b"\0" * self.bytes)
+        self.bins, self.hashes, self.bytes = self._dimensions(
+            self.capacity, self.error_ratio, self.power_of_two
+        )
+        if self.sparse_saturation is not None:
+            self.bf = SparseBits(self.bytes)
+        else:
+            self.bf = bytearray(b"\0" * self.bytes)
 
     def add(self, s: str) -> None:
         """Add element to filter"""
+        locks = self.locks
         for byte_index, bit_index in self._indexes(s):
-            self.bf[byte_index] |= 1 << bit_index
+            if locks is None:
+                self.bf[byte_index] |= 1 << bit_index
+            else:
+                with locks.lock(byte_index):
+                    self.bf[byte_index] |= 1 << bit_index
+            self._dirty.add(byte_index // delta.CHUNK_SIZE)
+        if self.sparse_saturation is not None:
+            self._densify()
 
     def check(self, s: str) -> bool:
         """Check if element is in filter"""
@@ -60,13 +177,171 @@ class Bloom:
 
     def check_then_add(self, s: str) -> bool:
         """Check if element was already in filter then add it"""
+        if self.locks is not None:
+            return self.check_then_add_many([s])[0]
         result = True
         for byte_index, bit_index in self._indexes(s):
             if not (self.bf[byte_index] >> bit_index) & 1:
                 result = False
                 self.bf[byte_index] |= 1 << bit_index
+                self._dirty.add(byte_index // delta.CHUNK_SIZE)
+        if self.sparse_saturation is not None:
+            self._densify()
         return result
 
+    def add_many(self, keys: Iterable) -> None:
+        """Add every element of an iterable or NumPy array to filter"""
+        if self.locks is not None:
+            self._add_locked([self._digests(s) for s in iter_keys(keys)])
+            return
+        bf = self.bf
+        dirty = self._dirty
+        for s in iter_keys(keys):
+            for byte_index, bit_index in self._indexes(s):
+                bf[byte_index] |= 1 << bit_index
+                dirty.add(byte_index // delta.CHUNK_SIZE)
+        if self.sparse_saturation is not None:
+            self._densify()
+
+    def check_many(self, keys: Iterable) -> List[bool]:
+        """Check every element of an iterable or NumPy array"""
+        bf = self.bf
+        return [
+            all(
+                (bf[byte_index] >> bit_index) & 1
+                for byte_index, bit_index in self._indexes(s)
+            )
+            for s in iter_keys(keys)
+        ]
+
+    def check_then_add_many(self, keys: Iterable) -> List[bool]:
+        """Check then add every element in order, returning the checks
+
+        A repeat of an element earlier in the same batch is reported as
+        present, exactly as with check_then_add() called for each element.
+        With NumPy, the whole batch is first checked against the filter at
+        once and only the elements it misses are added one by one.
+        """
+        digests = [self._digests(s) for s in iter_keys(keys)]
+        results = [True] * len(digests)
+
+        if np is not None and digests and self.hashes and not self._sparse():
+            indexes = self._bit_indexes(np.array(digests, dtype=np.int64))
+            view = np.frombuffer(self.bf, dtype=np.uint8)
+            present = ((view[indexes >> 3] >> (indexes & 7)) & 1).all(axis=1)
+            del view
+            pending = np.flatnonzero(~present)
+            indexes = indexes[pending]
+            byte_rows = indexes >> 3
+            self._dirty.update(
+                np.unique(byte_rows // delta.CHUNK_SIZE).tolist()
+            )
+            rows = zip(
+                pending.tolist(),
+                byte_rows.tolist(),
+                (1 << (indexes & 7)).tolist(),
+            )
+        else:
+            rows = self._bit_rows(digests)
+
+        # Add the remaining elements in order, so repeats within the batch
+        # see the bits set by their first occurrence. In thread-safe mode
+        # each element holds the locks of all its bits, so exactly one of
+        # several threads adding the same new element sees False.
+        bf = self.bf
+        locks = self.locks
+        for i, byte_row, mask_row in rows:
+            held = locks.hold(byte_row) if locks is not None else NO_LOCK
+            result = True
+            with held:
+                for byte_index, mask in zip(byte_row, mask_row):
+                    if not bf[byte_index] & mask:
+                        result = False
+                        bf[byte_index] |= mask
+            results[i] = result
+        if self.sparse_saturation is not None:
+            self._densify()
+        return results
+
+    def dedupe(
+        self,
+        items: Iterable,
+        batch_size: int = _ingest.BATCH_SIZE,
+        key: Optional[Callable[[Any], Any]] = None,
+    ) -> Iterator[Any]:
+        """Yield items not seen before, in order, adding them to the filter
+
+        Items are processed in batches of batch_size with
+        check_then_add_many(). key, if given, maps each item to the key
+        added to the filter, e.g. an ID field of a record.
+        """
+        for batch in _ingest.iter_batches(items, batch_size):
+            keys = batch if key is None else [key(item) for item in batch]
+            for item, seen in zip(batch, self.check_then_add_many(keys)):
+                if not seen:
+                    yield item
+
+    def merge(self, other: "Bloom") -> None:
+        """Merge (OR) a filter with the same type, bins and hashes into this"""
+        self._check_compatible(other)
+        for start in range(0, len(self.bf), MERGE_CHUNK_SIZE):
+            end = min(start + MERGE_CHUNK_SIZE, len(self.bf))
+            merged = int.from_bytes(self.bf[start:end], "little")
+            merged |= int.from_bytes(other.bf[start:end], "little")
+            self.bf[start:end] = merged.to_bytes(end - start, "little")
+        self._dirty.update(range(len(self.bf) // delta.CHUNK_SIZE + 1))
+        if self.sparse_saturation is not None:
+            self._densify()
+
+    def fold(self, times: int = 1) -> None:
+        """Halve a power-of-two filter by OR-ing its upper half into its lower
+
+        Indexes are digest & (bins - 1), so dropping the top bit of every
+        index maps each set bit onto the folded filter without rehashing.
+        Each fold doubles the bits per element; fold under-filled filters.
+        """
+        if not self.power_of_two:
+            raise BloomException("fold() requires power_of_two=True")
+        if self.bins >> times < 8:
+            raise BloomException(f"Can't fold {self.bins} bins {times} times")
+        if not isinstance(self.bf, (bytearray, SparseBits)):
+            raise BloomException("Can't fold a shared or external buffer")
+
+        for _ in range(times):
+            half = len(self.bf) // 2
+            folded = bytearray(half)
+            for start in range(0, half, MERGE_CHUNK_SIZE):
+                end = min(start + MERGE_CHUNK_SIZE, half)
+                merged = int.from_bytes(self.bf[start:end], "little")
+                merged |= int.from_bytes(
+                    self.bf[half + start : half + end], "little"
+                )
+                folded[start:end] = merged.to_bytes(end - start, "little")
+            self.bf = folded
+            self.bins //= 2
+            self.bytes = half
+
+        self._resized = True
+        self._clear_cache()
+        self._sparsify()
+
+    def ingest(
+        self,
+        source: Any,
+        chunk_size: int = _ingest.CHUNK_SIZE,
+        batch_size: int = _ingest.BATCH_SIZE,
+        progress: Optional[Callable[[_ingest.IngestStats], None]] = None,
+    ) -> _ingest.IngestStats:
+        """Add every key from a file, file object or iterable in batches
+
+        Files hold one key per line and may be gzip, bzip2 or xz
+        compressed. Lines are added as bytes. progress, if given, is called
+        with an IngestStats after every batch.
+        """
+        return _ingest.ingest(
+            self.add_many, source, chunk_size, batch_size, progress
+        )
+
     def save(self, path: str = None) -> None:
         """Save filter to a ZIP file containing metadata.json and bf.bin"""
         if path:
@@ -76,26 +351,85 @@ class Bloom:
                 "path must be specified at init or when calling save()"
             )
 
-        metadata = {
-            "version": __version__,
-            "program": __program__,
-            "type": self.type,
-            "bins": self.bins,
-            "hashes": self.hashes,
-        }
+        self._wait_saved()
+        persist.write_zip(
+            self.path, self._base_metadata(), self._named_buffers()
+        )
+        self._reset_delta()
+
+    def save_async(
+        self, path: str = None, executor: Optional[Executor] = None
+    ) -> Future:
+        """Save filter on a background thread, returning a Future
+
+        Buffers are copied on the calling thread, then compressed and
+        written atomically in the background while the filter stays
+        writable. Changes made after the copy are kept for the next save
+        or checkpoint. checkpoint(), save() and load() wait for a pending
+        background save first.
+        """
+        if path:
+            self.path = path
+        if self.path is None:
+            raise BloomException("path must be specified at init or save()")
+
+        self._wait_saved()
+        # Clear dirty chunks before copying so later writes stay dirty
+        self._dirty.clear()
+        self._resized = False
+        metadata = self._base_metadata()
+        buffers = [(name, bytes(buf)) for name, buf in self._named_buffers()]
+
+        executor = executor if executor is not None else persist.executor()
+        self._saving = executor.submit(
+            self._finish_save, self.path, metadata, buffers
+        )
+        return self._saving
 
-        with zipfile.ZipFile(self.path, "w", zipfile.ZIP_DEFLATED) as zf:
-            zf.writestr("metadata.json", json.dumps(metadata))
-            zf.writestr("bf.bin", self.bf)
+    def checkpoint(self) -> int:
+        """Append chunks changed since the last save to the delta log
 
-    def load(self, path: str) -> None:
-        """Load filter from a ZIP file containing metadata.json and bf.bin"""
+        Returns the number of bytes appended. The first checkpoint of a
+        filter that has never been saved writes the full base file.
+        """
+        if self.path is None:
+            raise BloomException("path must be specified at init or save()")
+
+        self._wait_saved()
+
+        if self._resized or not os.path.isfile(self.path):
+            self.save()
+            return os.path.getsize(self.path)
+
+        if not self._dirty:
+            return 0
+
+        written = delta.write_frame(
+            delta.delta_path(self.path),
+            {**self._delta_metadata(), "generation": self.generation},
+            self._dirty_chunks(),
+        )
+        self._dirty.clear()
+        return written
+
+    def compact(self) -> None:
+        """Fold the delta log into a freshly written base file"""
+        self.save()
+
+    def load(self, path: str, verify: Any = True) -> None:
+        """Load filter from a ZIP file containing metadata.json and bf.bin
+
+        verify=True checks chunk checksums while decompressing, False
+        skips them and "lazy" checks the file on a background thread,
+        leaving a Future in self.verification.
+        """
         if path is None:
             raise BloomException("path must be specified when calling load()")
 
         if not os.path.isfile(path):
             raise BloomException(f"'{path}' must be a file")
 
+        self._wait_saved()
         with zipfile.ZipFile(path, "r") as zf:
             try:
                 metadata = json.loads(zf.read("metadata.json"))
@@ -106,13 +440,139 @@ class Bloom:
                         f"Input '{path}' contains incorrect bloom type"
                     )
 
-                self.bins = metadata["bins"]
-                self.hashes = metadata["hashes"]
-                self.bf = bytearray(zf.read("bf.bin"))
-                self.bytes = self.bins // 8
+                self._load_metadata(metadata)
+                (self.bf,) = self._read_buffers(zf, verify)
             except KeyError as e:
                 raise BloomException(f"Invalid file format: missing {e}")
 
+        self._replay_delta(path, metadata)
+        self._sparsify()
+        self._clear_cache()
+        self._verify_lazily(path, verify)
+
+    def metadata(self) -> dict:
+        """Parameters needed to rebuild the filter around its buffer"""
+        return {
+            "version": __version__,
+            "program": __program__,
+            "type": self.type,
+            "bins": self.bins,
+            "hashes": self.hashes,
+            "power_of_two": self.power_of_two,
+            "hash_scheme": self.hash_scheme,
+        }
+
+    def share(self) -> "shared.BloomHandle":
+        """Move buffers into shared memory and return a handle to them
+
+        The handle pickles to segment names plus metadata, and its
+        attach() maps the same memory in another process without copying.
+        Once shared, the filter itself pickles as its handle.
+        """
+        if self._shm is None:
+            self._set_buffers([dense(buffer) for buffer in self._buffers()])
+            segments = []
+            views = []
+            for buffer in self._buffers():
+                segment = shared.create(buffer)
+                segments.append(segment)
+                views.append(segment.buf[: len(buffer)])
+            self._shm = segments
+            self._shm_owned = {segment.name for segment in segments}
+            self._set_buffers(views)
+            self._release_on_collect()
+        return self.handle()
+
+    def handle(self) -> "shared.BloomHandle":
+        """Handle to a filter in shared memory"""
+        if self._shm is None:
+            raise BloomException("Filter isn't in shared memory, call share()")
+        return shared.BloomHandle(
+            [segment.name for segment in self._shm],
+            [len(buffer) for buffer in self._buffers()],
+            self.metadata(),
+        )
+
+    def unshare(self) -> None:
+        """Copy buffers back into private memory and release shared memory
+
+        Segments are unlinked by the process that created them, so call
+        this there once every process has finished with them.
+        """
+        if self._shm is None:
+            return
+        self._set_buffers([bytearray(view) for view in self._buffers()])
+        self.detach()
+
+    def detach(self) -> None:
+        """Release shared memory without copying buffers back
+
+        Frees the mappings of a filter attached from a handle, e.g. in a
+        worker process, once it is no longer needed; segments created by
+        this process are also unlinked. Unless unshare() copied them
+        first, the buffers can't be used afterwards. Garbage collection
+        releases attached filters the same way, minus the unlinking.
+        """
+        if self._shm is None:
+            return
+        self._release_shm()
+        self._release_shm = None
+        for segment in self._shm:
+            if segment.name in self._shm_owned:
+                segment.unlink()
+        self._shm = None
+        self._shm_owned = set()
+
+    def to_buffer(self) -> memoryview:
+        """Zero-copy view of the filter's buffer, made dense if sparse"""
+        self.bf = dense(self.bf)
+        return memoryview(self.bf)
+
+    @classmethod
+    def from_buffer(cls, buffer: Any, metadata: dict) -> "Bloom":
+        """Create a filter over any writable buffer without copying it
+
+        metadata is a dict as returned by metadata(); buffer is as returned
+        by to_buffer(), e.g. a bytearray, mmap or shared memory view.
+        """
+        bloom_cls = cls._filter_class(metadata.get("type"))
+        bloom = bloom_cls.__new__(bloom_cls)
+        bloom._init_state()
+        bloom._load_metadata(metadata)
+        bloom._set_buffers(bloom._wrap_buffers(buffer))
+        return bloom
+
+    @classmethod
+    def from_plan(cls, plan: Any) -> "Bloom":
+        """Create the filter recommended by profusion.plan()"""
+        return cls._filter_class(plan.type)(**plan.params)
+
+    @classmethod
+    def attach(cls, handle: "shared.BloomHandle") -> "Bloom":
+        """Map a filter shared by another process via its handle"""
+        segments = [shared.attach(name) for name in handle.names]
+        views = [
+            segment.buf[:size] for segment, size in zip(segments, handle.sizes)
+        ]
+        buffer = views if len(views) > 1 else views[0]
+        bloom = cls.from_buffer(buffer, handle.metadata)
+        bloom._shm = segments
+        bloom._release_on_collect()
+        return bloom
+
+    def __reduce_ex__(self, protocol: int) -> Any:
+        if getattr(self, "_shm", None) is not None:
+            return shared.attach_handle, (self.handle(),)
+        return super().__reduce_ex__(protocol)
+
+    def __getstate__(self) -> dict:
+        # Background saves and checks belong to this process and their
+        # Futures can't be pickled
+        state = dict(self.__dict__)
+        state["_saving"] = None
+        state["verification"] = None
+        return state
+
     def __contains__(self, s: str) -> bool:
         return self.check(s)
 
@@ -122,26 +582,359 @@ class Bloom:
     def __str__(self) -> str:
         return f"Bloom filter with {self.bins} bits"
 
+    def cache_info(self) -> dict:
+        """Hit and miss counters of the hot-key cache, if enabled"""
+        return self.cache.info() if self.cache is not None else None
+
     def _indexes(self, s: str):
+        """Find bloom indexes for input string, from the cache if enabled"""
+        if self.cache is None:
+            return self._hash_indexes(s)
+        return self._cached_indexes(s)
+
+    def _cached_indexes(self, s: str) -> tuple:
+        """Look up indexes in the hot-key cache, hashing on a miss"""
+        try:
+            indexes = self.cache.get(s)
+        except TypeError:  # Unhashable keys bypass the cache
+            return tuple(self._hash_indexes(s))
+        if indexes is None:
+            indexes = tuple(self._hash_indexes(s))
+            self.cache.put(s, indexes)
+        return indexes
+
+    def _clear_cache(self) -> None:
+        """Drop cached indexes after bins or hashes change"""
+        if self.cache is not None:
+            self.cache.clear()
+
+    def _hash_indexes(self, s: str):
         """Find array of tuple bloom indexes for input string"""
         s = self._utf8(s)
+        if self.hash_scheme != HASH_SCHEME:
+            for digest in self._digests(s):
+                yield self._digest2index(digest)
+            return
+        if self.power_of_two:
+            mask = self.bins - 1
+            for i in range(self.hashes):
+                index = self._hash(s, seed=i) & mask
+                yield (index >> 3, index & 7)
+            return
+
         for i in range(self.hashes):
             digest = self._hash(s, seed=i)
             yield self._digest2index(digest)
 
+    def _bit_rows(self, digests: List[List[int]]) -> Iterator[tuple]:
+        """Yield (row, byte indexes, bit masks) per row of digests"""
+        dirty = self._dirty
+        for i, row in enumerate(digests):
+            indexes = self._row_indexes(row)
+            byte_row = [index >> 3 for index in indexes]
+            dirty.update(
+                byte_index // delta.CHUNK_SIZE for byte_index in byte_row
+            )
+            yield i, byte_row, [1 << (index & 7) for index in indexes]
+
+    def _add_locked(self, digests: List[List[int]]) -> None:
+        """Set the bits of rows of digests, taking each stripe lock once
+
+        Bits are grouped by stripe first, so a batch holds each lock once
+        rather than once per bit.
+        """
+        if not digests or not self.hashes:
+            return
+        locks = self.locks
+        if np is not None:
+            indexes = self._bit_indexes(np.array(digests, dtype=np.int64))
+            indexes = indexes.ravel()
+            byte_indexes = indexes >> 3
+            masks = (1 << (indexes & 7)).astype(np.uint8)
+            stripes = locks.stripe(byte_indexes)
+            order = np.argsort(stripes, kind="stable")
+            bounds = np.flatnonzero(np.diff(stripes[order])) + 1
+            view = np.frombuffer(self.bf, dtype=np.uint8)
+            for group in np.split(order, bounds):
+                with locks.lock(int(byte_indexes[group[0]])):
+                    np.bitwise_or.at(view, byte_indexes[group], masks[group])
+            del view
+            self._dirty.update(
+                np.unique(byte_indexes // delta.CHUNK_SIZE).tolist()
+            )
+            return
+
+        groups = {}
+        for row in digests:
+            for index in self._row_indexes(row):
+                groups.setdefault(locks.stripe(index >> 3), []).append(
+                    (index >> 3, 1 << (index & 7))
+                )
+        bf = self.bf
+        dirty = self._dirty
+        for stripe, bits in groups.items():
+            with locks.locks[stripe]:
+                for byte_index, mask in bits:
+                    bf[byte_index] |= mask
+            dirty.update(
+                byte_index // delta.CHUNK_SIZE for byte_index, _ in bits
+            )
+
+    def _bit_indexes(self, digests: Any) -> Any:
+        """Bit indexes of a NumPy array of digests, a column per hash"""
+        if self.power_of_two:
+            return digests & (self.bins - 1)
+        return digests % self.bins
+
+    def _row_indexes(self, row: List[int]) -> List[int]:
+        """Bit indexes of the digests of one element"""
+        if self.power_of_two:
+            mask = self.bins - 1
+            return [digest & mask for digest in row]
+        bins = self.bins
+        return [digest % bins for digest in row]
+
     def _digest2index(self, digest: int) -> Tuple[int, int]:
         """Convert a hash digest to an index tuple"""
+        if self.power_of_two:
+            index = digest & (self.bins - 1)
+            return (index >> 3, index & 7)
         index = digest % self.bins
         return (index // 8, index % 8)
 
+    def _init_state(self) -> None:
+        """Initialize state of a filter not built by __init__"""
+        self.path = None
+        self.cache = None
+        self._dirty = set()
+        self._resized = False
+        self._shm = None
+        self._shm_owned = set()
+        self._saving = None
+        self.verification = None
+
+    def _release_on_collect(self) -> None:
+        """Release shared memory views before closing their segments
+
+        Garbage collection may close a segment while a view of it is still
+        alive, which fails with BufferError. The finalizer keeps both
+        until the filter is collected and releases them in order; the
+        lists are the filter's own, so segments added by growth are
+        included.
+        """
+        self._release_shm = weakref.finalize(
+            self, shared.release, self._buffers(), self._shm
+        )
+
+    def _load_metadata(self, metadata: dict) -> None:
+        """Set parameters from metadata written by metadata()"""
+        self.type = metadata["type"]
+        self.bins = metadata["bins"]
+        self.hashes = metadata["hashes"]
+        self.power_of_two = metadata.get("power_of_two", False)
+        self.hash_scheme = metadata.get("hash_scheme", HASH_SCHEME)
+        if self.hash_scheme not in HASH_SCHEMES:
+            raise BloomException(f"Invalid hash scheme: {self.hash_scheme}")
+        self.bytes = self.bins // 8
+
+    @classmethod
+    def _filter_class(cls, bloom_type: str) -> type:
+        """Find this class or the subclass with a given type"""
+        classes = [cls]
+        while classes:
+            bloom_cls = classes.pop()
+            if bloom_cls.type == bloom_type:
+                return bloom_cls
+            classes.extend(bloom_cls.__subclasses__())
+        raise BloomException(f"Unknown bloom type '{bloom_type}'")
+
+    def _buffers(self) -> list:
+        """Buffers addressed by delta log chunks"""
+        return [self.bf]
+
+    def _set_buffers(self, buffers: list) -> None:
+        """Replace the buffers returned by _buffers()"""
+        (self.bf,) = buffers
+
+    def _wrap_buffers(self, buffer: Any) -> list:
+        """Byte views over the buffer passed to from_buffer()"""
+        return [memoryview(buffer).cast("B")]
+
+    def _buffer_names(self) -> List[str]:
+        """Names of the buffers in saved ZIP files"""
+        return ["bf.bin"]
+
+    def _named_buffers(self) -> List[Tuple[str, Any]]:
+        """Buffers with their names in saved ZIP files, dense if sparse"""
+        buffers = [dense(buffer) for buffer in self._buffers()]
+        return list(zip(self._buffer_names(), buffers))
+
+    def _read_buffers(self, zf: zipfile.ZipFile, verify: Any) -> list:
+        """Read the buffers named by _named_buffers() from a saved file"""
+        checksums = persist.read_checksums(zf) if verify is True else None
+        return [
+            persist.read_buffer(zf, name, checksums)
+            for name in self._buffer_names()
+        ]
+
+    def _verify_lazily(self, path: str, verify: Any) -> None:
+        """Start checking a file in the background for verify="lazy" loads"""
+        self.verification = None
+        if verify == "lazy":
+            self.verification = persist.executor().submit(persist.verify, path)
+
+    def _finish_save(
+        self, path: str, metadata: dict, buffers: List[Tuple[str, Any]]
+    ) -> None:
+        """Write a copy taken by save_async() (background thread)"""
+        try:
+            persist.write_zip(path, metadata, buffers)
+        except BaseException:
+            # Chunks dirtied before the copy are lost; force a full save
+            self._resized = True
+            raise
+        log = delta.delta_path(path)
+        if os.path.isfile(log):
+            os.remove(log)
+
+    def _wait_saved(self) -> None:
+        """Wait for a background save, ignoring its errors"""
+        saving = getattr(self, "_saving", None)
+        if saving is not None:
+            self._saving = None
+            wait([saving])
+
+    def _dirty_chunks(self):
+        """Yield (buffer, offset, data) for every dirty chunk"""
+        for chunk in sorted(self._dirty):
+            offset = chunk * delta.CHUNK_SIZE
+            yield 0, offset, bytes(self.bf[offset : offset + delta.CHUNK_SIZE])
+
+    def _delta_metadata(self) -> dict:
+        """Metadata recorded with each delta log frame"""
+        return {"type": self.type}
+
+    def _apply_delta_metadata(self, metadata: dict) -> None:
+        """Restore state recorded in a delta log frame"""
+        if metadata.get("type") != self.type:
+            raise BloomException("Delta log contains incorrect bloom type")
+
+    def _base_metadata(self) -> dict:
+        """Metadata of a new base file, starting a new generation"""
+        self.generation = uuid.uuid4().hex
+        return {**self.metadata(), "generation": self.generation}
+
+    def _replay_delta(self, path: str, metadata: dict) -> None:
+        """Apply the delta log next to path, if any, to the loaded buffers
+
+        metadata is the base file's. Frames of another generation are
+        left by a crash between writing a base file and removing its
+        superseded log, and would overwrite newer chunks.
+        """
+        self.generation = metadata.get("generation")
+        self._dirty = set()
+        self._resized = False
+        log = delta.delta_path(path)
+        if not os.path.isfile(log):
+            return
+
+        for frame_metadata, chunks in delta.read_frames(log):
+            if frame_metadata.get("generation") != self.generation:
+                continue
+            self._apply_delta_metadata(frame_metadata)
+            buffers = self._buffers()
+            for buffer, offset, data in chunks:
+                buffers[buffer][offset : offset + len(data)] = data
+
+    def _reset_delta(self) -> None:
+        """Clear dirty chunks and drop the delta log superseded by a save"""
+        self._dirty = set()
+        self._resized = False
+        log = delta.delta_path(self.path)
+        if os.path.isfile(log):
+            os.remove(log)
+
+    def _check_compatible(self, other: "Bloom") -> None:
+        """Raise unless other has the same type, bins and hashes"""
+        if (other.type, other.bins, other.hashes) != (
+            self.type,
+            self.bins,
+            self.hashes,
+        ):
+            raise BloomException(
+                "Filters must have the same type, bins and hashes"
+            )
+        if other.hash_scheme != self.hash_scheme:
+            raise BloomException("Filters must have the same hash scheme")
+
     def _saturation(self) -> float:
         """Calculate the proportion of bits in buffer equal to 1"""
-        return sum(bin(byte).count("1") for byte in self.bf) / float(self.bins)
+        return popcount(self.bf) / float(self.bins)
+
+    def _sparse(self) -> bool:
+        """Check if any buffer is stored as SparseBits"""
+        return any(isinstance(b, SparseBits) for b in self._buffers())
+
+    def _densify(self) -> None:
+        """Make the buffer dense once past sparse_saturation"""
+        bf = self.bf
+        if (
+            isinstance(bf, SparseBits)
+            and bf.saturation() > self.sparse_saturation
+        ):
+            self.bf = bf.to_bytearray()
+
+    def _sparsify(self) -> None:
+        """Store private buffers at most sparse_saturation full sparsely"""
+        if self.sparse_saturation is None or self._shm is not None:
+            return
+        self._set_buffers(
+            [
+                (
+                    SparseBits.from_buffer(buffer)
+                    if isinstance(buffer, bytearray)
+                    and popcount(buffer)
+                    <= self.sparse_saturation * len(buffer) * 8
+                    else buffer
+                )
+                for buffer in self._buffers()
+            ]
+        )
 
     @staticmethod
-    def _hash(s: str, seed: int) -> int:
+    def _hash(s: bytes, seed: int) -> int:
         """Hash function wrapper"""
-        return mmh3.hash(s, seed=seed)
+        if type(s) is bytes:
+            return mmh3.hash(s, seed=seed)
+        return mmh3.hash_from_buffer(s, seed=seed)
+
+    def _digests(self, s: Any) -> List[int]:
+        """Hash digests of an element for every hash function"""
+        s = self._utf8(s)
+        if self.hash_scheme != HASH_SCHEME:
+            # Reduced to bins, so batch operations can use int64 arrays
+            bins = self.bins
+            return [sha256_hash(s, i) % bins for i in range(self.hashes)]
+        hash = mmh3.hash if type(s) is bytes else mmh3.hash_from_buffer
+        return [hash(s, i) for i in range(self.hashes)]
+
+    @classmethod
+    def _dimensions(
+        cls, capacity: int, error_ratio: float, power_of_two: bool = False
+    ) -> Tuple[int, int, int]:
+        """Calculate bins, hashes and buffer bytes of a new filter"""
+        hashes = cls._hashes(error_ratio)
+        bins = hashes * capacity / math.log(2)
+        if power_of_two:
+            bins = cls._power_of_two(bins)
+            return bins, hashes, bins // 8
+        bins = int(math.ceil(bins))
+        return bins, hashes, (bins // 8) + 1
+
+    @staticmethod
+    def _power_of_two(bins: float) -> int:
+        """Round bins up to a power of two, at least one byte"""
+        return max(8, 1 << (int(math.ceil(bins)) - 1).bit_length())
 
     @staticmethod
     def _hashes(error_ratio: float) -> int:
@@ -149,6 +942,6 @@ class Bloom:
         return int(math.ceil(-math.log(error_ratio) / math.log(2)))
 
     @staticmethod
-    def _utf8(s: str) -> bytes:
-        """Convert strings to utf-8 encoding"""
-        return s.encode("utf-8") if isinstance(s, str) else s
+    def _utf8(s: Any) -> bytes:
+        """Convert strings to utf-8 encoding and integers to 8 bytes"""
+        return to_key(s)
@@ -0,0 +1,141 @@
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Any, Hashable, Optional
+
+
+CACHE_POLICIES = ("lru", "clock")
+
+
+class IndexCache(ABC):
+    """Bounded cache of key -> precomputed filter indexes"""
+
+    policy = ""
+
+    def __init__(self, size: int) -> None:
+        if size <= 0:
+            raise ValueError("cache size must be > 0")
+        self.size = size
+        self.hits = 0
+        self.misses = 0
+
+    @abstractmethod
+    def get(self, key: Hashable) -> Optional[Any]:
+        """Cached value of a key, or None, counting the hit or miss"""
+
+    @abstractmethod
+    def put(self, key: Hashable, value: Any) -> None:
+        """Cache a value, evicting another key if full"""
+
+    @abstractmethod
+    def clear(self) -> None:
+        """Remove every cached key"""
+
+    @abstractmethod
+    def __len__(self) -> int:
+        """Number of cached keys"""
+
+    def info(self) -> dict:
+        """Cache statistics"""
+        return {
+            "policy": self.policy,
+            "size": self.size,
+            "length": len(self),
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+class LRUCache(IndexCache):
+    """Least-recently-used eviction"""
+
+    policy = "lru"
+
+    def __init__(self, size: int) -> None:
+        super().__init__(size)
+        self._data: OrderedDict = OrderedDict()
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        value = self._data.get(key)
+        if value is None:
+            self.misses += 1
+            return None
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, key: Hashable, value: Any) -> None:
+        self._data[key] = value
+        if len(self._data) > self.size:
+            self._data.popitem(last=False)
+
+    def clear(self) -> None:
+        self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class ClockCache(IndexCache):
+    """CLOCK (second chance) eviction, cheaper than LRU on hits"""
+
+    policy = "clock"
+
+    def __init__(self, size: int) -> None:
+        super().__init__(size)
+        self.clear()
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        slot = self._slots.get(key)
+        if slot is None:
+            self.misses += 1
+            return None
+        self._referenced[slot] = 1
+        self.hits += 1
+        return self._values[slot]
+
+    def put(self, key: Hashable, value: Any) -> None:
+        slot = self._slots.get(key)
+        if slot is None:
+            if len(self._keys) < self.size:
+                slot = len(self._keys)
+                self._keys.append(key)
+                self._values.append(value)
+            else:
+                slot = self._evict()
+                self._keys[slot] = key
+                self._values[slot] = value
+            self._slots[key] = slot
+        else:
+            self._values[slot] = value
+        self._referenced[slot] = 1
+
+    def clear(self) -> None:
+        self._slots: dict = {}
+        self._keys: list = []
+        self._values: list = []
+        self._referenced = bytearray(self.size)
+        self._hand = 0
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def _evict(self) -> int:
+        """Advance the hand to the first unreferenced slot and free it"""
+        while self._referenced[self._hand]:
+            self._referenced[self._hand] = 0
+            self._hand = (self._hand + 1) % self.size
+        slot = self._hand
+        self._hand = (self._hand + 1) % self.size
+        del self._slots[self._keys[slot]]
+        return slot
+
+
+def index_cache(size: int, policy: str = "lru") -> Optional[IndexCache]:
+    """Create an index cache, or None if size is 0"""
+    if not size:
+        return None
+    if policy == "lru":
+        return LRUCache(size)
+    if policy == "clock":
+        return ClockCache(size)
+    raise ValueError(f"cache policy must be one of {CACHE_POLICIES}")
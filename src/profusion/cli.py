@@ -0,0 +1,409 @@
+import argparse
+import json
+import math
+from multiprocessing import Pool
+import os
+import sys
+import tempfile
+from typing import Any, List, Optional, Tuple
+
+from . import __version__, __program__
+from . import (
+    Bloom,
+    BloomException,
+    CountingBloom,
+    ScalableBloom,
+    MMCountingBloom,
+    PartitionedBloom,
+)
+from .bloom import CAPACITY, ERROR_RATIO
+from .counting_bloom import BIN_SIZE
+from .ingest import BATCH_SIZE, CHUNK_SIZE, IngestStats, iter_lines
+from .persist import inspect, read_metadata
+from .scalable_bloom import (
+    ERROR_DECAY_RATE,
+    GROWTH_FACTOR,
+    INITIAL_SIZE,
+    MAX_ERROR,
+)
+
+
+MMCB_SUFFIX = ".mmcb"
+STDIN = "-"
+
+# Command line names of the filter types
+TYPES = {
+    "bloom": "bloom",
+    "counting": "counting bloom",
+    "scalable": "scalable bloom",
+    "partitioned": "partitioned bloom",
+    "mmcounting": "mmapped counting bloom",
+}
+CLASSES = {
+    "bloom": Bloom,
+    "counting bloom": CountingBloom,
+    "scalable bloom": ScalableBloom,
+    "partitioned bloom": PartitionedBloom,
+}
+COUNTING_TYPES = ("counting bloom", "mmapped counting bloom")
+
+# Throwaway parameters for instances that are immediately loaded from disk
+EMPTY = {"capacity": 1, "error_ratio": 0.5}
+
+
+def new_filter(bloom_type: str, params: dict) -> Bloom:
+    """Create an empty in-memory filter"""
+    if bloom_type == "scalable bloom":
+        return ScalableBloom(**{**EMPTY, **params})
+    return CLASSES[bloom_type](**params)
+
+
+def filter_params(args: argparse.Namespace) -> Tuple[str, dict]:
+    """Filter type and constructor parameters from build arguments"""
+    bloom_type = TYPES[args.type]
+    if bloom_type == "scalable bloom":
+        params = {
+            "max_error": args.max_error,
+            "error_decay_rate": args.error_decay_rate,
+            "initial_size": args.initial_size,
+            "growth_factor": args.growth_factor,
+        }
+    else:
+        params = {"capacity": args.capacity, "error_ratio": args.error_ratio}
+        if bloom_type in COUNTING_TYPES:
+            params["bin_size"] = args.bin_size
+    return bloom_type, params
+
+
+def open_mmcb(path: str, params: dict, create: bool) -> MMCountingBloom:
+    """Open a memory-mapped filter by path
+
+    MMCountingBloom wipes files whose size doesn't match its parameters,
+    so unless create is set the file must already exist with that size.
+    """
+    if not path.endswith(MMCB_SUFFIX):
+        raise BloomException(f"'{path}' must end with {MMCB_SUFFIX}")
+
+    if not create:
+        if not os.path.isfile(path):
+            raise BloomException(f"'{path}' must be a file")
+        bins, _ = MMCountingBloom._parameters(
+            params["capacity"], params["error_ratio"]
+        )
+        if os.path.getsize(path) != bins:
+            raise BloomException(
+                f"'{path}' doesn't match --capacity and --error-ratio"
+            )
+
+    directory, name = os.path.split(path[: -len(MMCB_SUFFIX)])
+    return MMCountingBloom(name, dir=directory or ".", **params)
+
+
+def open_filter(path: str, args: argparse.Namespace) -> Bloom:
+    """Open a saved filter, an MMCountingBloom snapshot or a .mmcb file"""
+    if path.endswith(MMCB_SUFFIX):
+        return open_mmcb(path, mmcb_params(args), create=False)
+
+    metadata = read_metadata(path)
+    if metadata["type"] == TYPES["mmcounting"]:
+        restored = os.path.join(args.tmp_dir, f"{len(args.opened)}.mmcb")
+        bloom = open_mmcb(restored, mmcb_params(metadata), create=True)
+        bloom.restore(path)
+    else:
+        bloom = new_filter(metadata["type"], EMPTY)
+        bloom.load(path)
+
+    args.opened.append(bloom)
+    return bloom
+
+
+def mmcb_params(source: Any) -> dict:
+    """MMCountingBloom parameters from arguments or snapshot metadata"""
+    get = source.get if isinstance(source, dict) else source.__dict__.get
+    return {
+        "capacity": get("capacity", CAPACITY),
+        "error_ratio": get("error_ratio", ERROR_RATIO),
+        "bin_size": get("bin_size", BIN_SIZE),
+    }
+
+
+def filter_stats(bloom: Bloom) -> dict:
+    """Size, saturation and estimated false positive rate of a filter"""
+    if isinstance(bloom, ScalableBloom):
+        saturations = [bloom._saturation(i) for i in range(bloom.blooms)]
+        miss = 1.0
+        for saturation, hashes in zip(saturations, bloom.hashes):
+            miss *= 1 - saturation**hashes
+        return {
+            "type": bloom.type,
+            "blooms": bloom.blooms,
+            "elements": bloom.elements,
+            "threshold": bloom.threshold,
+            "bins": sum(bloom.bins_list),
+            "hashes": bloom.hashes,
+            "bytes": sum(len(bf) for bf in bloom.bfs),
+            "saturation": bloom._saturation(),
+            "estimated_fpr": 1 - miss,
+        }
+
+    saturation = bloom._saturation()
+    stats = {
+        "type": bloom.type,
+        "bins": bloom.bins,
+        "hashes": bloom.hashes,
+        "bytes": len(bloom.bf),
+        "saturation": saturation,
+        "estimated_fpr": saturation**bloom.hashes,
+        "estimated_elements": (
+            int(-bloom.bins / bloom.hashes * math.log(1 - saturation))
+            if saturation < 1
+            else None
+        ),
+    }
+    if bloom.type in COUNTING_TYPES:
+        stats["bin_size"] = bloom.bin_size
+    return stats
+
+
+def _progress(path: str, verbose: bool) -> Optional[Any]:
+    """Progress callback printing ingest rate to stderr"""
+    if not verbose:
+        return None
+
+    def report(stats: IngestStats) -> None:
+        print(
+            f"{path}: {stats.keys} keys, {stats.rate:.0f} keys/s",
+            file=sys.stderr,
+        )
+
+    return report
+
+
+def _source(path: str) -> Any:
+    """Input path or stdin"""
+    return sys.stdin.buffer if path == STDIN else path
+
+
+def _build_part(job: Tuple[str, dict, List[str], str, int]) -> str:
+    """Build a partial filter from some inputs in a worker process"""
+    bloom_type, params, inputs, output, chunk_size = job
+    bloom = new_filter(bloom_type, params)
+    for path in inputs:
+        bloom.ingest(path, chunk_size)
+    bloom.save(output)
+    return output
+
+
+def _ingest_mmcb(job: Tuple[str, dict, List[str], int]) -> int:
+    """Add some inputs to a shared .mmcb filter in a worker process"""
+    path, params, inputs, chunk_size = job
+    bloom = open_mmcb(path, params, create=False)
+    return sum(bloom.ingest(p, chunk_size).keys for p in inputs)
+
+
+def cmd_build(args: argparse.Namespace) -> None:
+    inputs = args.inputs or [STDIN]
+    bloom_type, params = filter_params(args)
+    jobs = max(1, min(args.jobs, len(inputs)))
+    if jobs > 1 and STDIN in inputs:
+        raise BloomException("stdin can't be read by parallel jobs")
+    groups = [inputs[i::jobs] for i in range(jobs)]
+
+    if bloom_type == TYPES["mmcounting"]:
+        bloom = open_mmcb(args.output, params, create=True)
+        if jobs > 1:
+            work = [(args.output, params, g, args.chunk_size) for g in groups]
+            with Pool(jobs) as pool:
+                pool.map(_ingest_mmcb, work)
+        else:
+            for path in inputs:
+                progress = _progress(path, args.verbose)
+                bloom.ingest(_source(path), args.chunk_size, progress=progress)
+        return
+
+    if jobs > 1:
+        if bloom_type == TYPES["scalable"]:
+            raise BloomException("scalable filters can't be built in parallel")
+        work = [
+            (
+                bloom_type,
+                params,
+                group,
+                os.path.join(args.tmp_dir, f"part_{i}.zip"),
+                args.chunk_size,
+            )
+            for i, group in enumerate(groups)
+        ]
+        with Pool(jobs) as pool:
+            parts = pool.map(_build_part, work)
+        bloom = open_filter(parts[0], args)
+        for part in parts[1:]:
+            bloom.merge(open_filter(part, args))
+    else:
+        bloom = new_filter(bloom_type, params)
+        for path in inputs:
+            progress = _progress(path, args.verbose)
+            bloom.ingest(_source(path), args.chunk_size, progress=progress)
+
+    bloom.save(args.output)
+
+
+def cmd_query(args: argparse.Namespace) -> None:
+    bloom = open_filter(args.filter, args)
+    counting = bloom.type in COUNTING_TYPES
+    out = sys.stdout.buffer
+    for lines in iter_lines(sys.stdin.buffer, args.chunk_size):
+        for start in range(0, len(lines), args.batch_size):
+            batch = lines[start : start + args.batch_size]
+            if counting:
+                found = bloom.check_many(batch, args.trigger)
+            else:
+                found = bloom.check_many(batch)
+            selected = [
+                line for line, hit in zip(batch, found) if hit != args.invert
+            ]
+            if selected:
+                out.write(b"\n".join(selected) + b"\n")
+    out.flush()
+
+
+def cmd_merge(args: argparse.Namespace) -> None:
+    if args.output.endswith(MMCB_SUFFIX):
+        bloom = open_mmcb(args.output, mmcb_params(args), create=True)
+        for path in args.inputs:
+            bloom.merge(open_filter(path, args))
+        return
+
+    bloom = open_filter(args.inputs[0], args)
+    for path in args.inputs[1:]:
+        bloom.merge(open_filter(path, args))
+
+    if isinstance(bloom, MMCountingBloom):
+        bloom.snapshot(args.output)
+    else:
+        bloom.save(args.output)
+
+
+def cmd_stats(args: argparse.Namespace) -> None:
+    for path in args.filters:
+        stats = {"path": path}
+        if not path.endswith(MMCB_SUFFIX):
+            stats["metadata"] = inspect(path, verify_checksums=args.verify)
+        if not args.metadata_only:
+            stats.update(filter_stats(open_filter(path, args)))
+        print(json.dumps(stats))
+
+
+def _add_mmcb_arguments(parser: argparse.ArgumentParser) -> None:
+    group = parser.add_argument_group(
+        f"{MMCB_SUFFIX} files",
+        "parameters the memory-mapped filter was created with",
+    )
+    group.add_argument("--capacity", type=float, default=CAPACITY)
+    group.add_argument("--error-ratio", type=float, default=ERROR_RATIO)
+    group.add_argument("--bin-size", type=int, default=BIN_SIZE)
+
+
+def parser() -> argparse.ArgumentParser:
+    """Command line argument parser"""
+    parser = argparse.ArgumentParser(
+        prog=__program__,
+        description="Build, query, merge and inspect Bloom filters",
+    )
+    parser.add_argument(
+        "--version", action="version", version=f"%(prog)s {__version__}"
+    )
+    parser.add_argument(
+        "--chunk-size",
+        type=int,
+        default=CHUNK_SIZE,
+        help="bytes read from inputs at a time",
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    build = commands.add_parser(
+        "build", help="build a filter from newline-delimited keys"
+    )
+    build.add_argument(
+        "output", help=f"filter file, or {MMCB_SUFFIX} for mmcounting"
+    )
+    build.add_argument(
+        "inputs", nargs="*", help="key files (may be compressed), - for stdin"
+    )
+    build.add_argument("--type", choices=TYPES, default="bloom")
+    build.add_argument("--capacity", type=float, default=CAPACITY)
+    build.add_argument("--error-ratio", type=float, default=ERROR_RATIO)
+    build.add_argument("--bin-size", type=int, default=BIN_SIZE)
+    build.add_argument("--max-error", type=float, default=MAX_ERROR)
+    build.add_argument(
+        "--error-decay-rate", type=float, default=ERROR_DECAY_RATE
+    )
+    build.add_argument("--initial-size", type=int, default=INITIAL_SIZE)
+    build.add_argument("--growth-factor", type=float, default=GROWTH_FACTOR)
+    build.add_argument(
+        "-j", "--jobs", type=int, default=1, help="parallel build processes"
+    )
+    build.add_argument("-v", "--verbose", action="store_true")
+    build.set_defaults(func=cmd_build)
+
+    query = commands.add_parser(
+        "query", help="print stdin lines found in a filter"
+    )
+    query.add_argument("filter")
+    query.add_argument(
+        "-v",
+        "--invert",
+        action="store_true",
+        help="print lines not found in the filter",
+    )
+    query.add_argument(
+        "--trigger", type=int, default=1, help="minimum count to match"
+    )
+    query.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    _add_mmcb_arguments(query)
+    query.set_defaults(func=cmd_query)
+
+    merge = commands.add_parser(
+        "merge", help="merge filters with the same parameters"
+    )
+    merge.add_argument("output")
+    merge.add_argument("inputs", nargs="+")
+    _add_mmcb_arguments(merge)
+    merge.set_defaults(func=cmd_merge)
+
+    stats = commands.add_parser(
+        "stats",
+        aliases=["inspect"],
+        help="print metadata, saturation and estimated false positive rate",
+    )
+    stats.add_argument("filters", nargs="+")
+    stats.add_argument(
+        "-m",
+        "--metadata-only",
+        action="store_true",
+        help="only read metadata, without loading filters",
+    )
+    stats.add_argument(
+        "--verify",
+        action="store_true",
+        help="check chunk checksums, failing on files without them",
+    )
+    _add_mmcb_arguments(stats)
+    stats.set_defaults(func=cmd_stats)
+
+    return parser
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = parser().parse_args(argv)
+    args.opened = []
+    try:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            args.tmp_dir = tmp_dir
+            args.func(args)
+            # Close memory-mapped filters before their directory goes away
+            del args.opened[:]
+    except (BloomException, OSError) as e:
+        print(f"{__program__}: error: {e}", file=sys.stderr)
+        return 1
+    return 0
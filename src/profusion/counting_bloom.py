@@ -1,10 +1,14 @@
 import json
 import math
-from typing import Any
+from typing import Any, Iterable, List, Optional
 import zipfile
 
 from . import __version__, __program__
 from . import Bloom, BloomException
+from . import delta
+from . import persist
+from .bloom import HASH_SCHEME, MERGE_CHUNK_SIZE, NO_LOCK
+from .keys import iter_keys, np
 
 
 BIN_SIZE = 255
@@ -12,9 +16,68 @@ CAPACITY = 1e6
 ERROR_RATIO = 1e-15
 
 
+def saturating_add(a: Any, b: Any, bin_bytes: int, bin_size: int) -> bytes:
+    """Add two buffers of big-endian counters, capping each at bin_size"""
+    if np is not None and bin_bytes in (1, 2, 4, 8):
+        dtype = f">u{bin_bytes}"
+        x = np.frombuffer(a, dtype).astype(np.uint64)
+        y = np.frombuffer(b, dtype).astype(np.uint64)
+        # Counters never exceed bin_size, so bin_size - y can't underflow
+        total = np.minimum(x, np.uint64(bin_size) - y) + y
+        return total.astype(dtype).tobytes()
+
+    out = bytearray(a)
+    for start in range(0, len(b), bin_bytes):
+        end = start + bin_bytes
+        value = int.from_bytes(b[start:end], "big")
+        if value:
+            value = min(value + int.from_bytes(a[start:end], "big"), bin_size)
+            out[start:end] = value.to_bytes(bin_bytes, "big")
+    return bytes(out)
+
+
+def threshold_bits(counts: Any, bin_bytes: int, trigger: int) -> bytes:
+    """Pack big-endian counters into bits set where a counter >= trigger
+
+    Bit i of byte j stands for counter 8 * j + i, as in a Bloom buffer.
+    """
+    if np is not None and bin_bytes in (1, 2, 4, 8):
+        values = np.frombuffer(counts, f">u{bin_bytes}")
+        return np.packbits(values >= trigger, bitorder="little").tobytes()
+
+    bins = len(counts) // bin_bytes
+    out = bytearray((bins + 7) // 8)
+    for i in range(bins):
+        start = i * bin_bytes
+        if int.from_bytes(counts[start : start + bin_bytes], "big") >= trigger:
+            out[i >> 3] |= 1 << (i & 7)
+    return bytes(out)
+
+
+def threshold_bloom(
+    chunks: Iterable[Any], bin_bytes: int, trigger: int, metadata: dict
+) -> Bloom:
+    """Bloom filter with the bits of counters >= trigger set
+
+    chunks yields consecutive runs of counters, each a multiple of 8
+    counters long but the last; metadata is as for Bloom.from_buffer().
+    """
+    bins = metadata["bins"]
+    size = bins // 8 if metadata["power_of_two"] else (bins // 8) + 1
+    buffer = bytearray(size)
+    offset = 0
+    for chunk in chunks:
+        bits = threshold_bits(chunk, bin_bytes, trigger)
+        buffer[offset : offset + len(bits)] = bits
+        offset += len(bits)
+    return Bloom.from_buffer(buffer, metadata)
+
+
 class CountingBloom(Bloom):
     """Counting Bloom filter implementation"""
 
+    type = "counting bloom"
+
     def __init__(self, **kwargs: Any) -> None:
         super().__init__(**kwargs)
         self.type = "counting bloom"
@@ -25,6 +88,10 @@ class CountingBloom(Bloom):
 
         if self.bin_size <= 0:
             raise BloomException("bin_size must be > 0")
+        if self.hash_scheme != HASH_SCHEME:
+            raise BloomException(f"hash_scheme must be {HASH_SCHEME}")
+        if self.sparse_saturation is not None:
+            raise BloomException("sparse isn't supported by counting bloom")
 
         if self.path is not None and self.path != "":
             self.load(self.path)
@@ -36,13 +103,20 @@ class CountingBloom(Bloom):
         self.capacity = int(self.capacity)
         self.hashes = self._hashes(self.error_ratio)
         bins = self.hashes * self.capacity / math.log(2)
-        self.bins = int(math.ceil(bins))
+        if self.power_of_two:
+            self.bins = self._power_of_two(bins)
+        else:
+            self.bins = int(math.ceil(bins))
         self.bin_bytes = len(self._int2bytes(self.bin_size))
         self.bytes = self.bin_bytes * self.bins
         self.bf = bytearray(b"\0" * self.bytes)
 
     def add(self, s: str, amount: int = 1) -> bool:
         """Add amount to element"""
+        if self.locks is not None:
+            indexes = list(self._indexes(s))
+            with self._hold(indexes):
+                return all([self._increment_bin(i, amount) for i in indexes])
         result = True
         for index in self._indexes(s):
             if not self._increment_bin(index, amount):
@@ -50,10 +124,47 @@ class CountingBloom(Bloom):
 
         return result
 
+    def add_many(self, keys: Iterable, amount: int = 1) -> List[bool]:
+        """Add amount to every element of an iterable or NumPy array"""
+        return [self.add(s, amount) for s in iter_keys(keys)]
+
+    def check_then_add_many(
+        self, keys: Iterable, amount: int = 1
+    ) -> List[bool]:
+        """Check if every element has a count then add amount to it"""
+        results = []
+        for s in iter_keys(keys):
+            indexes = list(self._indexes(s))
+            with self._hold(indexes):
+                results.append(min(self._bin(index) for index in indexes) > 0)
+                for index in indexes:
+                    self._increment_bin(index, amount)
+        return results
+
+    def _saturation(self) -> float:
+        """Calculate the proportion of bins with a non-zero count"""
+        if self.bin_bytes == 1:
+            view = memoryview(self.bf)
+            zeros = sum(
+                bytes(view[start : start + MERGE_CHUNK_SIZE]).count(0)
+                for start in range(0, self.bytes, MERGE_CHUNK_SIZE)
+            )
+            return (self.bins - zeros) / float(self.bins)
+        used = sum(
+            1
+            for start in range(0, self.bytes, self.bin_bytes)
+            if any(self.bf[start : start + self.bin_bytes])
+        )
+        return used / float(self.bins)
+
     def value(self, s: str) -> int:
         """Get value of element"""
         return min(self._bin(index) for index in self._indexes(s))
 
+    def value_many(self, keys: Iterable) -> List[int]:
+        """Get value of every element of an iterable or NumPy array"""
+        return [self.value(s) for s in iter_keys(keys)]
+
     def check(self, s: str, trigger: int = -1) -> bool:
         """Check if value of element is at least trigger"""
         if not 0 <= trigger <= self.bin_size:
@@ -62,6 +173,87 @@ class CountingBloom(Bloom):
             trigger = trigger
         return self.value(s) >= trigger
 
+    def check_many(self, keys: Iterable, trigger: int = -1) -> List[bool]:
+        """Check if value of every element is at least trigger"""
+        if not 0 <= trigger <= self.bin_size:
+            trigger = self.bin_size
+        return [value >= trigger for value in self.value_many(keys)]
+
+    def to_bloom(self, trigger: int = 1, path: Optional[str] = None) -> Bloom:
+        """Bloom filter of the elements with a value of at least trigger
+
+        The Bloom filter has the same bins and hashes, with a bit set for
+        every counter >= trigger, so its check(s) is check(s, trigger).
+        Counters are compared and packed one chunk at a time. With a path,
+        the Bloom filter is also saved there.
+        """
+        if not 0 <= trigger <= self.bin_size:
+            trigger = self.bin_size
+        # MERGE_CHUNK_SIZE bins per chunk, a multiple of 8
+        step = MERGE_CHUNK_SIZE * self.bin_bytes
+        metadata = {
+            "type": Bloom.type,
+            "bins": self.bins,
+            "hashes": self.hashes,
+            "power_of_two": self.power_of_two,
+        }
+        with memoryview(self.bf) as view:
+            chunks = (
+                view[start : start + step]
+                for start in range(0, self.bytes, step)
+            )
+            bloom = threshold_bloom(chunks, self.bin_bytes, trigger, metadata)
+        bloom.capacity = self.capacity
+        bloom.error_ratio = self.error_ratio
+        if path is not None:
+            bloom.save(path)
+        return bloom
+
+    def merge(self, other: "CountingBloom") -> None:
+        """Add the counts of a filter with the same bins and hashes"""
+        self._check_compatible(other)
+        if other.bin_bytes != self.bin_bytes:
+            raise BloomException("Filters must have the same bin_bytes")
+
+        step = MERGE_CHUNK_SIZE - MERGE_CHUNK_SIZE % self.bin_bytes
+        for start in range(0, self.bytes, step):
+            end = start + step
+            self.bf[start:end] = saturating_add(
+                self.bf[start:end],
+                other.bf[start:end],
+                self.bin_bytes,
+                self.bin_size,
+            )
+        self._dirty.update(range(self.bytes // delta.CHUNK_SIZE + 1))
+
+    def fold(self, times: int = 1) -> None:
+        """Halve a power-of-two filter by adding its upper half to its lower"""
+        if not self.power_of_two:
+            raise BloomException("fold() requires power_of_two=True")
+        if self.bins >> times < 8:
+            raise BloomException(f"Can't fold {self.bins} bins {times} times")
+        if not isinstance(self.bf, bytearray):
+            raise BloomException("Can't fold a shared or external buffer")
+
+        for _ in range(times):
+            half = self.bytes // 2
+            step = MERGE_CHUNK_SIZE - MERGE_CHUNK_SIZE % self.bin_bytes
+            folded = bytearray(half)
+            for start in range(0, half, step):
+                end = min(start + step, half)
+                folded[start:end] = saturating_add(
+                    self.bf[start:end],
+                    self.bf[half + start : half + end],
+                    self.bin_bytes,
+                    self.bin_size,
+                )
+            self.bf = folded
+            self.bins //= 2
+            self.bytes = half
+
+        self._resized = True
+        self._clear_cache()
+
     def save(self, path: str = None) -> None:
         if path is not None:
             self.path = path
@@ -69,55 +261,87 @@ class CountingBloom(Bloom):
         if self.path is None:
             raise BloomException("No path specified")
 
-        metadata = {
-            "version": __version__,
-            "program": __program__,
-            "type": self.type,
-            "capacity": int(self.capacity),
-            "hashes": int(self.hashes),
-            "error_ratio": float(self.error_ratio),
-            "bin_size": int(self.bin_size),
-            "bins": self.bins,
-            "bin_bytes": self.bin_bytes,
-            "bytes": self.bytes,
-        }
+        self._wait_saved()
+        persist.write_zip(
+            self.path, self._base_metadata(), self._named_buffers()
+        )
 
-        with zipfile.ZipFile(self.path, "w", zipfile.ZIP_DEFLATED) as zf:
-            zf.writestr("metadata.json", json.dumps(metadata))
-            zf.writestr("bf.bin", self.bf)
+        self._reset_delta()
 
-    def load(self, path: str) -> None:
+    def load(self, path: str, verify: Any = True) -> None:
         if not path:
             raise BloomException("No path specified")
 
+        self._wait_saved()
         with zipfile.ZipFile(path, "r") as zf:
             try:
                 metadata = json.loads(zf.read("metadata.json"))
                 if metadata["type"] != self.type:
                     raise BloomException(f"Invalid type: {metadata['type']}")
 
-                self.hashes = int(metadata["hashes"])
-                self.capacity = int(metadata["capacity"])
-                self.error_ratio = float(metadata["error_ratio"])
-                self.bin_size = int(metadata["bin_size"])
-                self.bins = int(metadata["bins"])
-                self.bin_bytes = int(metadata["bin_bytes"])
-                self.bytes = int(metadata["bytes"])
-
-                self.bf = bytearray(zf.read("bf.bin"))
+                self._load_metadata(metadata)
+                (self.bf,) = self._read_buffers(zf, verify)
             except KeyError as e:
                 raise BloomException(f"Invalid file format: missing {e}")
 
+        self._replay_delta(path, metadata)
+        self._clear_cache()
+        self._verify_lazily(path, verify)
         self.path = path
 
+    def metadata(self) -> dict:
+        """Parameters needed to rebuild the filter around its buffer"""
+        return {
+            "version": __version__,
+            "program": __program__,
+            "type": self.type,
+            "capacity": int(self.capacity),
+            "hashes": int(self.hashes),
+            "error_ratio": float(self.error_ratio),
+            "bin_size": int(self.bin_size),
+            "bins": self.bins,
+            "bin_bytes": self.bin_bytes,
+            "bytes": self.bytes,
+            "power_of_two": self.power_of_two,
+        }
+
     def __contains__(self, s: str) -> bool:
         return self.check(s)
 
-    def _indexes(self, s: str) -> list:
+    def _load_metadata(self, metadata: dict) -> None:
+        """Set parameters from metadata written by metadata()"""
+        self.type = metadata["type"]
+        self.hashes = int(metadata["hashes"])
+        self.capacity = int(metadata["capacity"])
+        self.error_ratio = float(metadata["error_ratio"])
+        self.bin_size = int(metadata["bin_size"])
+        self.bins = int(metadata["bins"])
+        self.bin_bytes = int(metadata["bin_bytes"])
+        self.bytes = int(metadata["bytes"])
+        self.power_of_two = metadata.get("power_of_two", False)
+
+    def _hash_indexes(self, s: str) -> list:
         """Get indexes of element"""
+        s = self._utf8(s)
+        if self.power_of_two:
+            mask = self.bins - 1
+            for i in range(self.hashes):
+                yield self._hash(s, i) & mask
+            return
+
         for i in range(self.hashes):
             yield self._hash(s, i) % self.bins
 
+    def _hold(self, indexes: List[int]) -> Any:
+        """Context manager holding the locks of bins in thread-safe mode
+
+        Bins are locked by their first byte, so a bin spanning two
+        stripes is still always guarded by the same lock.
+        """
+        if self.locks is None:
+            return NO_LOCK
+        return self.locks.hold(index * self.bin_bytes for index in indexes)
+
     def _bin(self, index: int) -> int:
         """Get value of bin"""
         start = index * self.bin_bytes
@@ -130,6 +354,8 @@ class CountingBloom(Bloom):
         end = start + self.bin_bytes
         bytes_value = self._int2bytes(value, self.bin_bytes)
         self.bf[start:end] = bytes_value
+        self._dirty.add(start // delta.CHUNK_SIZE)
+        self._dirty.add((end - 1) // delta.CHUNK_SIZE)
 
     def _increment_bin(self, index: int, amount: int) -> bool:
         """Increase value of bin by amount, return True if full"""
@@ -0,0 +1,82 @@
+import json
+import os
+import struct
+from typing import Iterable, Iterator, Tuple
+import zlib
+
+
+DELTA_SUFFIX = ".delta"
+CHUNK_SIZE = 64 << 10  # 64KiB
+MAGIC = b"PFDL"
+
+# Frame: magic, body length, body crc32 | body
+FRAME_HEADER = struct.Struct(">4sII")
+# Chunk: buffer index, byte offset, compressed length
+CHUNK_HEADER = struct.Struct(">IQI")
+LENGTH = struct.Struct(">I")
+
+
+def delta_path(path: str) -> str:
+    """Path of the delta log belonging to a base file"""
+    return path + DELTA_SUFFIX
+
+
+def write_frame(
+    path: str,
+    metadata: dict,
+    chunks: Iterable[Tuple[int, int, bytes]],
+) -> int:
+    """Append a frame of (buffer, offset, data) chunks to a delta log"""
+    meta = json.dumps(metadata).encode("utf-8")
+    parts = [LENGTH.pack(len(meta)), meta]
+    for buffer, offset, data in chunks:
+        data = zlib.compress(data)
+        parts.append(CHUNK_HEADER.pack(buffer, offset, len(data)))
+        parts.append(data)
+    body = b"".join(parts)
+
+    with open(path, "ab") as fp:
+        fp.write(FRAME_HEADER.pack(MAGIC, len(body), zlib.crc32(body)))
+        fp.write(body)
+        fp.flush()
+        os.fsync(fp.fileno())
+
+    return FRAME_HEADER.size + len(body)
+
+
+def read_frames(path: str) -> Iterator[Tuple[dict, list]]:
+    """Yield (metadata, chunks) for every complete frame in a delta log
+
+    Replay stops at the first truncated or corrupted frame, which is what
+    a crash in the middle of a checkpoint leaves behind.
+    """
+    with open(path, "rb") as fp:
+        while True:
+            header = fp.read(FRAME_HEADER.size)
+            if len(header) < FRAME_HEADER.size:
+                return
+            magic, length, crc = FRAME_HEADER.unpack(header)
+            if magic != MAGIC:
+                return
+            body = fp.read(length)
+            if len(body) < length or zlib.crc32(body) != crc:
+                return
+            yield _parse_body(body)
+
+
+def _parse_body(body: bytes) -> Tuple[dict, list]:
+    """Split a frame body into metadata and decompressed chunks"""
+    (meta_length,) = LENGTH.unpack_from(body, 0)
+    pos = LENGTH.size
+    metadata = json.loads(body[pos : pos + meta_length])
+    pos += meta_length
+
+    chunks = []
+    while pos < len(body):
+        buffer, offset, length = CHUNK_HEADER.unpack_from(body, pos)
+        pos += CHUNK_HEADER.size
+        data = zlib.decompress(body[pos : pos + length])
+        pos += length
+        chunks.append((buffer, offset, data))
+
+    return metadata, chunks
@@ -0,0 +1,125 @@
+import bz2
+import gzip
+from itertools import islice
+import lzma
+import os
+import time
+from typing import Any, Callable, Iterator, List, NamedTuple, Optional
+
+
+CHUNK_SIZE = 1 << 20  # 1MiB
+BATCH_SIZE = 10000
+
+# Leading bytes identifying compressed inputs
+COMPRESSED_FORMATS = (
+    (b"\x1f\x8b", gzip.open),
+    (b"BZh", bz2.open),
+    (b"\xfd7zXZ\x00", lzma.open),
+)
+
+
+class IngestStats(NamedTuple):
+    """Progress of an ingest"""
+
+    keys: int
+    bytes: int
+    seconds: float
+
+    @property
+    def rate(self) -> float:
+        """Keys ingested per second"""
+        return self.keys / self.seconds if self.seconds > 0 else 0.0
+
+
+def open_source(path: str) -> Any:
+    """Open a file for binary reading, decompressing it if required"""
+    with open(path, "rb") as fp:
+        magic = fp.read(6)
+    for prefix, opener in COMPRESSED_FORMATS:
+        if magic.startswith(prefix):
+            return opener(path, "rb")
+    return open(path, "rb")
+
+
+def iter_lines(fp: Any, chunk_size: int = CHUNK_SIZE) -> Iterator[list]:
+    """Yield lists of non-empty lines as bytes, one list per block read
+
+    Blocks of chunk_size bytes are split in one pass; only the partial
+    line at the end of each block is carried over to the next.
+    """
+    tail = b""
+    while True:
+        block = fp.read(chunk_size)
+        if not block:
+            break
+        data = tail + block if tail else block
+        if b"\r" in data:
+            data = data.replace(b"\r\n", b"\n")
+        lines = data.split(b"\n")
+        tail = lines.pop()
+        yield [line for line in lines if line]
+
+    tail = tail.rstrip(b"\r")
+    if tail:
+        yield [tail]
+
+
+def iter_batches(keys: Any, batch_size: int = BATCH_SIZE) -> Iterator[list]:
+    """Yield lists of up to batch_size keys from an iterable"""
+    keys = iter(keys)
+    while True:
+        batch = list(islice(keys, batch_size))
+        if not batch:
+            break
+        yield batch
+
+
+class CountingReader:
+    """Binary file wrapper counting the bytes read through it"""
+
+    def __init__(self, fp: Any) -> None:
+        self.fp = fp
+        self.bytes = 0
+
+    def read(self, size: int = -1) -> bytes:
+        data = self.fp.read(size)
+        self.bytes += len(data)
+        return data
+
+
+def ingest(
+    add_many: Callable[[List], Any],
+    source: Any,
+    chunk_size: int = CHUNK_SIZE,
+    batch_size: int = BATCH_SIZE,
+    progress: Optional[Callable[[IngestStats], None]] = None,
+) -> IngestStats:
+    """Feed every key in source to add_many in bounded batches
+
+    source may be a path to a newline-delimited file (optionally gzip,
+    bzip2 or xz compressed), a binary file object, or an iterable of keys.
+    Files are read in blocks of chunk_size bytes and iterables in batches
+    of batch_size keys, so memory use does not depend on input size.
+    """
+    if isinstance(source, (str, bytes, os.PathLike)):
+        with open_source(source) as fp:
+            return ingest(add_many, fp, chunk_size, batch_size, progress)
+
+    reader = None
+    if hasattr(source, "read"):
+        reader = CountingReader(getattr(source, "buffer", source))
+        batches = iter_lines(reader, chunk_size)
+    else:
+        batches = iter_batches(source, batch_size)
+
+    start = time.monotonic()
+    keys = 0
+    for batch in batches:
+        add_many(batch)
+        keys += len(batch)
+        if progress is not None:
+            size = reader.bytes if reader is not None else 0
+            progress(IngestStats(keys, size, time.monotonic() - start))
+
+    size = reader.bytes if reader is not None else 0
+    return IngestStats(keys, size, time.monotonic() - start)
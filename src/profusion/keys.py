@@ -0,0 +1,71 @@
+from typing import Any, Iterable, Iterator
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover
+    np = None
+
+
+INT_BYTES = 8
+INT_MASK = (1 << (INT_BYTES * 8)) - 1
+INT_MIN = -(1 << (INT_BYTES * 8 - 1))
+
+
+def int2key(i: int) -> bytes:
+    """Encode an integer key as 8 little-endian bytes
+
+    Integers in the signed or unsigned 64-bit range use their 64-bit two's
+    complement, matching NumPy int64/uint64 arrays. Wider integers use a
+    longer signed encoding so they never collide with 64-bit keys.
+    """
+    if INT_MIN <= i <= INT_MASK:
+        return (i & INT_MASK).to_bytes(INT_BYTES, "little")
+    length = (i.bit_length() + 8) // 8
+    return i.to_bytes(length, "little", signed=True)
+
+
+def to_key(s: Any) -> Any:
+    """Convert a key to something the hash functions accept
+
+    Strings are UTF-8 encoded and integers, including NumPy integer and
+    bool scalars, packed with int2key(). Bytes and other buffer-protocol
+    objects are passed through without copying.
+    """
+    if isinstance(s, str):
+        return s.encode("utf-8")
+    if isinstance(s, int):
+        return int2key(s)
+    if np is not None and isinstance(s, (np.integer, np.bool_)):
+        return int2key(int(s))
+    return s
+
+
+def iter_keys(keys: Iterable) -> Iterator[Any]:
+    """Iterate over keys, slicing NumPy arrays without per-key copies
+
+    Integer arrays yield 8-byte views hashed exactly like the equivalent
+    Python ints, and fixed-width byte arrays ("S" dtype) yield views of
+    each item without its NUL padding, hashed like the equivalent bytes.
+    """
+    if np is None or not isinstance(keys, np.ndarray):
+        return iter(keys)
+
+    if keys.dtype.kind in "iub":
+        dtype = "<u8" if keys.dtype.kind == "u" else "<i8"
+        array = np.ascontiguousarray(keys.ravel(), dtype=dtype)
+        return _iter_rows(array, [INT_BYTES] * len(array))
+
+    if keys.dtype.kind == "S":
+        array = np.ascontiguousarray(keys.ravel())
+        return _iter_rows(array, np.char.str_len(array).tolist())
+
+    return (to_key(s) for s in keys.ravel().tolist())
+
+
+def _iter_rows(array: Any, lengths: list) -> Iterator[memoryview]:
+    """Yield a read-only view of the leading bytes of each array item"""
+    view = memoryview(array).cast("B").toreadonly()
+    itemsize = array.dtype.itemsize
+    for i, length in enumerate(lengths):
+        start = i * itemsize
+        yield view[start : start + length]
@@ -0,0 +1,270 @@
+from array import array
+from collections import Counter
+import itertools
+import multiprocessing
+import os
+from queue import Empty
+import random
+import time
+from typing import Any, Iterable, List
+
+from . import BloomException, MMCountingBloom
+from .mmapped_counting_bloom import DIR
+
+DISTRIBUTIONS = ("uniform", "zipf")
+PROCESSES = os.cpu_count() or 1
+OPERATIONS = 20000
+KEYS = 10000
+ADD_RATIO = 0.5
+ZIPF_EXPONENT = 1.1
+CAPACITY = 1e6
+ERROR_RATIO = 1e-6
+# Seconds between checks for workers that died without reporting
+REPORT_TIMEOUT = 1.0
+
+
+def load_test(
+    processes: int = PROCESSES,
+    operations: int = OPERATIONS,
+    keys: int = KEYS,
+    distribution: str = "uniform",
+    add_ratio: float = ADD_RATIO,
+    batch_size: int = 1,
+    **kwargs: Any,
+) -> dict:
+    """Run processes against one MMCountingBloom and report contention
+
+    Each process makes operations / batch_size calls of add() or value()
+    (add_many() and value_many() for batches), add_ratio of them adds, on
+    keys drawn from keys distinct ones: "uniform", or "zipf" with
+    zipf_exponent so that a few hot keys get most calls. Processes start
+    together on a barrier. The filter is name in dir, built with capacity
+    and error_ratio; without a name a fresh one is created and removed
+    afterwards. seed makes the key sequences reproducible.
+
+    Returns a JSON-serializable dict with throughput, per-call latency
+    percentiles, time spent waiting for the file lock, and a count-loss
+    check: every key's final value must be at least its value before the
+    run plus the adds made to it, capped at bin_size.
+    """
+    if processes <= 0:
+        raise BloomException("processes must be > 0")
+    if operations <= 0 or keys <= 0 or batch_size <= 0:
+        raise BloomException("operations, keys and batch_size must be > 0")
+    if distribution not in DISTRIBUTIONS:
+        raise BloomException(f"distribution must be in {DISTRIBUTIONS}")
+    if not 0 <= add_ratio <= 1:
+        raise BloomException("add_ratio must be between 0 and 1")
+
+    name = kwargs.get("name", None)
+    params = {
+        "dir": kwargs.get("dir", DIR),
+        "capacity": kwargs.get("capacity", CAPACITY),
+        "error_ratio": kwargs.get("error_ratio", ERROR_RATIO),
+    }
+    if name is not None:
+        # MMCountingBloom would overwrite a file of another size
+        path = os.path.join(params["dir"], f"{name}.mmcb")
+        bins, _ = MMCountingBloom._parameters(
+            params["capacity"], params["error_ratio"]
+        )
+        if os.path.isfile(path) and os.path.getsize(path) != bins:
+            raise BloomException(f"'{path}' has other parameters")
+    bloom = MMCountingBloom(name or f"loadtest_{os.getpid()}", **params)
+    config = {
+        "name": bloom.name,
+        **params,
+        "processes": processes,
+        "operations": operations,
+        "keys": keys,
+        "distribution": distribution,
+        "zipf_exponent": kwargs.get("zipf_exponent", ZIPF_EXPONENT),
+        "add_ratio": add_ratio,
+        "batch_size": batch_size,
+        "seed": kwargs.get("seed", 0),
+    }
+
+    try:
+        all_keys = [key(i) for i in range(keys)]
+        before = bloom.value_many(all_keys)
+        reports = _run_workers(config)
+        after = bloom.value_many(all_keys)
+        bin_size = bloom.bin_size
+    finally:
+        if name is None:
+            os.remove(bloom.path)
+        del bloom
+
+    adds: Counter = Counter()
+    for report in reports:
+        adds.update(report["adds"])
+    lost = [min(before[i] + adds[i], bin_size) - after[i] for i in range(keys)]
+    lost = [count for count in lost if count > 0]
+
+    seconds = max(r["end"] for r in reports) - min(r["start"] for r in reports)
+    busy = sum(r["end"] - r["start"] for r in reports)
+    waits = _merge(r["lock_waits"] for r in reports)
+    total = processes * operations
+    return {
+        "config": config,
+        "seconds": seconds,
+        "operations": total,
+        "ops_per_second": total / seconds if seconds > 0 else 0.0,
+        "add": latency_stats(_merge(r["add_latencies"] for r in reports)),
+        "value": latency_stats(_merge(r["value_latencies"] for r in reports)),
+        "lock_wait": {
+            **latency_stats(waits),
+            "seconds": sum(waits),
+            "fraction": sum(waits) / busy if busy > 0 else 0.0,
+        },
+        "count_loss": {
+            "keys_checked": keys,
+            "adds": sum(adds.values()),
+            "keys_lost": len(lost),
+            "counts_lost": sum(lost),
+        },
+    }
+
+
+def key(i: int) -> bytes:
+    """Key number i of a load test"""
+    return f"key_{i}".encode()
+
+
+def key_indexes(rnd: random.Random, config: dict, count: int) -> List[int]:
+    """Draw count key numbers from the configured distribution"""
+    population = range(config["keys"])
+    if config["distribution"] == "uniform":
+        return rnd.choices(population, k=count)
+    # Key number i has rank i + 1
+    exponent = config["zipf_exponent"]
+    weights = itertools.accumulate(
+        1.0 / (rank + 1) ** exponent for rank in population
+    )
+    return rnd.choices(population, cum_weights=list(weights), k=count)
+
+
+def latency_stats(seconds: List[float]) -> dict:
+    """Count, mean, p50, p99 and max of sorted durations, in microseconds"""
+    if not seconds:
+        return {"calls": 0}
+    return {
+        "calls": len(seconds),
+        "mean_us": sum(seconds) / len(seconds) * 1e6,
+        "p50_us": _percentile(seconds, 0.5) * 1e6,
+        "p99_us": _percentile(seconds, 0.99) * 1e6,
+        "max_us": seconds[-1] * 1e6,
+    }
+
+
+def _run_workers(config: dict) -> List[dict]:
+    """Start a process per worker and collect their reports"""
+    context = multiprocessing.get_context()
+    barrier = context.Barrier(config["processes"])
+    queue = context.Queue()
+    processes = [
+        context.Process(target=_worker, args=(config, i, barrier, queue))
+        for i in range(config["processes"])
+    ]
+    for process in processes:
+        process.start()
+    reports: List[dict] = []
+    try:
+        while len(reports) < len(processes):
+            try:
+                reports.append(queue.get(timeout=REPORT_TIMEOUT))
+            except Empty:
+                _check_alive(processes)
+    finally:
+        for process in processes:
+            if len(reports) < len(processes):
+                # Survivors may be waiting on the barrier for a dead worker
+                process.terminate()
+            process.join()
+    errors = [report["error"] for report in reports if "error" in report]
+    if errors:
+        raise BloomException(f"Load test worker failed: {errors[0]}")
+    return reports
+
+
+def _check_alive(processes: List[Any]) -> None:
+    """Raise if a worker exited without reporting, as when killed"""
+    codes = [process.exitcode for process in processes]
+    for worker, code in enumerate(codes):
+        if code not in (None, 0):
+            raise BloomException(
+                f"Load test worker {worker} died with exit code {code}"
+            )
+    if None not in codes:
+        raise BloomException("Load test workers exited without reporting")
+
+
+def _worker(config: dict, worker: int, barrier: Any, queue: Any) -> None:
+    """Run one process's share of a load test and report it on queue"""
+    try:
+        queue.put(_work(config, worker, barrier))
+    except BaseException as e:
+        barrier.abort()
+        queue.put({"error": repr(e)})
+
+
+def _work(config: dict, worker: int, barrier: Any) -> dict:
+    """Time every call of one process, see load_test()"""
+    waits = array("d")
+    bloom = MMCountingBloom(
+        config["name"],
+        dir=config["dir"],
+        capacity=config["capacity"],
+        error_ratio=config["error_ratio"],
+        lock_waits=waits,
+    )
+
+    rnd = random.Random(f"{config['seed']}-{worker}")
+    indexes = key_indexes(rnd, config, config["operations"])
+    size = config["batch_size"]
+    batches = [
+        (rnd.random() < config["add_ratio"], indexes[i : i + size])
+        for i in range(0, len(indexes), size)
+    ]
+    keys = {i: key(i) for i in set(indexes)}
+    adds: Counter = Counter()
+    latencies = {True: array("d"), False: array("d")}
+
+    barrier.wait()
+    start = time.perf_counter()
+    for is_add, batch in batches:
+        batch_keys = [keys[i] for i in batch]
+        call_start = time.perf_counter()
+        if is_add:
+            if size == 1:
+                bloom.add(batch_keys[0])
+            else:
+                bloom.add_many(batch_keys)
+        elif size == 1:
+            bloom.value(batch_keys[0])
+        else:
+            bloom.value_many(batch_keys)
+        latencies[is_add].append(time.perf_counter() - call_start)
+        if is_add:
+            adds.update(batch)
+    end = time.perf_counter()
+    del bloom
+
+    return {
+        "start": start,
+        "end": end,
+        "adds": dict(adds),
+        "add_latencies": latencies[True],
+        "value_latencies": latencies[False],
+        "lock_waits": waits,
+    }
+
+
+def _merge(parts: Iterable[array]) -> List[float]:
+    """Sorted durations of every process"""
+    return sorted(itertools.chain.from_iterable(parts))
+
+
+def _percentile(values: List[float], q: float) -> float:
+    """Nearest-rank percentile of sorted values"""
+    return values[min(len(values) - 1, int(q * len(values)))]
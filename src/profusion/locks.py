@@ -0,0 +1,86 @@
+import fcntl
+import threading
+import time
+from typing import Any, Iterable, List, MutableSequence, Optional
+
+
+LOCK_STRIPES = 64
+# Each lock guards every LOCK_STRIPES-th run of 64 bytes (a cache line)
+STRIPE_SHIFT = 6
+
+
+class StripedLock:
+    """Fixed set of locks guarding interleaved byte ranges of a buffer
+
+    Byte b is guarded by lock (b >> STRIPE_SHIFT) % stripes, so writes to
+    different cache lines rarely wait on each other. Pickles as a new
+    set of unlocked locks.
+    """
+
+    def __init__(self, stripes: int = LOCK_STRIPES) -> None:
+        if stripes <= 0 or stripes & (stripes - 1):
+            raise ValueError("stripes must be a power of two")
+        self.mask = stripes - 1
+        self.locks = [threading.Lock() for _ in range(stripes)]
+
+    def stripe(self, byte_index: Any) -> Any:
+        """Stripe of a byte index, or of a NumPy array of them"""
+        return (byte_index >> STRIPE_SHIFT) & self.mask
+
+    def lock(self, byte_index: int) -> threading.Lock:
+        """Lock guarding a byte"""
+        return self.locks[(byte_index >> STRIPE_SHIFT) & self.mask]
+
+    def hold(self, byte_indexes: Iterable[int]) -> "HeldLocks":
+        """Context manager holding the locks of every byte at once
+
+        Locks are taken in stripe order, so holders never deadlock.
+        """
+        stripes = sorted({self.stripe(i) for i in byte_indexes})
+        return HeldLocks([self.locks[stripe] for stripe in stripes])
+
+    def __len__(self) -> int:
+        return len(self.locks)
+
+    def __reduce__(self) -> Any:
+        return StripedLock, (len(self.locks),)
+
+
+class HeldLocks:
+    """Context manager acquiring locks in order and releasing them"""
+
+    def __init__(self, locks: List[threading.Lock]) -> None:
+        self.locks = locks
+
+    def __enter__(self) -> None:
+        for lock in self.locks:
+            lock.acquire()
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        for lock in reversed(self.locks):
+            lock.release()
+
+
+class FileLock:
+    """Context manager holding an exclusive flock on an open file
+
+    Serializes writers across processes that open the same file. With
+    waits, the seconds spent acquiring the lock are appended to it.
+    """
+
+    def __init__(
+        self, file: Any, waits: Optional[MutableSequence[float]] = None
+    ) -> None:
+        self.file = file
+        self.waits = waits
+
+    def __enter__(self) -> None:
+        if self.waits is None:
+            fcntl.flock(self.file.fileno(), fcntl.LOCK_EX)
+            return
+        start = time.perf_counter()
+        fcntl.flock(self.file.fileno(), fcntl.LOCK_EX)
+        self.waits.append(time.perf_counter() - start)
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        fcntl.flock(self.file.fileno(), fcntl.LOCK_UN)
@@ -1,22 +1,44 @@
+from concurrent.futures import Executor, Future
+import json
 import math
 import mmap
 import os
-import fcntl
-import hashlib
-from typing import Any, Iterator, ContextManager
-
+from typing import (
+    Any,
+    Iterable,
+    Iterator,
+    ContextManager,
+    List,
+    MutableSequence,
+    Optional,
+    Tuple,
+)
+import zipfile
+
+from . import __version__, __program__
 from . import Bloom, BloomException
+from . import persist
+from .bloom import sha256_hash
+from .counting_bloom import saturating_add, threshold_bloom
+from .keys import iter_keys
+from .locks import FileLock
 
 
 BIN_SIZE = 255
 DIR = "/dev/shm"
 CAPACITY = 1e6
 ERROR_RATIO = 1e-15
+SNAPSHOT_CHUNK_SIZE = 1 << 20  # 1MiB
 
 
 class MMCountingBloom(Bloom):
     """Memory-mapped Counting Bloom filter implementation"""
 
+    type = "mmapped counting bloom"
+    hash_scheme = "sha256"
+    # Seconds spent acquiring the file lock, appended on each write if set
+    lock_waits: Optional[MutableSequence[float]] = None
+
     def __init__(self, name: str, **kwargs: Any) -> None:
         self.type = "mmapped counting bloom"
         self.bin_size: int = kwargs.get("bin_size", BIN_SIZE)
@@ -24,19 +46,13 @@ class MMCountingBloom(Bloom):
         self.dir: str = kwargs.get("dir", DIR)
         self.error_ratio: float = kwargs.get("error_ratio", ERROR_RATIO)
         self.name: str = name
+        self.lock_waits = kwargs.get("lock_waits", None)
 
         self._validate_params()
 
         # Calculate bloom filter parameters
-        self.bins: int = max(
-            1,
-            int(
-                -(self.capacity * math.log(self.error_ratio))
-                / (math.log(2) ** 2)
-            ),
-        )
-        self.hashes: int = max(
-            1, int((self.bins / self.capacity) * math.log(2))
+        self.bins, self.hashes = self._parameters(
+            self.capacity, self.error_ratio
         )
 
         # Use a fixed bin size of 1 byte
@@ -47,6 +63,16 @@ class MMCountingBloom(Bloom):
 
         self._setup_mmap()
 
+    @staticmethod
+    def _parameters(capacity: float, error_ratio: float) -> Tuple[int, int]:
+        """Calculate optimal bins and hashes for capacity and error ratio"""
+        bins = max(
+            1,
+            int(-(capacity * math.log(error_ratio)) / (math.log(2) ** 2)),
+        )
+        hashes = max(1, int((bins / capacity) * math.log(2)))
+        return bins, hashes
+
     def _validate_params(self) -> None:
         """Validate initialization parameters"""
         if self.bin_size <= 0 or self.bin_size > 255:
@@ -82,6 +108,32 @@ class MMCountingBloom(Bloom):
                 increments.append(self._increment_bin(index, amount))
             return all(increments)
 
+    def add_many(self, keys: Iterable, amount: int = 1) -> List[bool]:
+        """Add amount to every element, holding the lock once per batch"""
+        indexes_list = [list(self._indexes(s)) for s in iter_keys(keys)]
+        with self._lock():
+            return [
+                all([self._increment_bin(i, amount) for i in indexes])
+                for indexes in indexes_list
+            ]
+
+    def check_then_add_many(
+        self, keys: Iterable, amount: int = 1
+    ) -> List[bool]:
+        """Check if every element has a count then add amount to it
+
+        The lock is held once per batch, so exactly one of several
+        processes adding the same new element sees False.
+        """
+        indexes_list = [list(self._indexes(s)) for s in iter_keys(keys)]
+        with self._lock():
+            results = []
+            for indexes in indexes_list:
+                results.append(min(self.bf[i] for i in indexes) > 0)
+                for i in indexes:
+                    self._increment_bin(i, amount)
+            return results
+
     def value(self, s: str) -> int:
         """Get value of element"""
         with self._lock():
@@ -96,16 +148,177 @@ class MMCountingBloom(Bloom):
 
             return min(values) if values else 0
 
+    def value_many(self, keys: Iterable) -> List[int]:
+        """Get value of every element, holding the lock once per batch"""
+        indexes_list = [list(self._indexes(s)) for s in iter_keys(keys)]
+        with self._lock():
+            return [
+                min(self._bin(i) for i in indexes) if indexes else 0
+                for indexes in indexes_list
+            ]
+
     def check(self, s: str, trigger: int = 1) -> bool:
         """Check if value of element is at least trigger."""
         return self.value(s) >= trigger
 
+    def check_many(self, keys: Iterable, trigger: int = 1) -> List[bool]:
+        """Check if value of every element is at least trigger"""
+        return [value >= trigger for value in self.value_many(keys)]
+
     def zero(self) -> None:
         """Reset all counts"""
         with self._lock():
             self.bf.seek(0)
             self.bf.write(b"\0" * self.bytes)
 
+    def merge(self, other: Bloom) -> None:
+        """Add the counts of a filter with the same bins and hashes
+
+        Counters are merged one chunk at a time under the lock.
+        """
+        self._check_compatible(other)
+        for start in range(0, self.bytes, SNAPSHOT_CHUNK_SIZE):
+            end = start + SNAPSHOT_CHUNK_SIZE
+            counts = bytes(other.bf[start:end])
+            with self._lock():
+                self.bf[start:end] = saturating_add(
+                    self.bf[start:end], counts, 1, self.bin_size
+                )
+
+    def snapshot(self, path: str) -> None:
+        """Save filter to a ZIP file while other writers carry on
+
+        The buffer is copied one chunk at a time and the lock is only held
+        while a chunk is copied, so writers pause for at most one chunk.
+        Every add that completed before the snapshot started is included;
+        adds running concurrently with it may be captured partially.
+        """
+        if path is None:
+            raise BloomException("path must be specified for a snapshot")
+        metadata = self.metadata()
+
+        # SNAPSHOT_CHUNK_SIZE is a multiple of the checksum chunk size
+        checksums = []
+        with persist.atomic_file(path) as out, zipfile.ZipFile(
+            out, "w", zipfile.ZIP_DEFLATED
+        ) as zf:
+            zf.writestr("metadata.json", json.dumps(metadata))
+            with zf.open("bf.bin", "w", force_zip64=True) as fp:
+                for chunk in self._chunks():
+                    fp.write(chunk)
+                    checksums.extend(persist.chunk_checksums(chunk))
+            zf.writestr(
+                persist.CHECKSUMS,
+                json.dumps(persist.checksums_json({"bf.bin": checksums})),
+            )
+
+    def to_bloom(self, trigger: int = 1, path: Optional[str] = None) -> Bloom:
+        """Bloom filter of the elements with a value of at least trigger
+
+        The Bloom filter has the same bins, hashes and SHA-256 hash
+        functions, so its check(s) is check(s, trigger). Counters are
+        copied one chunk at a time under the lock, as in snapshot(). With
+        a path, the Bloom filter is also saved there.
+        """
+        metadata = {
+            "type": Bloom.type,
+            "bins": self.bins,
+            "hashes": self.hashes,
+            "power_of_two": False,
+            "hash_scheme": self.hash_scheme,
+        }
+        bloom = threshold_bloom(
+            self._chunks(), self.bin_bytes, trigger, metadata
+        )
+        bloom.capacity = self.capacity
+        bloom.error_ratio = self.error_ratio
+        if path is not None:
+            bloom.save(path)
+        return bloom
+
+    def metadata(self) -> dict:
+        """Parameters recorded in snapshots"""
+        return {
+            "version": __version__,
+            "program": __program__,
+            "type": self.type,
+            "capacity": int(self.capacity),
+            "error_ratio": float(self.error_ratio),
+            "bin_size": int(self.bin_size),
+            "bins": self.bins,
+            "hashes": self.hashes,
+            "bin_bytes": self.bin_bytes,
+            "bytes": self.bytes,
+        }
+
+    def share(self) -> None:
+        """Memory-mapped filters are shared by opening the same name"""
+        raise BloomException(f"Open MMCountingBloom('{self.name}') instead")
+
+    def save_async(
+        self, path: str, executor: Optional[Executor] = None
+    ) -> Future:
+        """Run snapshot(path) on a background thread, returning a Future"""
+        if path is None:
+            raise BloomException("path must be specified for a snapshot")
+        executor = executor if executor is not None else persist.executor()
+        return executor.submit(self.snapshot, path)
+
+    def restore(self, path: str, verify: bool = True) -> None:
+        """Load counts from a ZIP file written by snapshot()
+
+        With verify, every chunk checksum is checked before any count is
+        overwritten, so a corrupt snapshot leaves the filter untouched.
+        """
+        if not os.path.isfile(path):
+            raise BloomException(f"'{path}' must be a file")
+        if verify:
+            persist.verify(path)
+
+        with zipfile.ZipFile(path, "r") as zf:
+            try:
+                metadata = json.loads(zf.read("metadata.json"))
+                if metadata["program"] != __program__:
+                    raise BloomException(f"Unrecognized file format '{path}'")
+                if metadata["type"] != self.type:
+                    raise BloomException(f"Invalid type: {metadata['type']}")
+                if (
+                    metadata["bins"] != self.bins
+                    or metadata["hashes"] != self.hashes
+                ):
+                    raise BloomException(
+                        f"'{path}' has {metadata['bins']} bins and "
+                        f"{metadata['hashes']} hashes, expected {self.bins} "
+                        f"bins and {self.hashes} hashes"
+                    )
+
+                with zf.open("bf.bin") as fp:
+                    start = 0
+                    while True:
+                        chunk = fp.read(SNAPSHOT_CHUNK_SIZE)
+                        if not chunk:
+                            break
+                        end = start + len(chunk)
+                        with self._lock():
+                            self.bf[start:end] = chunk
+                        start = end
+            except KeyError as e:
+                raise BloomException(f"Invalid file format: missing {e}")
+
+    def _saturation(self) -> float:
+        """Calculate the proportion of bins with a non-zero count"""
+        empty = 0
+        for start in range(0, self.bytes, SNAPSHOT_CHUNK_SIZE):
+            empty += self.bf[start : start + SNAPSHOT_CHUNK_SIZE].count(0)
+        return (self.bins - empty) / float(self.bins)
+
+    def _chunks(self) -> Iterator[bytes]:
+        """Copy the counters one chunk at a time, locking each copy"""
+        for start in range(0, self.bytes, SNAPSHOT_CHUNK_SIZE):
+            with self._lock():
+                chunk = self.bf[start : start + SNAPSHOT_CHUNK_SIZE]
+            yield chunk
+
     def _indexes(self, s: str) -> Iterator[int]:
         """Find list of index tuples for bloom filter"""
         s = self._utf8(s)
@@ -136,31 +349,15 @@ class MMCountingBloom(Bloom):
 
     def _lock(self) -> ContextManager:
         """Context manager for file locking"""
-
-        class FileLock:
-            def __init__(self, file):
-                self.file = file
-
-            def __enter__(self):
-                fcntl.flock(self.file.fileno(), fcntl.LOCK_EX)
-
-            def __exit__(self, exc_type, exc_val, exc_tb):
-                fcntl.flock(self.file.fileno(), fcntl.LOCK_UN)
-
-        return FileLock(self.fp)
+        return FileLock(self.fp, self.lock_waits)
 
     def _hash(self, s: bytes, i: int) -> int:
         """Generate hash value for a given string and salt"""
-        return int(hashlib.sha256(s + str(i).encode()).hexdigest(), 16)
+        return sha256_hash(s, i)
 
     def __contains__(self, s: str) -> bool:
         return self.check(s)
 
-    @staticmethod
-    def _utf8(s: str) -> bytes:
-        """Convert string to UTF-8 bytes"""
-        return s.encode("utf-8")
-
     def __del__(self) -> None:
         """Ensure proper cleanup of resources"""
         if hasattr(self, "bf"):
@@ -0,0 +1,304 @@
+from concurrent.futures import Executor, Future
+import json
+import math
+import mmap
+import os
+import struct
+from typing import Any, ContextManager, Iterable, List, Optional
+
+from . import __version__, __program__
+from . import BloomException
+from . import persist
+from .keys import iter_keys
+from .locks import FileLock
+from .scalable_bloom import (
+    ScalableBloom,
+    MAX_ERROR,
+    ERROR_DECAY_RATE,
+    INITIAL_SIZE,
+    GROWTH_FACTOR,
+)
+
+
+DIR = "/dev/shm"
+SUFFIX = ".msb"
+MANIFEST = "manifest.json"
+LOCK = "lock"
+STATE = "state"
+# Generation (number of subfilters) and elements added, see _read_state()
+STATE_FORMAT = struct.Struct("<QQ")
+PARAMS = ("max_error", "error_decay_rate", "initial_size", "growth_factor")
+
+
+class MMScalableBloom(ScalableBloom):
+    """Scalable Bloom filter shared by processes through mmapped files
+
+    Subfilters live in bf_{i}.bin files under a directory together with a
+    manifest.json of parameters and a small state file holding a
+    generation counter (the number of subfilters) and the element count.
+    Adds and growth take an exclusive lock on the directory's lock file;
+    processes notice new generations by reading the counter and map the
+    new subfilters without re-opening the filter.
+
+    Subfilters below the newest are frozen and never written again, so
+    checks read them without the lock. Opening an existing name uses the
+    parameters in its manifest.
+    """
+
+    type = "mmapped scalable bloom"
+
+    def __init__(self, name: str, **kwargs: Any) -> None:
+        if kwargs.get("sparse", False):
+            raise BloomException(
+                "sparse isn't supported by mmapped scalable bloom"
+            )
+        self._init_state()
+        self.type = "mmapped scalable bloom"
+        self.name = name
+        self.dir = kwargs.get("dir", DIR)
+        self.max_error = kwargs.get("max_error", MAX_ERROR)
+        self.error_decay_rate = kwargs.get(
+            "error_decay_rate", ERROR_DECAY_RATE
+        )
+        self.initial_size = kwargs.get("initial_size", INITIAL_SIZE)
+        self.growth_factor = kwargs.get("growth_factor", GROWTH_FACTOR)
+        self._validate_params()
+
+        self.blooms = 0
+        self.elements = 0
+        self.threshold = 0
+        self.bins_list: List[int] = []
+        self.hashes: List[int] = []
+        self.bfs: List[mmap.mmap] = []
+
+        self.path = os.path.join(self.dir, f"{name}{SUFFIX}")
+        os.makedirs(self.path, exist_ok=True)
+        self.fp = open(os.path.join(self.path, LOCK), "a+b")
+        with self._lock():
+            self._setup()
+        self._refresh()
+
+    def _setup(self) -> None:
+        """Create the manifest and first subfilter, or read existing ones"""
+        manifest_path = os.path.join(self.path, MANIFEST)
+        if os.path.isfile(manifest_path):
+            with open(manifest_path) as fp:
+                manifest = json.load(fp)
+            if manifest.get("type") != self.type:
+                raise BloomException(f"'{self.path}' isn't a {self.type}")
+            for param in PARAMS:
+                setattr(self, param, manifest[param])
+        self.initial_error = (1.0 - self.error_decay_rate) * self.max_error
+
+        state_path = os.path.join(self.path, STATE)
+        if not os.path.isfile(state_path):
+            with open(state_path, "wb") as fp:
+                fp.write(bytes(STATE_FORMAT.size))
+        with open(state_path, "r+b") as fp:
+            self.state = mmap.mmap(fp.fileno(), 0)
+
+        if self._read_state()[0] == 0:
+            self._grow()
+
+    def add(self, s: str) -> None:
+        """Add element to filter"""
+        self.add_many([s])
+
+    def add_many(self, keys: Iterable) -> None:
+        """Add every element, holding the lock once per batch
+
+        Indexes are computed for the newest subfilter before locking and
+        only recomputed for keys added after the filter grows.
+        """
+        keys = list(iter_keys(keys))
+        self._refresh()
+        bloom = self.blooms - 1
+        indexes_list = [next(self._hash_indexes(s, bloom)) for s in keys]
+
+        with self._lock():
+            self._refresh()
+            for s, indexes in zip(keys, indexes_list):
+                if bloom != self.blooms - 1:
+                    indexes = next(self._hash_indexes(s, self.blooms - 1))
+                self._add_indexes(indexes)
+            self._write_state()
+
+    def check(self, s: str) -> bool:
+        """Check if element is in filter without locking"""
+        self._refresh()
+        return super().check(s)
+
+    def check_many(self, keys: Iterable) -> List[bool]:
+        """Check every element of an iterable without locking"""
+        self._refresh()
+        return [ScalableBloom.check(self, s) for s in iter_keys(keys)]
+
+    def check_then_add(self, s: str) -> bool:
+        """Add element unless any process already added it"""
+        return self.check_then_add_many([s])[0]
+
+    def check_then_add_many(self, keys: Iterable) -> List[bool]:
+        """Check then add every element, holding the lock once per batch
+
+        Frozen subfilters are checked without the lock; the newest is
+        checked and updated under it, so exactly one of several processes
+        adding the same new element sees False.
+        """
+        keys = list(iter_keys(keys))
+        self._refresh()
+        frozen = self.blooms - 1
+        indexes_lists = [list(self._indexes(s)) for s in keys]
+        results = [
+            self._any_contains(indexes_list[:frozen], 0)
+            for indexes_list in indexes_lists
+        ]
+        if all(results):
+            return results
+
+        with self._lock():
+            self._refresh()
+            for i, s in enumerate(keys):
+                if results[i]:
+                    continue
+                indexes_list = indexes_lists[i]
+                if len(indexes_list) != self.blooms:
+                    indexes_list = list(self._indexes(s))
+                results[i] = self._any_contains(indexes_list[frozen:], frozen)
+                if not results[i]:
+                    self._add_indexes(indexes_list[-1])
+            self._write_state()
+        return results
+
+    def new_bloom(self) -> None:
+        """Add a subfilter, making it visible to every attached process"""
+        with self._lock():
+            self._refresh()
+            self._grow()
+        self._refresh()
+
+    def snapshot(self, path: str) -> None:
+        """Save filter to a ZIP file loadable by ScalableBloom
+
+        Subfilter files are read under the lock and compressed after it
+        is released. Instance state isn't touched, so this is safe to run
+        on a background thread, see save_async().
+        """
+        with self._lock():
+            generation, elements = self._read_state()
+            buffers = []
+            for bloom in range(generation):
+                with open(self._subfilter_path(bloom), "rb") as fp:
+                    buffers.append((f"bf_{bloom}.bin", fp.read()))
+
+        params = [self._subfilter_params(bloom) for bloom in range(generation)]
+        metadata = {
+            **self.metadata(),
+            "type": ScalableBloom.type,
+            "blooms": generation,
+            "elements": elements,
+            "threshold": sum(
+                int(bins * math.log(2) / hashes) for bins, hashes in params
+            ),
+            "bins_list": [bins for bins, _ in params],
+            "hashes": [hashes for _, hashes in params],
+        }
+        persist.write_zip(path, metadata, buffers)
+
+    def save_async(
+        self, path: str, executor: Optional[Executor] = None
+    ) -> Future:
+        """Run snapshot(path) on a background thread, returning a Future"""
+        executor = executor if executor is not None else persist.executor()
+        return executor.submit(self.snapshot, path)
+
+    def share(self) -> None:
+        """Memory-mapped filters are shared by opening the same name"""
+        raise BloomException(f"Open MMScalableBloom('{self.name}') instead")
+
+    def close(self) -> None:
+        """Unmap subfilters and close the lock file"""
+        for bf in getattr(self, "bfs", []):
+            bf.close()
+        self.bfs = []
+        self.blooms = 0
+        if hasattr(self, "state"):
+            self.state.close()
+            del self.state
+        if hasattr(self, "fp"):
+            self.fp.close()
+            del self.fp
+
+    def _add_indexes(self, indexes: list) -> None:
+        """Set bits in the newest subfilter and grow if it is full"""
+        bf = self.bfs[-1]
+        for byte_index, bit_index in indexes:
+            bf[byte_index] |= 1 << bit_index
+        self.elements += 1
+        if self.elements > self.threshold:
+            self._write_state()
+            self._grow()
+            self._refresh()
+
+    def _grow(self) -> None:
+        """Create the next subfilter file and publish it (lock held)
+
+        The file and manifest are written before the generation counter is
+        bumped, so processes never see a generation without its file.
+        """
+        generation, elements = self._read_state()
+        bins, hashes = self._subfilter_params(generation)
+        with open(self._subfilter_path(generation), "wb") as fp:
+            fp.truncate((bins // 8) + 1)
+
+        bins_list = [self._subfilter_params(i)[0] for i in range(generation)]
+        hashes_list = [self._subfilter_params(i)[1] for i in range(generation)]
+        manifest = {
+            "version": __version__,
+            "program": __program__,
+            "type": self.type,
+            **{param: getattr(self, param) for param in PARAMS},
+            "bins_list": bins_list + [bins],
+            "hashes": hashes_list + [hashes],
+        }
+        manifest_path = os.path.join(self.path, MANIFEST)
+        with open(f"{manifest_path}.tmp", "w") as fp:
+            json.dump(manifest, fp)
+        os.replace(f"{manifest_path}.tmp", manifest_path)
+
+        STATE_FORMAT.pack_into(self.state, 0, generation + 1, elements)
+
+    def _refresh(self) -> None:
+        """Map subfilters added by any process since the last call"""
+        generation, elements = self._read_state()
+        self.elements = elements
+        if generation == self.blooms:
+            return
+
+        for bloom in range(self.blooms, generation):
+            bins, hashes = self._subfilter_params(bloom)
+            with open(self._subfilter_path(bloom), "r+b") as fp:
+                self.bfs.append(mmap.mmap(fp.fileno(), 0))
+            self.bins_list.append(bins)
+            self.hashes.append(hashes)
+            self.blooms += 1
+            self.threshold += self._capacity(bloom)
+        self._clear_cache()
+
+    def _read_state(self) -> tuple:
+        """Read the generation counter and element count"""
+        return STATE_FORMAT.unpack_from(self.state, 0)
+
+    def _write_state(self) -> None:
+        """Publish the element count (lock held)"""
+        STATE_FORMAT.pack_into(self.state, 0, self.blooms, self.elements)
+
+    def _subfilter_path(self, bloom: int) -> str:
+        return os.path.join(self.path, f"bf_{bloom}.bin")
+
+    def _lock(self) -> ContextManager:
+        """Context manager for file locking"""
+        return FileLock(self.fp)
+
+    def __del__(self) -> None:
+        """Ensure proper cleanup of resources"""
+        self.close()
@@ -0,0 +1,248 @@
+from concurrent.futures import Executor
+from itertools import repeat
+import math
+import os
+from typing import Any, Callable, Iterable, List, Optional, Tuple
+
+from . import Bloom, BloomException
+from . import delta
+from .bloom import HASH_SCHEME, MERGE_CHUNK_SIZE
+from .keys import iter_keys, np
+
+
+class PartitionedBloom(Bloom):
+    """Bloom filter with a separate slice of bits per hash function
+
+    Hash i only sets bits in slice i, a contiguous range of slice_bins
+    bits, and the filter has the same total size and false positive rate
+    as a Bloom filter with the same capacity. Batch operations work one
+    slice at a time over the whole batch, so each pass hashes with one
+    seed and touches one slice in sorted order. Slices are disjoint, so
+    an executor can fill or check them in parallel without locking, and
+    check_many() only hashes the keys still present after each slice.
+    """
+
+    type = "partitioned bloom"
+
+    def __init__(self, **kwargs: Any) -> None:
+        path = kwargs.get("path", None)
+        super().__init__(**{**kwargs, "path": None})
+        self.type = "partitioned bloom"
+        self.path = path
+        if self.hash_scheme != HASH_SCHEME:
+            raise BloomException(f"hash_scheme must be {HASH_SCHEME}")
+        if self.sparse_saturation is not None:
+            raise BloomException("sparse isn't supported by partitioned bloom")
+        if path is not None and os.path.isfile(path):
+            self.load(path)
+
+    def _init_bloom(self) -> None:
+        """Initialize new Partitioned Bloom filter properties"""
+        self.capacity = int(self.capacity)
+        bins, self.hashes, _ = self._dimensions(
+            self.capacity, self.error_ratio, self.power_of_two
+        )
+        self.slice_bins = bins // self.hashes
+        self._init_slices()
+        self.bf = bytearray(b"\0" * self.bytes)
+
+    @classmethod
+    def _dimensions(
+        cls, capacity: int, error_ratio: float, power_of_two: bool = False
+    ) -> Tuple[int, int, int]:
+        """Calculate bins, hashes and buffer bytes of a new filter"""
+        hashes = cls._hashes(error_ratio)
+        # m / k bits per slice, for m = k * n / ln(2) bits in total
+        slice_bins = capacity / math.log(2)
+        if power_of_two:
+            slice_bins = cls._power_of_two(slice_bins)
+            slice_bytes = slice_bins // 8
+        else:
+            slice_bins = int(math.ceil(slice_bins))
+            slice_bytes = (slice_bins // 8) + 1
+        return slice_bins * hashes, hashes, slice_bytes * hashes
+
+    def _init_slices(self) -> None:
+        """Set bins and byte sizes from slice_bins and hashes"""
+        self.bins = self.slice_bins * self.hashes
+        if self.power_of_two:
+            self.slice_bytes = self.slice_bins // 8
+        else:
+            self.slice_bytes = (self.slice_bins // 8) + 1
+        self.bytes = self.slice_bytes * self.hashes
+
+    def add_many(
+        self, keys: Iterable, executor: Optional[Executor] = None
+    ) -> None:
+        """Add every element, one slice at a time
+
+        With an executor, slices are filled in parallel by its workers.
+        """
+        if self.locks is not None:
+            super().add_many(keys)
+            return
+        keys = [self._utf8(s) for s in iter_keys(keys)]
+        if keys:
+            self._map_slices(self._add_slice, keys, executor)
+
+    def check_many(
+        self, keys: Iterable, executor: Optional[Executor] = None
+    ) -> List[bool]:
+        """Check every element, one slice at a time
+
+        Without an executor, each slice only hashes the elements found in
+        every slice before it. With one, slices are checked in parallel.
+        """
+        keys = [self._utf8(s) for s in iter_keys(keys)]
+        if not keys:
+            return []
+        if executor is not None:
+            columns = self._map_slices(self._check_slice, keys, executor)
+            return [all(column) for column in zip(*columns)]
+
+        present = list(range(len(keys)))
+        for i in range(self.hashes):
+            found = self._check_slice(i, [keys[j] for j in present])
+            present = [j for j, bit in zip(present, found) if bit]
+            if not present:
+                break
+        results = [False] * len(keys)
+        for j in present:
+            results[j] = True
+        return results
+
+    def fold(self, times: int = 1) -> None:
+        """Halve every slice of a power-of-two filter, see Bloom.fold()"""
+        if not self.power_of_two:
+            raise BloomException("fold() requires power_of_two=True")
+        if self.slice_bins >> times < 8:
+            raise BloomException(
+                f"Can't fold {self.slice_bins} bins per slice {times} times"
+            )
+        if not isinstance(self.bf, bytearray):
+            raise BloomException("Can't fold a shared or external buffer")
+
+        for _ in range(times):
+            half = self.slice_bytes // 2
+            folded = bytearray(half * self.hashes)
+            for i in range(self.hashes):
+                lower = i * self.slice_bytes
+                for start in range(0, half, MERGE_CHUNK_SIZE):
+                    end = min(start + MERGE_CHUNK_SIZE, half)
+                    merged = int.from_bytes(
+                        self.bf[lower + start : lower + end], "little"
+                    )
+                    merged |= int.from_bytes(
+                        self.bf[lower + half + start : lower + half + end],
+                        "little",
+                    )
+                    folded[i * half + start : i * half + end] = (
+                        merged.to_bytes(end - start, "little")
+                    )
+            self.bf = folded
+            self.slice_bins //= 2
+            self._init_slices()
+
+        self._resized = True
+        self._clear_cache()
+
+    def metadata(self) -> dict:
+        """Parameters needed to rebuild the filter around its buffer"""
+        return {**super().metadata(), "slice_bins": self.slice_bins}
+
+    def __str__(self) -> str:
+        return (
+            f"Partitioned Bloom filter with {self.hashes} slices of "
+            f"{self.slice_bins} bits"
+        )
+
+    def _load_metadata(self, metadata: dict) -> None:
+        """Set parameters from metadata written by metadata()"""
+        super()._load_metadata(metadata)
+        self.slice_bins = metadata["slice_bins"]
+        self._init_slices()
+
+    def _hash_indexes(self, s: str):
+        """Find array of tuple bloom indexes for input string"""
+        s = self._utf8(s)
+        for i in range(self.hashes):
+            index = self._slice_index(self._hash(s, seed=i))
+            yield (i * self.slice_bytes + (index >> 3), index & 7)
+
+    def _bit_indexes(self, digests: Any) -> Any:
+        """Bit indexes of a NumPy array of digests, a column per hash"""
+        offsets = np.arange(self.hashes, dtype=np.int64) * self.slice_bytes
+        return self._slice_index(digests) + offsets * 8
+
+    def _row_indexes(self, row: List[int]) -> List[int]:
+        """Bit indexes of the digests of one element"""
+        slice_bits = self.slice_bytes * 8
+        return [
+            i * slice_bits + self._slice_index(digest)
+            for i, digest in enumerate(row)
+        ]
+
+    def _slice_index(self, digest: Any) -> Any:
+        """Bit index within a slice of a digest or NumPy array of them"""
+        if self.power_of_two:
+            return digest & (self.slice_bins - 1)
+        return digest % self.slice_bins
+
+    def _slice_indexes(self, i: int, keys: List[Any]) -> Any:
+        """Sorted bit indexes within slice i of normalized keys"""
+        digests = [self._hash(s, i) for s in keys]
+        if np is not None:
+            return np.sort(self._slice_index(np.array(digests, np.int64)))
+        return sorted(self._slice_index(digest) for digest in digests)
+
+    def _add_slice(self, i: int, keys: List[Any]) -> None:
+        """Set the bits of every key in slice i"""
+        indexes = self._slice_indexes(i, keys)
+        start = i * self.slice_bytes
+        if np is not None:
+            view = np.frombuffer(self.bf, dtype=np.uint8)
+            np.bitwise_or.at(
+                view[start : start + self.slice_bytes],
+                indexes >> 3,
+                (1 << (indexes & 7)).astype(np.uint8),
+            )
+            del view
+            first, last = int(indexes[0]), int(indexes[-1])
+        else:
+            bf = self.bf
+            for index in indexes:
+                bf[start + (index >> 3)] |= 1 << (index & 7)
+            first, last = indexes[0], indexes[-1]
+        self._dirty.update(
+            range(
+                (start + (first >> 3)) // delta.CHUNK_SIZE,
+                (start + (last >> 3)) // delta.CHUNK_SIZE + 1,
+            )
+        )
+
+    def _check_slice(self, i: int, keys: List[Any]) -> List[bool]:
+        """Check the bit of every key in slice i, in key order"""
+        digests = [self._hash(s, i) for s in keys]
+        start = i * self.slice_bytes
+        if np is not None and digests:
+            indexes = self._slice_index(np.array(digests, np.int64))
+            view = np.frombuffer(self.bf, dtype=np.uint8)
+            found = (view[start + (indexes >> 3)] >> (indexes & 7)) & 1
+            del view
+            return found.astype(bool).tolist()
+        bf = self.bf
+        return [
+            bool((bf[start + (index >> 3)] >> (index & 7)) & 1)
+            for index in map(self._slice_index, digests)
+        ]
+
+    def _map_slices(
+        self,
+        fn: Callable[[int, List[Any]], Any],
+        keys: List[Any],
+        executor: Optional[Executor],
+    ) -> list:
+        """Call fn(i, keys) for every slice, on an executor if given"""
+        if executor is None:
+            return [fn(i, keys) for i in range(self.hashes)]
+        return list(executor.map(fn, range(self.hashes), repeat(keys)))
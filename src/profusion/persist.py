@@ -0,0 +1,267 @@
+from concurrent.futures import ThreadPoolExecutor
+import contextlib
+import json
+import os
+import threading
+from typing import (
+    Any,
+    BinaryIO,
+    Callable,
+    Dict,
+    Iterator,
+    List,
+    Optional,
+    Tuple,
+)
+import zipfile
+import zlib
+
+from . import __program__
+
+
+SAVE_WORKERS = 1
+CHECKPOINT_INTERVAL = 60.0
+CHECKSUM_CHUNK_SIZE = 1 << 20  # 1MiB
+CHECKSUMS = "checksums.json"
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def executor() -> ThreadPoolExecutor:
+    """Shared executor running background saves"""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=SAVE_WORKERS, thread_name_prefix="profusion-save"
+            )
+        return _executor
+
+
+@contextlib.contextmanager
+def atomic_file(path: str) -> Iterator[BinaryIO]:
+    """Open a file that replaces path once written and synced
+
+    It is written under a temporary name unique to the process and
+    thread, then renamed over path, so readers see either the old or the
+    new file. The temporary file is removed if writing fails.
+    """
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with open(tmp_path, "wb") as fp:
+            yield fp
+            fp.flush()
+            os.fsync(fp.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.isfile(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def write_zip(
+    path: str, metadata: dict, buffers: List[Tuple[str, Any]]
+) -> None:
+    """Write metadata.json and named buffers to a ZIP file atomically
+
+    See atomic_file(). A crc32 of every chunk of every buffer is stored
+    in checksums.json.
+    """
+    with atomic_file(path) as fp:
+        with zipfile.ZipFile(fp, "w", zipfile.ZIP_DEFLATED) as zf:
+            zf.writestr("metadata.json", json.dumps(metadata))
+            entries = {}
+            for name, buffer in buffers:
+                zf.writestr(name, buffer)
+                entries[name] = chunk_checksums(buffer)
+            zf.writestr(CHECKSUMS, json.dumps(checksums_json(entries)))
+
+
+def chunk_checksums(buffer: Any) -> List[int]:
+    """crc32 of every CHECKSUM_CHUNK_SIZE chunk of a buffer"""
+    view = memoryview(buffer).cast("B")
+    return [
+        zlib.crc32(view[start : start + CHECKSUM_CHUNK_SIZE])
+        for start in range(0, len(view), CHECKSUM_CHUNK_SIZE)
+    ]
+
+
+def checksums_json(entries: Dict[str, List[int]]) -> dict:
+    """Contents of checksums.json for chunk checksums of ZIP entries"""
+    return {
+        "algorithm": "crc32",
+        "chunk_size": CHECKSUM_CHUNK_SIZE,
+        "entries": entries,
+    }
+
+
+def read_metadata(path: str) -> dict:
+    """Read metadata.json from a saved filter without reading its buffers"""
+    try:
+        with zipfile.ZipFile(path, "r") as zf:
+            metadata = json.loads(zf.read("metadata.json"))
+    except (KeyError, ValueError, zipfile.BadZipFile) as e:
+        raise _invalid(f"Invalid file format '{path}': {e}")
+    if metadata.get("program") != __program__:
+        raise _invalid(f"Unrecognized file format '{path}'")
+    return metadata
+
+
+def read_checksums(zf: zipfile.ZipFile) -> Optional[dict]:
+    """Read checksums.json, or None for files saved without one"""
+    if CHECKSUMS not in zf.namelist():
+        return None
+    checksums = json.loads(zf.read(CHECKSUMS))
+    if checksums.get("algorithm") != "crc32":
+        raise _invalid(f"Unknown checksum {checksums.get('algorithm')}")
+    return checksums
+
+
+def read_buffer(
+    zf: zipfile.ZipFile, name: str, checksums: Optional[dict] = None
+) -> bytearray:
+    """Read a ZIP entry, verifying chunk checksums if given
+
+    Chunks are checked as they are decompressed, so corruption is
+    reported without reading the rest of the entry.
+    """
+    expected = None
+    if checksums is not None:
+        expected = checksums["entries"].get(name)
+        chunk_size = checksums["chunk_size"]
+    if expected is None:
+        chunk_size = CHECKSUM_CHUNK_SIZE
+
+    buffer = bytearray(zf.getinfo(name).file_size)
+    offset = 0
+    try:
+        with zf.open(name) as fp:
+            for chunk in iter(lambda: fp.read(chunk_size), b""):
+                i = offset // chunk_size
+                if expected is not None and (
+                    i >= len(expected) or zlib.crc32(chunk) != expected[i]
+                ):
+                    raise _invalid(f"Checksum mismatch in {name} chunk {i}")
+                buffer[offset : offset + len(chunk)] = chunk
+                offset += len(chunk)
+    except (zipfile.BadZipFile, zlib.error, EOFError) as e:
+        raise _invalid(f"Corrupt {name}: {e}")
+    if offset != len(buffer):
+        raise _invalid(f"Truncated {name}")
+    return buffer
+
+
+def verify(path: str) -> bool:
+    """Check every chunk checksum of a saved filter, raising on mismatch
+
+    Returns False for files saved without checksums.
+    """
+    try:
+        with zipfile.ZipFile(path, "r") as zf:
+            checksums = read_checksums(zf)
+            if checksums is None:
+                return False
+            for name in checksums["entries"]:
+                read_buffer(zf, name, checksums)
+    except (KeyError, zipfile.BadZipFile) as e:
+        raise _invalid(f"Invalid file format '{path}': {e}")
+    return True
+
+
+def inspect(path: str, verify_checksums: bool = False) -> dict:
+    """Type and parameters of a saved filter, from metadata.json only
+
+    Buffer sizes come from the ZIP directory, so nothing is decompressed
+    unless verify_checksums is True.
+    """
+    metadata = read_metadata(path)
+    with zipfile.ZipFile(path, "r") as zf:
+        names = zf.namelist()
+        metadata["entries"] = {
+            info.filename: {
+                "size": info.file_size,
+                "compressed_size": info.compress_size,
+            }
+            for info in zf.infolist()
+            if info.filename.endswith(".bin")
+        }
+    metadata["checksums"] = CHECKSUMS in names
+    if verify_checksums and not verify(path):
+        raise _invalid(f"'{path}' has no checksums")
+    return metadata
+
+
+def _invalid(message: str) -> Exception:
+    from .bloom import BloomException
+
+    return BloomException(message)
+
+
+class Checkpointer:
+    """Background thread calling save_async() on a filter periodically
+
+    Each save completes before the next interval starts, so saves never
+    overlap. Errors are passed to on_error if given and kept in
+    last_error; the checkpointer carries on either way.
+    """
+
+    def __init__(
+        self,
+        bloom: Any,
+        interval: float = CHECKPOINT_INTERVAL,
+        path: Optional[str] = None,
+        on_error: Optional[Callable[[BaseException], None]] = None,
+    ) -> None:
+        if interval <= 0:
+            raise ValueError("interval must be > 0")
+        self.bloom = bloom
+        self.interval = interval
+        self.path = path
+        self.on_error = on_error
+        self.saves = 0
+        self.last_error: Optional[BaseException] = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> "Checkpointer":
+        """Start saving every interval seconds"""
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(
+                target=self._run, name="profusion-checkpointer", daemon=True
+            )
+            self._thread.start()
+        return self
+
+    def stop(self, save: bool = True) -> None:
+        """Stop the thread, saving once more first if save is True"""
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+        if save:
+            self.save()
+
+    def save(self) -> bool:
+        """Save now, waiting on the calling thread; True on success"""
+        try:
+            self.bloom.save_async(self.path).result()
+        except Exception as e:
+            self.last_error = e
+            if self.on_error is not None:
+                self.on_error(e)
+            return False
+        self.saves += 1
+        return True
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            self.save()
+
+    def __enter__(self) -> "Checkpointer":
+        return self.start()
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        self.stop()
@@ -0,0 +1,212 @@
+import math
+import time
+from typing import Any, List, NamedTuple, Optional
+
+from . import Bloom, BloomException, CountingBloom, ScalableBloom
+from . import PartitionedBloom
+from .bloom import ERROR_RATIO
+from .counting_bloom import BIN_SIZE
+from .scalable_bloom import (
+    ERROR_DECAY_RATE,
+    GROWTH_FACTOR,
+    INITIAL_SIZE,
+    MAX_ERROR,
+    subfilter_params,
+)
+
+
+# Workloads: "add" and "check" heavy, "mixed", "count" (needs counts) and
+# "grow" (capacity unknown in advance)
+WORKLOADS = ("mixed", "add", "check", "count", "grow")
+BENCHMARK_KEYS = 20000
+BENCHMARK_CAPACITY = 1 << 20
+# Error ratios tried when fitting a budget: 1/2, 1/4, ... 2**-MAX_HASHES
+MAX_HASHES = 64
+
+
+class Plan(NamedTuple):
+    """Recommended filter for a capacity, error ratio and memory budget"""
+
+    type: str
+    params: dict
+    capacity: int
+    bytes: int
+    error_ratio: float
+    ops_per_second: Optional[dict]
+
+    def build(self) -> Bloom:
+        """Create the planned filter, see Bloom.from_plan()"""
+        return Bloom.from_plan(self)
+
+
+def plan(
+    capacity: Optional[int] = None,
+    error_ratio: Optional[float] = None,
+    max_bytes: Optional[int] = None,
+    workload: str = "mixed",
+    benchmark: bool = True,
+) -> Plan:
+    """Pick a filter type and parameters, predicting memory and FPR
+
+    Any two of capacity, error_ratio and max_bytes fix the third: a
+    missing capacity is the most that fits in max_bytes, and a missing
+    error_ratio the lowest power of two that does. When all three are
+    given and the filter doesn't fit, error_ratio is relaxed until it
+    does; the returned error_ratio is the predicted false positive rate
+    at capacity either way. With benchmark, each candidate type is timed
+    on this machine with BENCHMARK_KEYS keys and the fastest for the
+    workload is recommended.
+    """
+    if workload not in WORKLOADS:
+        raise BloomException(f"workload must be in {WORKLOADS}")
+    if capacity is not None and capacity <= 0:
+        raise BloomException("capacity must be > 0")
+    if error_ratio is not None and not 0 < error_ratio < 1:
+        raise BloomException("error_ratio must be between 0 and 1")
+    if max_bytes is not None and max_bytes <= 0:
+        raise BloomException("max_bytes must be > 0")
+
+    if workload == "grow":
+        plans = [_plan_scalable(capacity, error_ratio, max_bytes)]
+    else:
+        if capacity is None and max_bytes is None:
+            raise BloomException("capacity or max_bytes is required")
+        types = ["counting bloom"] if workload == "count" else ["bloom"]
+        if workload != "count":
+            types.append(PartitionedBloom.type)
+        plans = [
+            _plan_fixed(bloom_type, capacity, error_ratio, max_bytes)
+            for bloom_type in types
+        ]
+
+    if not benchmark:
+        return plans[0]
+    plans = [p._replace(ops_per_second=_benchmark(p)) for p in plans]
+    return max(plans, key=lambda p: _score(p.ops_per_second, workload))
+
+
+def _plan_fixed(
+    bloom_type: str,
+    capacity: Optional[int],
+    error_ratio: Optional[float],
+    max_bytes: Optional[int],
+) -> Plan:
+    """Plan a fixed-capacity filter of a given type"""
+    if error_ratio is None:
+        error_ratios = [ERROR_RATIO]
+        if capacity is not None and max_bytes is not None:
+            # Lowest error ratio that fits
+            error_ratios = [0.5**k for k in range(MAX_HASHES, 0, -1)]
+    else:
+        # Requested ratio first, then relaxed ones if it doesn't fit
+        error_ratios = [error_ratio] + [
+            0.5**k for k in range(MAX_HASHES, 0, -1) if 0.5**k > error_ratio
+        ]
+
+    for ratio in error_ratios:
+        n = capacity
+        if n is None:
+            n = _max_capacity(bloom_type, ratio, max_bytes)
+            if n == 0:
+                continue
+        size = _size(bloom_type, n, ratio)
+        if max_bytes is None or size <= max_bytes:
+            break
+    else:
+        raise BloomException(f"No {bloom_type} fits in {max_bytes} bytes")
+
+    bins, hashes, _ = Bloom._filter_class(bloom_type)._dimensions(n, ratio)
+    params = {"capacity": n, "error_ratio": ratio}
+    if bloom_type == CountingBloom.type:
+        params["bin_size"] = BIN_SIZE
+    return Plan(bloom_type, params, n, size, _fpr(bins, hashes, n), None)
+
+
+def _plan_scalable(
+    capacity: Optional[int],
+    error_ratio: Optional[float],
+    max_bytes: Optional[int],
+) -> Plan:
+    """Plan a ScalableBloom, sized for capacity or for max_bytes"""
+    if capacity is None and max_bytes is None:
+        capacity = 0
+    params = {
+        "max_error": error_ratio if error_ratio is not None else MAX_ERROR,
+        "error_decay_rate": ERROR_DECAY_RATE,
+        "initial_size": INITIAL_SIZE,
+        "growth_factor": GROWTH_FACTOR,
+    }
+    size = threshold = 0
+    i = 0
+    while True:
+        bins, hashes = subfilter_params(i, **params)
+        subfilter_bytes = (bins // 8) + 1
+        if max_bytes is not None and size + subfilter_bytes > max_bytes:
+            break
+        size += subfilter_bytes
+        threshold += int(bins * math.log(2) / hashes)
+        i += 1
+        if capacity is not None and threshold >= capacity:
+            break
+
+    if size == 0 or (capacity is not None and threshold < capacity):
+        raise BloomException(f"No scalable bloom fits in {max_bytes} bytes")
+    # Subfilters at their own thresholds sum to at most max_error
+    initial_error = (1.0 - ERROR_DECAY_RATE) * params["max_error"]
+    fpr = sum(initial_error * ERROR_DECAY_RATE**j for j in range(i))
+    return Plan(ScalableBloom.type, params, threshold, size, fpr, None)
+
+
+def _size(bloom_type: str, capacity: int, error_ratio: float) -> int:
+    """Bytes used by a fixed-capacity filter"""
+    bins, _, size = Bloom._filter_class(bloom_type)._dimensions(
+        capacity, error_ratio
+    )
+    if bloom_type == CountingBloom.type:
+        return bins * len(CountingBloom._int2bytes(BIN_SIZE))
+    return size
+
+
+def _max_capacity(bloom_type: str, error_ratio: float, max_bytes: int) -> int:
+    """Largest capacity fitting in max_bytes, or 0 if none does"""
+    low, high = 0, max_bytes * 8
+    while low < high:
+        middle = (low + high + 1) // 2
+        if _size(bloom_type, middle, error_ratio) <= max_bytes:
+            low = middle
+        else:
+            high = middle - 1
+    return low
+
+
+def _fpr(bins: int, hashes: int, capacity: int) -> float:
+    """False positive rate of a filter holding capacity elements"""
+    return (1.0 - math.exp(-hashes * capacity / bins)) ** hashes
+
+
+def _benchmark(plan: Plan) -> dict:
+    """Elements per second added and checked in batches by a small filter"""
+    params = dict(plan.params)
+    if "capacity" in params:
+        params["capacity"] = min(params["capacity"], BENCHMARK_CAPACITY)
+    bloom = Bloom.from_plan(plan._replace(params=params))
+    keys: List[Any] = [f"key_{i}" for i in range(BENCHMARK_KEYS)]
+
+    start = time.perf_counter()
+    bloom.add_many(keys[: BENCHMARK_KEYS // 2])
+    add = time.perf_counter() - start
+    start = time.perf_counter()
+    bloom.check_many(keys)
+    check = time.perf_counter() - start
+    return {
+        "add": BENCHMARK_KEYS // 2 / max(add, 1e-9),
+        "check": BENCHMARK_KEYS / max(check, 1e-9),
+    }
+
+
+def _score(ops_per_second: dict, workload: str) -> float:
+    """Throughput of a workload's mix of adds and checks"""
+    if workload in ("add", "check"):
+        return ops_per_second[workload]
+    # Mixed workloads: one add per check
+    return 2 / (1 / ops_per_second["add"] + 1 / ops_per_second["check"])
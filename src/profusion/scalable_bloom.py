@@ -1,11 +1,17 @@
 import json
 import os
 import math
-from typing import Any, List
+from typing import Any, Iterable, List, Tuple
 import zipfile
 
 from . import __version__, __program__
 from . import Bloom, BloomException
+from . import delta
+from . import persist
+from . import shared
+from .bloom import HASH_SCHEME, popcount
+from .sparse import SparseBits, dense
+from .keys import iter_keys
 
 
 MAX_ERROR = 1e-15
@@ -14,11 +20,38 @@ INITIAL_SIZE = 128 << 10  # 16KiB
 GROWTH_FACTOR = 4
 
 
+def subfilter_params(
+    bloom: int,
+    max_error: float,
+    error_decay_rate: float,
+    initial_size: int,
+    growth_factor: float,
+) -> Tuple[int, int]:
+    """Calculate bins and hashes of the subfilter at position bloom"""
+    bins = int(initial_size * growth_factor**bloom)
+    initial_error = (1.0 - error_decay_rate) * max_error
+    error = initial_error * error_decay_rate**bloom
+    return bins, Bloom._hashes(error)
+
+
 class ScalableBloom(Bloom):
     """Scalable Bloom filter implementation"""
 
+    type = "scalable bloom"
+
     def __init__(self, **kwargs: Any) -> None:
         super().__init__(**kwargs)
+        if self.locks is not None:
+            # Growth replaces the newest subfilter, which stripes can't guard
+            raise BloomException(
+                "thread_safe isn't supported by scalable bloom"
+            )
+        if self.power_of_two:
+            raise BloomException(
+                "power_of_two isn't supported by scalable bloom"
+            )
+        if self.hash_scheme != HASH_SCHEME:
+            raise BloomException(f"hash_scheme must be {HASH_SCHEME}")
         self.type = "scalable bloom"
         self.blooms = 0
         self.elements = 0
@@ -44,6 +77,9 @@ class ScalableBloom(Bloom):
         else:
             self.new_bloom()
 
+    def _init_bloom(self) -> None:
+        """Subfilters replace the base filter, see new_bloom()"""
+
     def _validate_params(self) -> None:
         """Validate initialization parameters"""
         if not 0 < self.max_error < 1:
@@ -57,43 +93,53 @@ class ScalableBloom(Bloom):
 
     def new_bloom(self) -> None:
         """Add new internal filter to scalable bloom filter"""
-        bins = int(self.initial_size * self.growth_factor**self.blooms)
-        error = self.initial_error * self.error_decay_rate**self.blooms
-        hashes = self._hashes(error)
-
+        bins, hashes = self._subfilter_params(self.blooms)
         bytes_count = (bins // 8) + 1
-        bf = bytearray(b"\0" * bytes_count)
+        if self.sparse_saturation is not None and self._shm is None:
+            bf = SparseBits(bytes_count)
+        else:
+            bf = bytearray(b"\0" * bytes_count)
+        if self._shm is not None:
+            # Processes attached earlier won't see this subfilter
+            segment = shared.create(bf)
+            self._shm.append(segment)
+            self._shm_owned.add(segment.name)
+            bf = segment.buf[:bytes_count]
         self.bfs.append(bf)
         self.bins_list.append(bins)
         self.hashes.append(hashes)
 
         self.blooms += 1
         self.threshold += self._capacity(self.blooms - 1)
+        self._clear_cache()
+
+    def _subfilter_params(self, bloom: int) -> Tuple[int, int]:
+        """Calculate bins and hashes of the subfilter at position bloom"""
+        return subfilter_params(
+            bloom,
+            self.max_error,
+            self.error_decay_rate,
+            self.initial_size,
+            self.growth_factor,
+        )
 
     def add(self, s: str) -> None:
         """Add element to filter"""
-        self.elements += 1
-        current_bloom = self.blooms - 1
-
-        indexes_list = self._indexes(s, current_bloom)
-        for indexes in indexes_list:
-            for byte_index, bit_index in indexes:
-                self.bfs[current_bloom][byte_index] |= 1 << bit_index
-
-        if self.elements > self.threshold:
-            self.new_bloom()
+        (indexes,) = self._indexes(s, self.blooms - 1)
+        self._add_indexes(indexes)
 
     def check(self, s: str) -> bool:
         """Check if element is in filter."""
-        indexes_list = list(self._indexes(s))
-        return any(
-            all(
-                (self.bfs[bloom][byte_index] >> bit_index) & 1
-                for byte_index, bit_index in indexes
-            )
-            for bloom, indexes in enumerate(indexes_list)
-            if indexes
-        )  # Only check non-empty index lists
+        return self._any_contains(list(self._indexes(s)), 0)
+
+    def add_many(self, keys: Iterable) -> None:
+        """Add every element of an iterable or NumPy array to filter"""
+        for s in iter_keys(keys):
+            self.add(s)
+
+    def check_many(self, keys: Iterable) -> List[bool]:
+        """Check every element of an iterable or NumPy array"""
+        return [self.check(s) for s in iter_keys(keys)]
 
     def check_then_add(self, s: str) -> bool:
         """If element isn't already in filter, add it"""
@@ -103,6 +149,25 @@ class ScalableBloom(Bloom):
         self.add(s)
         return False
 
+    def check_then_add_many(self, keys: Iterable) -> List[bool]:
+        """Check then add every element in order, returning the checks
+
+        Each element is hashed once for both, and a repeat of an element
+        earlier in the same batch is reported as present.
+        """
+        results = []
+        for s in iter_keys(keys):
+            indexes_list = list(self._indexes(s))
+            result = self._any_contains(indexes_list, 0)
+            if not result:
+                self._add_indexes(indexes_list[-1])
+            results.append(result)
+        return results
+
+    def merge(self, other: "ScalableBloom") -> None:
+        """Scalable filters can't be merged without breaking error bounds"""
+        raise BloomException("Scalable bloom filters cannot be merged")
+
     def save(self, path: str = None) -> None:
         if path is not None:
             self.path = path
@@ -110,58 +175,95 @@ class ScalableBloom(Bloom):
         if self.path is None:
             raise BloomException("No path specified")
 
-        metadata = {
-            "version": __version__,
-            "program": __program__,
-            "type": self.type,
-            "blooms": int(self.blooms),
-            "threshold": int(self.threshold),
-            "elements": int(self.elements),
-            "max_error": float(self.max_error),
-            "error_decay_rate": float(self.error_decay_rate),
-            "initial_size": int(self.initial_size),
-            "growth_factor": float(self.growth_factor),
-            "bins_list": self.bins_list,
-            "hashes": self.hashes,
-        }
+        self._wait_saved()
+        persist.write_zip(
+            self.path, self._base_metadata(), self._named_buffers()
+        )
 
-        with zipfile.ZipFile(self.path, "w", zipfile.ZIP_DEFLATED) as zf:
-            zf.writestr("metadata.json", json.dumps(metadata))
-            for i, bf in enumerate(self.bfs):
-                zf.writestr(f"bf_{i}.bin", bf)
+        self._reset_delta()
 
-    def load(self, path: str) -> None:
+    def load(self, path: str, verify: Any = True) -> None:
         if not os.path.isfile(path):
             raise BloomException(f"'{path}' must be a file")
 
+        self._wait_saved()
         with zipfile.ZipFile(path, "r") as zf:
             try:
                 metadata = json.loads(zf.read("metadata.json"))
                 if metadata["type"] != self.type:
                     raise BloomException(f"Invalid type: {metadata['type']}")
 
-                self.blooms = int(metadata["blooms"])
-                self.threshold = int(metadata["threshold"])
-                self.elements = int(metadata["elements"])
-                self.max_error = float(metadata["max_error"])
-                self.error_decay_rate = float(metadata["error_decay_rate"])
-                self.initial_size = int(metadata["initial_size"])
-                self.growth_factor = float(metadata["growth_factor"])
-                self.bins_list = metadata["bins_list"]
-                self.hashes = metadata["hashes"]
-
-                self.bfs = []
-                for i in range(self.blooms):
-                    self.bfs.append(bytearray(zf.read(f"bf_{i}.bin")))
+                self._load_metadata(metadata)
+                self.bfs = self._read_buffers(zf, verify)
             except KeyError as e:
                 raise BloomException(f"Invalid file format: missing {e}")
 
+        self._replay_delta(path, metadata)
+        self._sparsify()
+        self._clear_cache()
+        self._verify_lazily(path, verify)
         self.path = path
 
+    def metadata(self) -> dict:
+        """Parameters needed to rebuild the filter around its buffers"""
+        return {
+            "version": __version__,
+            "program": __program__,
+            "type": self.type,
+            "blooms": int(self.blooms),
+            "threshold": int(self.threshold),
+            "elements": int(self.elements),
+            "max_error": float(self.max_error),
+            "error_decay_rate": float(self.error_decay_rate),
+            "initial_size": int(self.initial_size),
+            "growth_factor": float(self.growth_factor),
+            "bins_list": self.bins_list,
+            "hashes": self.hashes,
+        }
+
+    def to_buffer(self) -> List[memoryview]:
+        """Zero-copy views of the subfilter buffers, made dense if sparse"""
+        self.bfs = [dense(bf) for bf in self.bfs]
+        return [memoryview(bf) for bf in self.bfs]
+
     def __contains__(self, s: str) -> bool:
         return self.check(s)
 
+    def _add_indexes(self, indexes: list) -> None:
+        """Set bits in the newest subfilter and grow if it is full"""
+        self.elements += 1
+        bloom = self.blooms - 1
+        bf = self.bfs[bloom]
+        for byte_index, bit_index in indexes:
+            bf[byte_index] |= 1 << bit_index
+            self._dirty.add((bloom, byte_index // delta.CHUNK_SIZE))
+        if self.sparse_saturation is not None:
+            self._densify()
+
+        if self.elements > self.threshold:
+            self.new_bloom()
+
+    def _any_contains(self, indexes_list: list, first: int) -> bool:
+        """Check index lists for the subfilters numbered from first"""
+        return any(
+            all(
+                (self.bfs[first + i][byte_index] >> bit_index) & 1
+                for byte_index, bit_index in indexes
+            )
+            for i, indexes in enumerate(indexes_list)
+            if indexes  # Only check non-empty index lists
+        )
+
     def _indexes(self, s: str, bloom: int = -1):
+        """Find list of index tuples, from the cache if enabled"""
+        if self.cache is None:
+            return self._hash_indexes(s, bloom)
+
+        # Cached entries hold the indexes for every subfilter
+        indexes_list = self._cached_indexes(s)
+        return indexes_list if bloom == -1 else indexes_list[bloom : bloom + 1]
+
+    def _hash_indexes(self, s: str, bloom: int = -1):
         """Find list of index tuples for bloom filter"""
         s = self._utf8(s)
         max_hashes = max(self.hashes) if self.hashes else 0
@@ -179,6 +281,76 @@ class ScalableBloom(Bloom):
                 for digest in digests[: self.hashes[i]]
             ]
 
+    def _densify(self) -> None:
+        """Make the newest subfilter dense once past sparse_saturation"""
+        bf = self.bfs[-1]
+        if (
+            isinstance(bf, SparseBits)
+            and bf.saturation() > self.sparse_saturation
+        ):
+            self.bfs[-1] = bf.to_bytearray()
+
+    def _load_metadata(self, metadata: dict) -> None:
+        """Set parameters from metadata written by metadata()"""
+        self.type = metadata["type"]
+        self.blooms = int(metadata["blooms"])
+        self.threshold = int(metadata["threshold"])
+        self.elements = int(metadata["elements"])
+        self.max_error = float(metadata["max_error"])
+        self.error_decay_rate = float(metadata["error_decay_rate"])
+        self.initial_size = int(metadata["initial_size"])
+        self.growth_factor = float(metadata["growth_factor"])
+        self.bins_list = metadata["bins_list"]
+        self.hashes = metadata["hashes"]
+        self.initial_error = (1.0 - self.error_decay_rate) * self.max_error
+
+    def _buffers(self) -> list:
+        """Buffers addressed by delta log chunks"""
+        return self.bfs
+
+    def _buffer_names(self) -> List[str]:
+        """Names of the buffers in saved ZIP files"""
+        return [f"bf_{i}.bin" for i in range(self.blooms)]
+
+    def _set_buffers(self, buffers: list) -> None:
+        """Replace the buffers returned by _buffers()"""
+        self.bfs = list(buffers)
+
+    def _wrap_buffers(self, buffers: Any) -> list:
+        """Byte views over the list of buffers passed to from_buffer()"""
+        if not isinstance(buffers, (list, tuple)):
+            buffers = [buffers]
+        return [memoryview(buffer).cast("B") for buffer in buffers]
+
+    def _dirty_chunks(self):
+        """Yield (bloom, offset, data) for every dirty chunk"""
+        for bloom, chunk in sorted(self._dirty):
+            bf = self.bfs[bloom]
+            offset = chunk * delta.CHUNK_SIZE
+            yield bloom, offset, bytes(bf[offset : offset + delta.CHUNK_SIZE])
+
+    def _delta_metadata(self) -> dict:
+        """Metadata recorded with each delta log frame"""
+        return {
+            "type": self.type,
+            "blooms": int(self.blooms),
+            "threshold": int(self.threshold),
+            "elements": int(self.elements),
+            "bins_list": self.bins_list,
+            "hashes": self.hashes,
+        }
+
+    def _apply_delta_metadata(self, metadata: dict) -> None:
+        """Restore counters and subfilters added since the base file"""
+        super()._apply_delta_metadata(metadata)
+        self.bins_list = metadata["bins_list"]
+        self.hashes = metadata["hashes"]
+        for bins in self.bins_list[self.blooms : metadata["blooms"]]:
+            self.bfs.append(bytearray(b"\0" * ((bins // 8) + 1)))
+        self.blooms = metadata["blooms"]
+        self.threshold = metadata["threshold"]
+        self.elements = metadata["elements"]
+
     def _capacity(self, bloom: int = -1) -> int:
         """Calculate maximum number of elements a bloom can accommodate"""
         log2 = math.log(2)
@@ -200,6 +372,6 @@ class ScalableBloom(Bloom):
         total_bits = sum(self.bins_list[i] for i in range(begin, end))
         set_bits = 0
         for i in range(begin, end):
-            set_bits += sum(bin(byte).count("1") for byte in self.bfs[i])
+            set_bits += popcount(self.bfs[i])
 
         return set_bits / total_bits
@@ -0,0 +1,61 @@
+from multiprocessing import resource_tracker, shared_memory
+from typing import Any, List, NamedTuple
+
+
+class BloomHandle(NamedTuple):
+    """Picklable reference to a filter whose buffers are in shared memory"""
+
+    names: List[str]
+    sizes: List[int]
+    metadata: dict
+
+    def attach(self) -> Any:
+        """Map the filter in this process without copying its buffers"""
+        from .bloom import Bloom
+
+        return Bloom.attach(self)
+
+
+def create(buffer: Any) -> shared_memory.SharedMemory:
+    """Create a shared memory segment holding a copy of buffer"""
+    size = len(buffer)
+    segment = shared_memory.SharedMemory(create=True, size=max(1, size))
+    segment.buf[:size] = buffer
+    return segment
+
+
+def attach(name: str) -> shared_memory.SharedMemory:
+    """Attach to a segment without letting this process unlink it on exit"""
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:  # Python < 3.13 tracks every attached segment
+        pass
+
+    # Skip registration rather than unregistering afterwards, which would
+    # also drop the creating process's registration in a shared tracker
+    register = resource_tracker.register
+    resource_tracker.register = _register_unless_shared_memory
+    try:
+        return shared_memory.SharedMemory(name=name)
+    finally:
+        resource_tracker.register = register
+
+
+def release(
+    views: List[memoryview], segments: List[shared_memory.SharedMemory]
+) -> None:
+    """Release views of segments, then close the segments"""
+    for view in views:
+        view.release()
+    for segment in segments:
+        segment.close()
+
+
+def _register_unless_shared_memory(name: str, rtype: str) -> None:
+    if rtype != "shared_memory":
+        resource_tracker._resource_tracker.register(name, rtype)
+
+
+def attach_handle(handle: BloomHandle) -> Any:
+    """Unpickle a shared filter by attaching to its handle"""
+    return handle.attach()
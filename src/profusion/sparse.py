@@ -0,0 +1,207 @@
+from array import array
+from bisect import bisect_left
+from typing import Any, Dict, List, Union
+
+from .keys import np
+
+
+# Saturation up to which sparse buffers are kept: 2-byte offsets then use
+# at most half the memory of a dense buffer holding one bit per bin
+SPARSE_SATURATION = 1 / 32
+# Bits per container: offsets within one fit in 16 bits
+CONTAINER_SHIFT = 16
+CONTAINER_BITS = 1 << CONTAINER_SHIFT
+CONTAINER_BYTES = CONTAINER_BITS >> 3
+BYTE_SHIFT = CONTAINER_SHIFT - 3
+
+
+class SparseBits:
+    """Zero-filled byte buffer storing only the positions of its set bits
+
+    Bit b of byte i is position 8 * i + b, as in a Bloom buffer. Positions
+    are grouped into containers of CONTAINER_BITS bits, each a sorted array
+    of 16-bit offsets that only exists while one of its bits is set, so a
+    mostly empty buffer costs about 2 bytes per set bit and an insert only
+    shifts its own container. Supports the byte indexing and contiguous
+    slicing filters use on a bytearray, but not the buffer protocol: use
+    to_bytearray() for NumPy, shared memory and memoryviews.
+    """
+
+    def __init__(self, size: int) -> None:
+        self.size = size
+        self.count = 0
+        self.containers: Dict[int, array] = {}
+
+    @classmethod
+    def from_buffer(cls, buffer: Any) -> "SparseBits":
+        """Copy the set bits of a dense buffer"""
+        bits = cls(len(buffer))
+        view = memoryview(buffer).cast("B")
+        empty = bytes(CONTAINER_BYTES)
+        for start in range(0, len(view), CONTAINER_BYTES):
+            chunk = view[start : start + CONTAINER_BYTES]
+            if chunk != empty[: len(chunk)]:
+                offsets = array("H", set_bits(chunk))
+                bits.containers[start >> BYTE_SHIFT] = offsets
+                bits.count += len(offsets)
+        return bits
+
+    def to_bytearray(self) -> bytearray:
+        """Dense copy of the buffer"""
+        return self._dense(0, self.size)
+
+    def saturation(self) -> float:
+        """Proportion of the buffer's bits that are set"""
+        return self.count / float(self.size * 8)
+
+    def __len__(self) -> int:
+        return self.size
+
+    def __bytes__(self) -> bytes:
+        return bytes(self.to_bytearray())
+
+    def __eq__(self, other: Any) -> bool:
+        if isinstance(other, SparseBits):
+            return (self.size, self.containers) == (
+                other.size,
+                other.containers,
+            )
+        if isinstance(other, (bytes, bytearray, memoryview)):
+            return self.to_bytearray() == other
+        return NotImplemented
+
+    def __getitem__(self, key: Union[int, slice]) -> Any:
+        if isinstance(key, slice):
+            start, stop = self._slice(key)
+            return bytes(self._dense(start, stop))
+
+        index = self._index(key)
+        offsets = self.containers.get(index >> BYTE_SHIFT)
+        if offsets is None:
+            return 0
+        base = (index << 3) & (CONTAINER_BITS - 1)
+        i = bisect_left(offsets, base)
+        value = 0
+        while i < len(offsets) and offsets[i] < base + 8:
+            value |= 1 << (offsets[i] - base)
+            i += 1
+        return value
+
+    def __setitem__(self, key: Union[int, slice], value: Any) -> None:
+        if isinstance(key, slice):
+            start, stop = self._slice(key)
+            if len(value) != stop - start:
+                raise ValueError("SparseBits can't be resized")
+            positions = set_bits(memoryview(value).cast("B"), start << 3)
+            self._replace(start << 3, stop << 3, positions)
+            return
+
+        if not 0 <= value < 256:
+            raise ValueError("byte must be in range(0, 256)")
+        index = self._index(key)
+        container = index >> BYTE_SHIFT
+        base = (index << 3) & (CONTAINER_BITS - 1)
+        new = [base + b for b in range(8) if (value >> b) & 1]
+        self._set_offsets(container, base, base + 8, new)
+
+    def _replace(self, begin: int, end: int, positions: List[int]) -> None:
+        """Set exactly the sorted positions in bits begin to end"""
+        i = 0
+        for container in range(
+            begin >> CONTAINER_SHIFT, ((end - 1) >> CONTAINER_SHIFT) + 1
+        ):
+            base = container << CONTAINER_SHIFT
+            j = bisect_left(positions, base + CONTAINER_BITS, i)
+            self._set_offsets(
+                container,
+                max(begin, base) - base,
+                min(end, base + CONTAINER_BITS) - base,
+                [position - base for position in positions[i:j]],
+            )
+            i = j
+
+    def _set_offsets(
+        self, container: int, low: int, high: int, new: List[int]
+    ) -> None:
+        """Replace the offsets from low to high of a container with new"""
+        offsets = self.containers.get(container)
+        if offsets is None:
+            if new:
+                self.containers[container] = array("H", new)
+                self.count += len(new)
+            return
+        i = bisect_left(offsets, low)
+        j = bisect_left(offsets, high, i)
+        if j - i == len(new) and offsets[i:j].tolist() == new:
+            return
+        offsets[i:j] = array("H", new)
+        self.count += len(new) - (j - i)
+        if not offsets:
+            del self.containers[container]
+
+    def _dense(self, start: int, stop: int) -> bytearray:
+        """Dense copy of bytes start to stop"""
+        out = bytearray(stop - start)
+        if stop <= start:
+            return out
+        begin, end = start << 3, stop << 3
+        for container in range(
+            begin >> CONTAINER_SHIFT, ((end - 1) >> CONTAINER_SHIFT) + 1
+        ):
+            offsets = self.containers.get(container)
+            if offsets is None:
+                continue
+            # Offsets relative to bit begin, kept if within the slice
+            base = (container << CONTAINER_SHIFT) - begin
+            i = bisect_left(offsets, max(0, -base))
+            j = bisect_left(offsets, end - begin - base, i)
+            if np is not None and j - i > 64:
+                bits = np.frombuffer(offsets[i:j], np.uint16) + np.int64(base)
+                view = np.frombuffer(out, np.uint8)
+                np.bitwise_or.at(
+                    view, bits >> 3, (1 << (bits & 7)).astype(np.uint8)
+                )
+                del view
+                continue
+            for offset in offsets[i:j]:
+                position = base + offset
+                out[position >> 3] |= 1 << (position & 7)
+        return out
+
+    def _index(self, index: int) -> int:
+        """Non-negative byte index, as bytearray indexing allows"""
+        if index < 0:
+            index += self.size
+        if not 0 <= index < self.size:
+            raise IndexError("SparseBits index out of range")
+        return index
+
+    def _slice(self, key: slice) -> tuple:
+        """Start and stop of a contiguous slice"""
+        start, stop, step = key.indices(self.size)
+        if step != 1:
+            raise ValueError("SparseBits only supports contiguous slices")
+        return start, max(start, stop)
+
+
+def set_bits(buffer: Any, offset: int = 0) -> List[int]:
+    """Sorted positions of the bits set in a buffer, plus offset"""
+    if np is not None:
+        bits = np.unpackbits(
+            np.frombuffer(buffer, np.uint8), bitorder="little"
+        )
+        return (np.flatnonzero(bits) + offset).tolist()
+    return [
+        offset + (i << 3) + b
+        for i, byte in enumerate(buffer)
+        if byte
+        for b in range(8)
+        if (byte >> b) & 1
+    ]
+
+
+def dense(buffer: Any) -> Any:
+    """A buffer with the buffer protocol: a bytearray for SparseBits"""
+    if isinstance(buffer, SparseBits):
+        return buffer.to_bytearray()
+    return buffer
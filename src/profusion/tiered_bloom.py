@@ -0,0 +1,286 @@
+from concurrent.futures import Executor, Future
+import contextlib
+import mmap
+import os
+from typing import Any, ContextManager, Iterable, List, Optional
+
+from . import Bloom, BloomException
+from . import persist
+from .keys import iter_keys, np
+from .locks import FileLock
+
+
+DIR = "/dev/shm"
+SUFFIX = ".tbf"
+CAPACITY = 1e8
+ERROR_RATIO = 1e-6
+HOT_CAPACITY = 1 << 16
+
+
+class TieredBloom:
+    """Bloom filter with an in-memory hot tier over a mmapped cold tier
+
+    Adds set bits in a small private hot Bloom sized for hot_capacity
+    elements and queue the matching cold bit indexes. Once hot_capacity
+    elements are queued, merge() ORs them into the cold filter file in
+    sorted order under an flock and empties the hot tier, so the large
+    shared filter is locked and written once per hot_capacity adds instead
+    of once per add. Checks look at the hot tier first and then read the
+    cold tier without locking; cold bits are only ever set.
+
+    Both tiers use the same hash functions, so each element is hashed
+    once. An element is reported present if either tier has it, so the
+    false positive rate is up to the sum of both tiers' rates. Elements
+    added by other processes are visible once those processes merge.
+    """
+
+    type = "tiered bloom"
+
+    def __init__(self, name: str, **kwargs: Any) -> None:
+        self.name = name
+        self.dir = kwargs.get("dir", DIR)
+        self.capacity = kwargs.get("capacity", CAPACITY)
+        self.error_ratio = kwargs.get("error_ratio", ERROR_RATIO)
+        self.power_of_two = kwargs.get("power_of_two", False)
+        self.hot_capacity = int(kwargs.get("hot_capacity", HOT_CAPACITY))
+        if self.capacity <= 0:
+            raise BloomException("capacity must be > 0")
+        if self.hot_capacity <= 0:
+            raise BloomException("hot_capacity must be > 0")
+
+        # Cold bit indexes of elements added since the last merge: NumPy
+        # arrays from add_many() and a flat list from add()
+        self._pending: List[Any] = []
+        self._pending_bits: List[int] = []
+        self._unmerged = 0
+
+        self.hot = Bloom(
+            capacity=self.hot_capacity,
+            error_ratio=self.error_ratio,
+            power_of_two=self.power_of_two,
+        )
+        bins, hashes, size = Bloom._dimensions(
+            int(self.capacity), self.error_ratio, self.power_of_two
+        )
+        self.hashes = hashes
+        self.path = os.path.join(self.dir, f"{name}{SUFFIX}")
+        self._create(size)
+
+        self.fp = open(self.path, "r+b")
+        self.bf = mmap.mmap(self.fp.fileno(), 0)
+        if len(self.bf) != size:
+            self.close()
+            raise BloomException(
+                f"'{self.path}' was created with other parameters"
+            )
+        metadata = {
+            "type": Bloom.type,
+            "bins": bins,
+            "hashes": hashes,
+            "power_of_two": self.power_of_two,
+        }
+        self.cold = Bloom.from_buffer(self.bf, metadata)
+
+    def _create(self, size: int) -> None:
+        """Create an empty cold filter file unless it exists"""
+        if os.path.isfile(self.path):
+            return
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, "wb") as fp:
+                fp.truncate(size)
+            os.link(tmp_path, self.path)
+        except FileExistsError:
+            pass
+        finally:
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(tmp_path)
+
+    def add(self, s: str) -> None:
+        """Add element to the hot tier"""
+        digests = self.cold._digests(s)
+        hot = self.hot
+        for digest in digests:
+            byte_index, bit_index = hot._digest2index(digest)
+            hot.bf[byte_index] |= 1 << bit_index
+        self._pending_bits.extend(self._cold_index(d) for d in digests)
+        self._added(1)
+
+    def check(self, s: str) -> bool:
+        """Check if element is in either tier"""
+        digests = self.cold._digests(s)
+        return self._contains(self.hot, digests) or self._contains(
+            self.cold, digests
+        )
+
+    def check_then_add(self, s: str) -> bool:
+        """Check if element was already in filter then add it"""
+        if self.check(s):
+            return True
+        self.add(s)
+        return False
+
+    def add_many(self, keys: Iterable) -> None:
+        """Add every element, merging each time the hot tier fills up"""
+        if np is None:
+            for s in iter_keys(keys):
+                self.add(s)
+            return
+
+        keys = list(iter_keys(keys))
+        start = 0
+        while start < len(keys):
+            end = start + self.hot_capacity - self._unmerged
+            digests = self._digest_array(keys[start:end])
+            hot_indexes = self._mod(self.hot, digests).ravel()
+            view = np.frombuffer(self.hot.bf, dtype=np.uint8)
+            np.bitwise_or.at(
+                view,
+                hot_indexes >> 3,
+                (1 << (hot_indexes & 7)).astype(np.uint8),
+            )
+            del view
+            self._pending.append(self._mod(self.cold, digests).ravel())
+            self._added(len(digests))
+            start = end
+
+    def check_many(self, keys: Iterable) -> List[bool]:
+        """Check every element of an iterable or NumPy array"""
+        keys = list(iter_keys(keys))
+        if np is None or not keys:
+            return [self.check(s) for s in keys]
+
+        digests = self._digest_array(keys)
+        present = np.zeros(len(keys), dtype=bool)
+        for bloom in (self.hot, self.cold):
+            indexes = self._mod(bloom, digests)
+            view = np.frombuffer(bloom.bf, dtype=np.uint8)
+            present |= ((view[indexes >> 3] >> (indexes & 7)) & 1).all(axis=1)
+            del view
+        return present.tolist()
+
+    def check_then_add_many(self, keys: Iterable) -> List[bool]:
+        """Check then add every element in order, returning the checks"""
+        return [self.check_then_add(s) for s in iter_keys(keys)]
+
+    def merge(self) -> int:
+        """OR the hot tier into the cold filter and empty it
+
+        Returns the number of elements merged.
+        """
+        merged = self._unmerged
+        if not merged:
+            return 0
+
+        if np is not None:
+            parts = self._pending + [
+                np.array(self._pending_bits, dtype=np.int64)
+            ]
+            indexes = np.sort(np.concatenate(parts))
+            masks = (1 << (indexes & 7)).astype(np.uint8)
+            view = np.frombuffer(self.bf, dtype=np.uint8)
+            with self._lock():
+                np.bitwise_or.at(view, indexes >> 3, masks)
+            del view
+        else:
+            indexes = sorted(set(self._pending_bits))
+            bf = self.bf
+            with self._lock():
+                for index in indexes:
+                    bf[index >> 3] |= 1 << (index & 7)
+
+        self.hot.bf[:] = bytes(len(self.hot.bf))
+        self._pending = []
+        self._pending_bits = []
+        self._unmerged = 0
+        return merged
+
+    def snapshot(self, path: str) -> None:
+        """Save the cold filter to a ZIP file loadable by Bloom
+
+        Merge first to include the hot tier. The cold filter is copied
+        under the lock and compressed after it is released.
+        """
+        with self._lock():
+            buffer = bytes(self.bf)
+        persist.write_zip(path, self.cold.metadata(), [("bf.bin", buffer)])
+
+    def save_async(
+        self, path: str, executor: Optional[Executor] = None
+    ) -> Future:
+        """Merge, then run snapshot(path) on a background thread"""
+        self.merge()
+        executor = executor if executor is not None else persist.executor()
+        return executor.submit(self.snapshot, path)
+
+    def flush(self) -> None:
+        """Merge the hot tier and write the cold filter to its file"""
+        self.merge()
+        self.bf.flush()
+
+    def close(self) -> None:
+        """Merge the hot tier, then unmap and close the cold filter file"""
+        if hasattr(self, "cold"):
+            self.merge()
+            del self.cold
+        if hasattr(self, "bf"):
+            self.bf.close()
+            del self.bf
+        if hasattr(self, "fp"):
+            self.fp.close()
+            del self.fp
+
+    def __contains__(self, s: str) -> bool:
+        return self.check(s)
+
+    def __len__(self) -> int:
+        return self.cold.bins
+
+    def __str__(self) -> str:
+        return (
+            f"Tiered Bloom filter with {self.hot.bins} hot and "
+            f"{self.cold.bins} cold bits"
+        )
+
+    def __del__(self) -> None:
+        """Ensure proper cleanup of resources"""
+        self.close()
+
+    def _added(self, elements: int) -> None:
+        """Count elements added to the hot tier and merge once it's full"""
+        self._unmerged += elements
+        if self._unmerged >= self.hot_capacity:
+            self.merge()
+
+    def _cold_index(self, digest: int) -> int:
+        """Bit index of a digest in the cold filter"""
+        byte_index, bit_index = self.cold._digest2index(digest)
+        return (byte_index << 3) | bit_index
+
+    def _digest_array(self, keys: List[Any]) -> Any:
+        """Digests of every key as an (elements, hashes) NumPy array"""
+        digests = np.array(
+            [self.cold._digests(s) for s in keys], dtype=np.int64
+        )
+        return digests.reshape(len(keys), self.hashes)
+
+    @staticmethod
+    def _mod(bloom: Bloom, digests: Any) -> Any:
+        """Bit indexes of a NumPy array of digests in a filter"""
+        if bloom.power_of_two:
+            return digests & (bloom.bins - 1)
+        return digests % bloom.bins
+
+    @staticmethod
+    def _contains(bloom: Bloom, digests: List[int]) -> bool:
+        """Check if every bit of digests is set in a filter"""
+        bf = bloom.bf
+        for digest in digests:
+            byte_index, bit_index = bloom._digest2index(digest)
+            if not (bf[byte_index] >> bit_index) & 1:
+                return False
+        return True
+
+    def _lock(self) -> ContextManager:
+        """Context manager for file locking"""
+        return FileLock(self.fp)
@@ -0,0 +1,94 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from src.profusion import Bloom, BloomArena, BloomException
+
+
+class TestBloomArena(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.temp_dir, "arena.bin")
+        self.arena = BloomArena(
+            self.path, tenants=100, capacity=100, error_ratio=0.01
+        )
+
+    def tearDown(self):
+        self.arena.close()
+        shutil.rmtree(self.temp_dir)
+
+    def test_add_and_check(self):
+        self.arena.add("alice", "apple")
+        self.assertTrue(self.arena.check("alice", "apple"))
+        self.assertFalse(self.arena.check("alice", "banana"))
+        self.assertFalse(self.arena.check("bob", "apple"))
+        self.assertIn("alice", self.arena)
+        self.assertNotIn("bob", self.arena)
+        self.assertEqual(len(self.arena), 1)
+
+    def test_batch_operations(self):
+        tenants = [i % 10 for i in range(200)]
+        keys = [f"key_{i}" for i in range(200)]
+        self.arena.add_many(tenants, keys)
+        self.assertEqual(len(self.arena), 10)
+        self.assertTrue(all(self.arena.check_many(tenants, keys)))
+        self.assertEqual(
+            self.arena.check_many([1, 2, 99], ["key_1", "key_1", "key_1"]),
+            [True, False, False],
+        )
+
+        with self.assertRaises(BloomException):
+            self.arena.add_many([1, 2], ["key"])
+        with self.assertRaises(BloomException):
+            self.arena.check_many([1, 2], ["key"])
+
+    def test_slot_matches_bloom(self):
+        self.arena.add(b"tenant", "apple")
+        bloom = Bloom(capacity=100, error_ratio=0.01)
+        bloom.add("apple")
+
+        view = self.arena.bloom(b"tenant")
+        self.assertEqual(bytes(view.bf), bytes(bloom.bf))
+        view.add("banana")
+        self.assertTrue(self.arena.check(b"tenant", "banana"))
+        del view
+
+        with self.assertRaises(BloomException):
+            self.arena.bloom(b"unknown")
+
+    def test_reopen(self):
+        self.arena.add_many(["alice", "bob"], ["apple", "banana"])
+        other = BloomArena(self.path, tenants=5)
+        self.assertEqual(other.max_tenants, 100)
+        self.assertEqual(other._slots, {})
+
+        self.assertEqual(len(other), 2)
+        self.assertTrue(other.check("bob", "banana"))
+        other.add("carol", "carrot")
+        self.assertTrue(self.arena.check("carol", "carrot"))
+        other.close()
+
+    def test_full(self):
+        self.arena.add_many(range(100), ["key"] * 100)
+        with self.assertRaises(BloomException):
+            self.arena.add(100, "key")
+        self.assertTrue(self.arena.check(99, "key"))
+
+    def test_invalid_file(self):
+        path = os.path.join(self.temp_dir, "invalid.bin")
+        with open(path, "wb") as fp:
+            fp.write(b"\0" * 64)
+        with self.assertRaises(BloomException):
+            BloomArena(path)
+
+    def test_create_error_not_hidden(self):
+        path = os.path.join(self.temp_dir, "missing", "arena.bin")
+        with self.assertRaises(FileNotFoundError) as context:
+            BloomArena(path)
+        # Not raised again while removing the temporary file
+        self.assertIsNone(context.exception.__context__)
+
+
+if __name__ == "__main__":
+    unittest.main()
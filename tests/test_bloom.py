@@ -1,8 +1,35 @@
+import gc
+import multiprocessing
+import pickle
+import sys
+import threading
 import unittest
 import tempfile
+from unittest import mock
 import os
 
 from src.profusion import Bloom, BloomException
+from src.profusion.keys import np
+from src.profusion.sparse import SparseBits
+
+
+def run_threads(target, args_list):
+    """Run target once per args on its own thread, switching often"""
+    interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    try:
+        threads = [threading.Thread(target=target, args=a) for a in args_list]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        sys.setswitchinterval(interval)
+
+
+def add_shared(bloom, keys):
+    bloom.add_many(keys)
+    return bloom.check_many(keys)
 
 
 class TestBloom(unittest.TestCase):
@@ -57,6 +84,402 @@ class TestBloom(unittest.TestCase):
 
         os.unlink(tmp.name)
 
+    def test_checkpoint_and_replay(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "bloom.zip")
+            self.bloom.add("base")
+            self.bloom.save(path)
+
+            self.bloom.add("delta_1")
+            self.assertGreater(self.bloom.checkpoint(), 0)
+            self.bloom.add("delta_2")
+            self.bloom.checkpoint()
+            self.assertEqual(self.bloom.checkpoint(), 0)
+            self.assertTrue(os.path.isfile(path + ".delta"))
+
+            new_bloom = Bloom()
+            new_bloom.load(path)
+            self.assertEqual(self.bloom.bf, new_bloom.bf)
+            self.assertTrue(new_bloom.check("delta_2"))
+
+    def test_checkpoint_ignores_torn_frame(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "bloom.zip")
+            self.bloom.save(path)
+            self.bloom.add("committed")
+            self.bloom.checkpoint()
+            self.bloom.add("torn")
+            self.bloom.checkpoint()
+
+            with open(path + ".delta", "r+b") as fp:
+                fp.truncate(os.path.getsize(path + ".delta") - 1)
+
+            new_bloom = Bloom()
+            new_bloom.load(path)
+            self.assertTrue(new_bloom.check("committed"))
+            self.assertFalse(new_bloom.check("torn"))
+
+    def test_stale_delta_log_skipped(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "bloom.zip")
+            self.bloom.save(path)
+            self.bloom.add("b")
+            self.bloom.checkpoint()
+            with open(path + ".delta", "rb") as fp:
+                stale = fp.read()
+            self.bloom.add("c")
+            self.bloom.save(path)
+
+            # Crash after replacing the base file, before removing the log
+            with open(path + ".delta", "wb") as fp:
+                fp.write(stale)
+
+            new_bloom = Bloom()
+            new_bloom.load(path)
+            self.assertTrue(new_bloom.check("b"))
+            self.assertTrue(new_bloom.check("c"))
+            self.assertEqual(self.bloom.bf, new_bloom.bf)
+
+    def test_compact(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "bloom.zip")
+            self.bloom.save(path)
+            self.bloom.add("compacted")
+            self.bloom.checkpoint()
+            self.bloom.compact()
+            self.assertFalse(os.path.isfile(path + ".delta"))
+
+            new_bloom = Bloom()
+            new_bloom.load(path)
+            self.assertTrue(new_bloom.check("compacted"))
+
+    def test_index_cache(self):
+        bloom = Bloom(capacity=1000, error_ratio=0.01, cache_size=16)
+        bloom.add("hot")
+        self.assertTrue(bloom.check("hot"))
+        self.assertFalse(bloom.check("cold"))
+        self.assertEqual(bloom.cache_info()["hits"], 1)
+        self.assertEqual(bloom.cache_info()["misses"], 2)
+
+        self.bloom.add("hot")
+        self.assertEqual(bloom.bf, self.bloom.bf)
+
+    def test_index_cache_disabled(self):
+        self.assertIsNone(self.bloom.cache)
+        self.assertIsNone(self.bloom.cache_info())
+
+    def test_invalid_cache_parameters(self):
+        with self.assertRaises(BloomException):
+            Bloom(cache_size=-1)
+        with self.assertRaises(BloomException):
+            Bloom(cache_size=8, cache_policy="random")
+
+    def test_key_types(self):
+        self.bloom.add(b"bytes")
+        self.bloom.add(42)
+        self.assertTrue(self.bloom.check("bytes"))
+        self.assertTrue(self.bloom.check(memoryview(b"xbytes")[1:]))
+        self.assertTrue(self.bloom.check(bytearray(b"bytes")))
+        self.assertTrue(self.bloom.check(42))
+        self.assertFalse(self.bloom.check("42"))
+
+    def test_add_many_and_check_many(self):
+        self.bloom.add_many(["a", b"b", 3])
+        self.assertEqual(
+            self.bloom.check_many(["a", "b", 3, "d"]),
+            [True, True, True, False],
+        )
+
+    @unittest.skipIf(np is None, "numpy not installed")
+    def test_numpy_keys(self):
+        self.bloom.add_many(np.arange(100, dtype=np.int64))
+        self.assertTrue(all(self.bloom.check_many(range(100))))
+        self.bloom.add_many(np.array([b"x", b"yz"]))
+        self.assertTrue(self.bloom.check("yz"))
+        self.assertEqual(
+            self.bloom.check_many(np.array([5, 1000], dtype=np.uint32)),
+            [True, False],
+        )
+
+    @unittest.skipIf(np is None, "numpy not installed")
+    def test_numpy_scalar_and_batch_keys_agree(self):
+        array = np.array([5, 6, 7], dtype=np.int32)
+        for x in array:
+            self.bloom.add(x)
+        self.assertEqual(self.bloom.check_many(array), [True] * 3)
+
+        bloom = Bloom(capacity=1000, error_ratio=0.01)
+        bloom.add_many(array)
+        self.assertTrue(all(bloom.check(x) for x in array))
+        self.assertEqual(bloom.bf, self.bloom.bf)
+
+    def test_merge(self):
+        other = Bloom(capacity=1000, error_ratio=0.01)
+        self.bloom.add("mine")
+        other.add("theirs")
+        self.bloom.merge(other)
+        self.assertTrue(self.bloom.check("mine"))
+        self.assertTrue(self.bloom.check("theirs"))
+
+        with self.assertRaises(BloomException):
+            self.bloom.merge(Bloom(capacity=2000, error_ratio=0.01))
+
+    def test_power_of_two(self):
+        bloom = Bloom(capacity=1000, error_ratio=0.01, power_of_two=True)
+        self.assertEqual(bloom.bins & (bloom.bins - 1), 0)
+        self.assertGreaterEqual(bloom.bins, self.bloom.bins)
+        self.assertEqual(len(bloom.bf), bloom.bins // 8)
+        bloom.add("test")
+        self.assertTrue(bloom.check("test"))
+        self.assertFalse(bloom.check("not_added"))
+
+    def test_fold(self):
+        bloom = Bloom(capacity=1000, error_ratio=0.01, power_of_two=True)
+        keys = [f"item_{i}" for i in range(100)]
+        bloom.add_many(keys)
+        bins = bloom.bins
+
+        bloom.fold(2)
+        self.assertEqual(bloom.bins, bins // 4)
+        self.assertEqual(len(bloom.bf), bloom.bins // 8)
+        self.assertTrue(all(bloom.check_many(keys)))
+
+        with self.assertRaises(BloomException):
+            self.bloom.fold()
+        with self.assertRaises(BloomException):
+            bloom.fold(64)
+
+    def test_fold_save_and_checkpoint(self):
+        bloom = Bloom(capacity=1000, error_ratio=0.01, power_of_two=True)
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "bloom.zip")
+            bloom.save(path)
+            bloom.add("folded")
+            bloom.fold()
+            bloom.checkpoint()
+            self.assertFalse(os.path.isfile(path + ".delta"))
+
+            new_bloom = Bloom()
+            new_bloom.load(path)
+            self.assertTrue(new_bloom.power_of_two)
+            self.assertEqual(new_bloom.bins, bloom.bins)
+            self.assertTrue(new_bloom.check("folded"))
+
+    def test_sparse(self):
+        bloom = Bloom(capacity=1000, error_ratio=0.01, sparse=True)
+        keys = [f"item_{i}" for i in range(1000)]
+        self.assertIsInstance(bloom.bf, SparseBits)
+        bloom.add_many(keys[:10])
+        self.assertEqual(
+            bloom.check_then_add_many(keys[5:15])[:6], [True] * 5 + [False]
+        )
+        self.bloom.add_many(keys[:15])
+        self.assertIsInstance(bloom.bf, SparseBits)
+        self.assertEqual(bloom.bf, self.bloom.bf)
+        self.assertEqual(bloom.check_many(keys), self.bloom.check_many(keys))
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "bloom.zip")
+            bloom.save(path)
+            dense = Bloom(path=path)
+            self.assertEqual(dense.bf, self.bloom.bf)
+            loaded = Bloom(path=path, sparse=True)
+            self.assertIsInstance(loaded.bf, SparseBits)
+            self.assertEqual(loaded.bf, self.bloom.bf)
+
+        # Past sparse_saturation the buffer turns dense
+        bloom.add_many(keys)
+        self.assertIsInstance(bloom.bf, bytearray)
+        self.assertTrue(all(bloom.check_many(keys)))
+        with self.assertRaises(BloomException):
+            Bloom(sparse=True, thread_safe=True)
+
+    def test_check_then_add_many(self):
+        keys = ["a", "b", "a", "c", "b", "d"]
+        expected = [self.bloom.check_then_add(s) for s in keys]
+        self.assertEqual(expected, [False, False, True, False, True, False])
+
+        bloom = Bloom(capacity=1000, error_ratio=0.01)
+        self.assertEqual(bloom.check_then_add_many(keys), expected)
+        self.assertEqual(bloom.bf, self.bloom.bf)
+
+        with mock.patch("src.profusion.bloom.np", None):
+            bloom = Bloom(capacity=1000, error_ratio=0.01, power_of_two=True)
+            self.assertEqual(bloom.check_then_add_many(keys), expected)
+        self.assertEqual(bloom.check_then_add_many(["d", "e"]), [True, False])
+
+    def test_dedupe(self):
+        items = [f"key_{i % 300}" for i in range(1000)]
+        firsts = list(self.bloom.dedupe(items, batch_size=64))
+        self.assertEqual(firsts, [f"key_{i}" for i in range(300)])
+        self.assertEqual(list(self.bloom.dedupe(items)), [])
+
+        records = [{"id": i % 3, "n": i} for i in range(10)]
+        firsts = Bloom(capacity=100, error_ratio=0.01).dedupe(
+            records, key=lambda record: record["id"]
+        )
+        self.assertEqual([record["n"] for record in firsts], [0, 1, 2])
+
+    def test_dedupe_checkpoint(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "bloom.zip")
+            self.bloom.save(path)
+            list(self.bloom.dedupe(["x", "y", "x"]))
+            self.bloom.checkpoint()
+
+            new_bloom = Bloom()
+            new_bloom.load(path)
+            self.assertEqual(new_bloom.bf, self.bloom.bf)
+
+    def test_save_async(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "bloom.zip")
+            self.bloom.add("before")
+            self.bloom.save(path)
+            self.bloom.add("in_log")
+            self.bloom.checkpoint()
+
+            future = self.bloom.save_async()
+            self.bloom.add("after")  # Writable while the save runs
+            self.assertIsNone(future.result())
+            self.assertFalse(os.path.isfile(path + ".delta"))
+            self.assertEqual(os.listdir(tmp), ["bloom.zip"])
+
+            new_bloom = Bloom()
+            new_bloom.load(path)
+            self.assertTrue(new_bloom.check_many(["before", "in_log"]))
+
+            # Changes after the copy are still written by checkpoint()
+            self.assertGreater(self.bloom.checkpoint(), 0)
+            new_bloom.load(path)
+            self.assertEqual(new_bloom.bf, self.bloom.bf)
+
+    def test_pickle_after_save_async(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            self.bloom.add("saved")
+            self.bloom.save_async(os.path.join(tmp, "bloom.zip")).result()
+            copy = pickle.loads(pickle.dumps(self.bloom))
+            self.assertTrue(copy.check("saved"))
+            self.assertIsNone(copy._saving)
+
+    def test_save_async_error(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "bloom.zip")
+            self.bloom.save(path)
+            self.bloom.add("lost_from_dirty")
+            future = self.bloom.save_async(os.path.join(tmp, "no", "bf.zip"))
+            with self.assertRaises(OSError):
+                future.result()
+
+            # A failed save forces the next checkpoint to write a base file
+            self.bloom.path = path
+            self.assertEqual(self.bloom.checkpoint(), os.path.getsize(path))
+            new_bloom = Bloom()
+            new_bloom.load(path)
+            self.assertTrue(new_bloom.check("lost_from_dirty"))
+
+        with self.assertRaises(BloomException):
+            Bloom().save_async()
+
+    def test_from_buffer_is_zero_copy(self):
+        self.bloom.add("buffered")
+        buffer = bytearray(self.bloom.to_buffer())
+        bloom = Bloom.from_buffer(buffer, self.bloom.metadata())
+        self.assertTrue(bloom.check("buffered"))
+
+        bloom.add("through_view")
+        self.assertNotEqual(bytes(buffer), bytes(self.bloom.bf))
+        buffer[:] = bytes(len(buffer))
+        self.assertFalse(bloom.check("buffered"))
+
+    def test_share_across_processes(self):
+        self.bloom.add("parent")
+        handle = self.bloom.share()
+        try:
+            self.assertLess(len(pickle.dumps(handle)), 1024)
+            self.assertLess(len(pickle.dumps(self.bloom)), 1024)
+
+            attached = handle.attach()
+            self.assertTrue(attached.check("parent"))
+
+            ctx = multiprocessing.get_context("fork")
+            with ctx.Pool(2) as pool:
+                results = pool.starmap(
+                    add_shared, [(self.bloom, ["child_a"]), (attached, ["b"])]
+                )
+            self.assertEqual(results, [[True], [True]])
+            self.assertTrue(self.bloom.check_many(["parent", "child_a", "b"]))
+            attached.unshare()
+        finally:
+            self.bloom.unshare()
+
+        self.assertIsInstance(self.bloom.bf, bytearray)
+        self.assertTrue(self.bloom.check("child_a"))
+        with self.assertRaises(BloomException):
+            self.bloom.handle()
+
+        bloom = Bloom(capacity=1000, error_ratio=0.01, power_of_two=True)
+        bloom.share()
+        with self.assertRaises(BloomException):
+            bloom.fold()
+        bloom.unshare()
+
+    def test_attached_filter_release(self):
+        handle = self.bloom.share()
+        try:
+            unraisable = []
+            with mock.patch("sys.unraisablehook", unraisable.append):
+                attached = handle.attach()
+                attached.check("x")
+                del attached
+                gc.collect()
+            self.assertEqual(unraisable, [])
+
+            attached = handle.attach()
+            attached.detach()
+            with self.assertRaises(ValueError):
+                attached.check("x")
+            self.bloom.add("still_shared")
+            self.assertTrue(self.bloom.check("still_shared"))
+        finally:
+            self.bloom.unshare()
+
+    def test_thread_safe_stress(self):
+        bloom = Bloom(capacity=20000, error_ratio=0.01, thread_safe=True)
+        keys = [f"key_{i}" for i in range(20000)]
+
+        def add(batch):
+            for s in batch[:500]:
+                bloom.add(s)
+            bloom.add_many(batch[500:])
+
+        run_threads(add, [(keys[i::8],) for i in range(8)])
+        expected = Bloom(capacity=20000, error_ratio=0.01)
+        expected.add_many(keys)
+        self.assertEqual(bytes(bloom.bf), bytes(expected.bf))
+
+        # At most one thread sees each new element as absent
+        results = []
+        run_threads(
+            lambda: results.append(bloom.check_then_add_many(range(2000))),
+            [()] * 4,
+        )
+        for checks in zip(*results):
+            self.assertGreaterEqual(sum(checks), 3)
+        self.assertTrue(all(bloom.check_many(range(2000))))
+
+        copy = pickle.loads(pickle.dumps(bloom))
+        self.assertEqual(len(copy.locks), len(bloom.locks))
+        copy.add("after_pickle")
+        self.assertTrue(copy.check("after_pickle"))
+
+    def test_thread_safe_parameters(self):
+        with self.assertRaises(BloomException):
+            Bloom(thread_safe=True, cache_size=10)
+        with self.assertRaises(BloomException):
+            Bloom(thread_safe=True, lock_stripes=3)
+        self.assertIsNone(self.bloom.locks)
+
     def test_invalid_capacity(self):
         with self.assertRaises(BloomException):
             Bloom(capacity=0)
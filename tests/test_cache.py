@@ -0,0 +1,70 @@
+import unittest
+
+from src.profusion.cache import (
+    ClockCache,
+    IndexCache,
+    LRUCache,
+    index_cache,
+)
+
+
+class TestLRUCache(unittest.TestCase):
+    def setUp(self):
+        self.cache = LRUCache(2)
+
+    def test_hits_and_misses(self):
+        self.assertIsNone(self.cache.get("a"))
+        self.cache.put("a", (1, 2))
+        self.assertEqual(self.cache.get("a"), (1, 2))
+        self.assertEqual(self.cache.hits, 1)
+        self.assertEqual(self.cache.misses, 1)
+
+    def test_evicts_least_recently_used(self):
+        self.cache.put("a", 1)
+        self.cache.put("b", 2)
+        self.cache.get("a")
+        self.cache.put("c", 3)
+        self.assertEqual(len(self.cache), 2)
+        self.assertIsNone(self.cache.get("b"))
+        self.assertEqual(self.cache.get("a"), 1)
+
+
+class TestClockCache(unittest.TestCase):
+    def setUp(self):
+        self.cache = ClockCache(2)
+
+    def test_hits_and_misses(self):
+        self.assertIsNone(self.cache.get("a"))
+        self.cache.put("a", (1, 2))
+        self.assertEqual(self.cache.get("a"), (1, 2))
+        self.assertEqual(self.cache.info()["hits"], 1)
+        self.assertEqual(self.cache.info()["misses"], 1)
+
+    def test_bounded_size(self):
+        for i in range(10):
+            self.cache.put(i, i)
+        self.assertEqual(len(self.cache), 2)
+        self.assertEqual(self.cache.get(9), 9)
+
+    def test_clear(self):
+        self.cache.put("a", 1)
+        self.cache.clear()
+        self.assertEqual(len(self.cache), 0)
+        self.assertIsNone(self.cache.get("a"))
+
+
+class TestIndexCache(unittest.TestCase):
+    def test_factory(self):
+        self.assertIsNone(index_cache(0))
+        self.assertIsInstance(index_cache(8), LRUCache)
+        self.assertIsInstance(index_cache(8, "clock"), ClockCache)
+        with self.assertRaises(ValueError):
+            index_cache(8, "random")
+
+    def test_abstract(self):
+        with self.assertRaises(TypeError):
+            IndexCache(8)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,122 @@
+import gzip
+import io
+import json
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from src.profusion import Bloom
+from src.profusion.cli import main
+
+
+class TestCli(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.a = self._path("a.txt")
+        with open(self.a, "wb") as fp:
+            fp.write(b"\n".join(b"%d" % i for i in range(1000)) + b"\n")
+        self.b = self._path("b.gz")
+        with gzip.open(self.b, "wb") as fp:
+            fp.write(b"\n".join(b"%d" % i for i in range(500, 1500)))
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def _path(self, name):
+        return os.path.join(self.temp_dir.name, name)
+
+    def _run(self, argv, stdin=b""):
+        stdin = io.TextIOWrapper(io.BytesIO(stdin))
+        stdout = io.TextIOWrapper(io.BytesIO())
+        with mock.patch("sys.stdin", stdin), mock.patch("sys.stdout", stdout):
+            code = main(argv)
+            stdout.flush()
+            return code, stdout.buffer.getvalue()
+
+    def test_build_and_query(self):
+        out = self._path("f.zip")
+        code, _ = self._run(
+            ["build", out, self.a, self.b, "--capacity", "2000"]
+        )
+        self.assertEqual(code, 0)
+
+        code, found = self._run(["query", out], b"1\n1499\n2000\n")
+        self.assertEqual(found, b"1\n1499\n")
+        code, missing = self._run(["query", "-v", out], b"1\n2000\n")
+        self.assertEqual(missing, b"2000\n")
+
+    def test_parallel_build_matches_serial(self):
+        serial, parallel = self._path("s.zip"), self._path("p.zip")
+        self._run(["build", serial, self.a, self.b, "--capacity", "2000"])
+        self._run(
+            ["build", parallel, self.a, self.b, "--capacity", "2000", "-j2"]
+        )
+        bloom = Bloom()
+        bloom.load(serial)
+        other = Bloom()
+        other.load(parallel)
+        self.assertEqual(bloom.bf, other.bf)
+
+    def test_build_from_stdin(self):
+        out = self._path("f.zip")
+        self._run(["build", out, "--capacity", "100"], b"x\ny\n")
+        code, found = self._run(["query", out], b"x\nz\n")
+        self.assertEqual(found, b"x\n")
+
+    def test_partitioned(self):
+        out = self._path("p.zip")
+        code, _ = self._run(
+            ["build", out, self.a, self.b, "--type", "partitioned", "-j2"]
+        )
+        self.assertEqual(code, 0)
+        code, found = self._run(["query", out], b"1\n2000\n")
+        self.assertEqual(found, b"1\n")
+
+    def test_counting_merge_and_trigger(self):
+        out, merged = self._path("c.zip"), self._path("m.zip")
+        self._run(["build", out, self.a, "--type", "counting"])
+        self._run(["merge", merged, out, out])
+        code, found = self._run(["query", "--trigger", "2", merged], b"5\n")
+        self.assertEqual(found, b"5\n")
+        code, found = self._run(["query", "--trigger", "3", merged], b"5\n")
+        self.assertEqual(found, b"")
+
+    def test_mmcounting(self):
+        out = self._path("f.mmcb")
+        params = ["--capacity", "2000", "--error-ratio", "0.001"]
+        self._run(["build", out, self.a, "--type", "mmcounting"] + params)
+        code, found = self._run(["query", out] + params, b"7\n2000\n")
+        self.assertEqual(found, b"7\n")
+
+        code, _ = self._run(["stats", out])
+        self.assertEqual(code, 1)
+
+    def test_stats(self):
+        out = self._path("s.zip")
+        self._run(["build", out, self.a, "--type", "scalable"])
+        code, output = self._run(["inspect", out])
+        stats = json.loads(output)
+        self.assertEqual(code, 0)
+        self.assertEqual(stats["type"], "scalable bloom")
+        self.assertEqual(stats["elements"], 1000)
+        self.assertGreater(stats["saturation"], 0)
+        self.assertLess(stats["estimated_fpr"], 1)
+
+    def test_stats_metadata_only(self):
+        out = self._path("s.zip")
+        self._run(["build", out, self.a])
+        code, output = self._run(["stats", "-m", "--verify", out])
+        stats = json.loads(output)
+        self.assertEqual(code, 0)
+        self.assertEqual(stats["metadata"]["type"], "bloom")
+        self.assertTrue(stats["metadata"]["checksums"])
+        self.assertNotIn("saturation", stats)
+
+    def test_missing_file(self):
+        code, _ = self._run(["stats", self._path("missing.zip")])
+        self.assertEqual(code, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,8 +1,13 @@
+import pickle
+import sys
+import threading
 import unittest
+from unittest import mock
 import tempfile
 import os
 
-from src.profusion import CountingBloom
+from src.profusion import Bloom, BloomException, CountingBloom
+from src.profusion.counting_bloom import saturating_add, threshold_bits
 
 
 class TestCountingBloom(unittest.TestCase):
@@ -63,10 +68,163 @@ class TestCountingBloom(unittest.TestCase):
 
         os.unlink(tmp.name)
 
+    def test_checkpoint_and_replay(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "counting.zip")
+            self.bloom.add("base", 2)
+            self.bloom.save(path)
+            self.bloom.add("base", 3)
+            self.bloom.add("delta", 4)
+            self.bloom.checkpoint()
+
+            new_bloom = CountingBloom()
+            new_bloom.load(path)
+            self.assertEqual(self.bloom.bf, new_bloom.bf)
+            self.assertEqual(new_bloom.value("base"), 5)
+            self.assertEqual(new_bloom.value("delta"), 4)
+
+    def test_batch_operations(self):
+        self.bloom.add_many(["a", b"b", 3], amount=2)
+        self.assertEqual(
+            self.bloom.value_many(["a", "b", 3, "d"]), [2, 2, 2, 0]
+        )
+        self.assertEqual(
+            self.bloom.check_many(["a", "d"], trigger=2), [True, False]
+        )
+
+    def test_dedupe(self):
+        items = ["a", "b", "a", "c", "a"]
+        self.assertEqual(list(self.bloom.dedupe(items)), ["a", "b", "c"])
+        self.assertEqual(self.bloom.value("a"), 3)
+
+    def test_merge(self):
+        other = CountingBloom(capacity=1000, error_ratio=0.01, bin_size=10)
+        self.bloom.add("test", 4)
+        other.add("test", 3)
+        other.add("other", 9)
+        self.bloom.merge(other)
+        self.bloom.merge(other)
+        self.assertEqual(self.bloom.value("test"), 10)
+        self.assertEqual(self.bloom.value("other"), 10)
+
+    def test_saturating_add(self):
+        a = (1).to_bytes(2, "big") + (300).to_bytes(2, "big")
+        b = (2).to_bytes(2, "big") + (300).to_bytes(2, "big")
+        expected = (3).to_bytes(2, "big") + (500).to_bytes(2, "big")
+        self.assertEqual(saturating_add(a, b, 2, 500), expected)
+        with mock.patch("src.profusion.counting_bloom.np", None):
+            self.assertEqual(saturating_add(a, b, 2, 500), expected)
+
+    def test_to_bloom(self):
+        keys = [f"key_{i}" for i in range(300)]
+        for i, key in enumerate(keys[:200]):
+            self.bloom.add(key, i % 4 + 1)
+        for trigger in (1, 3, 20):
+            bloom = self.bloom.to_bloom(trigger)
+            self.assertEqual(bloom.type, "bloom")
+            self.assertEqual(bloom.bins, self.bloom.bins)
+            self.assertEqual(
+                bloom.check_many(keys), self.bloom.check_many(keys, trigger)
+            )
+
+        bloom = CountingBloom(capacity=1000, error_ratio=0.01, bin_size=500)
+        bloom.add("test", 300)
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "bloom.zip")
+            bloom.to_bloom(300, path=path)
+            loaded = Bloom(path=path)
+            self.assertTrue(loaded.check("test"))
+            self.assertFalse(bloom.to_bloom(301).check("test"))
+
+    def test_threshold_bits(self):
+        counts = bytes([0, 3, 1, 0, 5, 2, 2, 9, 1])
+        self.assertEqual(threshold_bits(counts, 1, 2), b"\xf2\x00")
+        with mock.patch("src.profusion.counting_bloom.np", None):
+            self.assertEqual(threshold_bits(counts, 1, 2), b"\xf2\x00")
+
+    def test_power_of_two_fold(self):
+        bloom = CountingBloom(
+            capacity=1000, error_ratio=0.01, bin_size=10, power_of_two=True
+        )
+        self.assertEqual(bloom.bins & (bloom.bins - 1), 0)
+        bloom.add("test", 3)
+        bloom.add("other", 2)
+        bloom.fold()
+        self.assertEqual(len(bloom.bf), bloom.bytes)
+        self.assertGreaterEqual(bloom.value("test"), 3)
+        self.assertGreaterEqual(bloom.value("other"), 2)
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "counting.zip")
+            bloom.save(path)
+            new_bloom = CountingBloom()
+            new_bloom.load(path)
+            self.assertTrue(new_bloom.power_of_two)
+            self.assertEqual(new_bloom.value("test"), bloom.value("test"))
+
+    def test_share_and_from_buffer(self):
+        self.bloom.add("shared", 3)
+        handle = self.bloom.share()
+        try:
+            attached = pickle.loads(pickle.dumps(handle)).attach()
+            self.assertIsInstance(attached, CountingBloom)
+            attached.add("shared", 2)
+            self.assertEqual(self.bloom.value("shared"), 5)
+            self.assertGreater(self.bloom._saturation(), 0)
+            attached.unshare()
+        finally:
+            self.bloom.unshare()
+        self.assertEqual(self.bloom.value("shared"), 5)
+
+        buffer = bytearray(self.bloom.to_buffer())
+        bloom = Bloom.from_buffer(buffer, self.bloom.metadata())
+        self.assertIsInstance(bloom, CountingBloom)
+        self.assertEqual(bloom.bin_size, 10)
+        bloom.add("shared")
+        view = CountingBloom.from_buffer(buffer, bloom.metadata())
+        self.assertEqual(view.value("shared"), 6)
+
     def test_invalid_bin_size(self):
         with self.assertRaises(Exception):
             CountingBloom(bin_size=0)
 
+    def test_hash_scheme_rejected(self):
+        with self.assertRaises(BloomException):
+            CountingBloom(hash_scheme="sha256")
+
+    def test_thread_safe_stress(self):
+        bloom = CountingBloom(
+            capacity=1000, error_ratio=0.01, bin_size=65535, thread_safe=True
+        )
+        keys = [f"key_{i}" for i in range(500)]
+
+        def add():
+            for s in keys[:250]:
+                bloom.add(s)
+            bloom.add_many(keys[250:], 2)
+            bloom.check_then_add_many(keys[:100])
+
+        interval = sys.getswitchinterval()
+        sys.setswitchinterval(1e-6)
+        try:
+            threads = [threading.Thread(target=add) for _ in range(8)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        finally:
+            sys.setswitchinterval(interval)
+
+        expected = CountingBloom(
+            capacity=1000, error_ratio=0.01, bin_size=65535
+        )
+        for _ in range(8):
+            expected.add_many(keys[:250])
+            expected.add_many(keys[250:], 2)
+            expected.add_many(keys[:100])
+        self.assertEqual(bytes(bloom.bf), bytes(expected.bf))
+        self.assertEqual(bloom.bin_bytes, 2)
+
     def test_int2bytes_and_bytes2int(self):
         original = 42
         bytes_repr = CountingBloom._int2bytes(original, 4)
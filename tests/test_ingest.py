@@ -0,0 +1,71 @@
+import bz2
+import gzip
+import io
+import os
+import tempfile
+import unittest
+
+from src.profusion import Bloom, CountingBloom, ScalableBloom
+from src.profusion.ingest import iter_batches, iter_lines
+
+
+class TestIngest(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.keys = [f"key_{i}".encode() for i in range(1000)]
+        self.data = b"\n".join(self.keys) + b"\n"
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def _write(self, name, data, opener=open):
+        path = os.path.join(self.temp_dir.name, name)
+        with opener(path, "wb") as fp:
+            fp.write(data)
+        return path
+
+    def test_iter_lines_across_blocks(self):
+        fp = io.BytesIO(b"ab\r\ncd\n\nef")
+        lines = [line for batch in iter_lines(fp, 3) for line in batch]
+        self.assertEqual(lines, [b"ab", b"cd", b"ef"])
+
+    def test_iter_batches(self):
+        batches = list(iter_batches(range(5), 2))
+        self.assertEqual(batches, [[0, 1], [2, 3], [4]])
+
+    def test_ingest_plain_file(self):
+        bloom = Bloom(capacity=1000, error_ratio=0.01)
+        stats = bloom.ingest(self._write("keys.txt", self.data), 100)
+        self.assertEqual(stats.keys, len(self.keys))
+        self.assertEqual(stats.bytes, len(self.data))
+        self.assertTrue(all(bloom.check_many(self.keys)))
+        self.assertTrue(bloom.check("key_42"))
+
+    def test_ingest_compressed_files(self):
+        for name, opener in (("keys.gz", gzip.open), ("keys.bz2", bz2.open)):
+            bloom = Bloom(capacity=1000, error_ratio=0.01)
+            bloom.ingest(self._write(name, self.data, opener))
+            self.assertTrue(all(bloom.check_many(self.keys)))
+
+    def test_ingest_iterable_with_progress(self):
+        reports = []
+        bloom = ScalableBloom(initial_size=1000, max_error=0.01)
+        stats = bloom.ingest(
+            (f"key_{i}" for i in range(1000)),
+            batch_size=300,
+            progress=reports.append,
+        )
+        self.assertEqual([r.keys for r in reports], [300, 600, 900, 1000])
+        self.assertEqual(stats.keys, 1000)
+        self.assertGreaterEqual(stats.rate, 0)
+        self.assertTrue(bloom.check("key_999"))
+
+    def test_ingest_file_object(self):
+        bloom = CountingBloom(capacity=1000, error_ratio=0.01, bin_size=10)
+        bloom.ingest(io.BytesIO(b"a\nb\na\n"))
+        self.assertEqual(bloom.value("a"), 2)
+        self.assertEqual(bloom.value("b"), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,51 @@
+import unittest
+
+from src.profusion.keys import int2key, iter_keys, np, to_key
+
+
+class TestKeys(unittest.TestCase):
+    def test_to_key(self):
+        self.assertEqual(to_key("abc"), b"abc")
+        self.assertEqual(to_key(b"abc"), b"abc")
+        view = memoryview(b"abc")
+        self.assertIs(to_key(view), view)
+        self.assertEqual(to_key(1), b"\x01" + b"\0" * 7)
+
+    def test_int2key(self):
+        self.assertEqual(int2key(-1), b"\xff" * 8)
+        self.assertEqual(int2key((1 << 64) - 1), b"\xff" * 8)
+        self.assertEqual(len(int2key(1 << 64)), 9)
+        self.assertEqual(len(int2key(-(1 << 63) - 1)), 9)
+
+    def test_iter_keys_iterable(self):
+        self.assertEqual(list(iter_keys(["a", 1])), ["a", 1])
+
+    @unittest.skipIf(np is None, "numpy not installed")
+    def test_iter_keys_int_array(self):
+        array = np.array([1, -2, 3], dtype=np.int32)
+        keys = [bytes(key) for key in iter_keys(array)]
+        self.assertEqual(keys, [int2key(1), int2key(-2), int2key(3)])
+
+    @unittest.skipIf(np is None, "numpy not installed")
+    def test_iter_keys_uint64_array(self):
+        array = np.array([(1 << 64) - 1], dtype=np.uint64)
+        self.assertEqual(bytes(next(iter_keys(array))), b"\xff" * 8)
+
+    @unittest.skipIf(np is None, "numpy not installed")
+    def test_numpy_scalars_match_arrays(self):
+        for dtype in (np.int32, np.uint8, np.int64, np.uint64, np.bool_):
+            array = np.array([0, 1, 5], dtype=dtype)
+            self.assertEqual(
+                [to_key(x) for x in array],
+                [bytes(key) for key in iter_keys(array)],
+            )
+
+    @unittest.skipIf(np is None, "numpy not installed")
+    def test_iter_keys_bytes_array(self):
+        array = np.array([b"a", b"abc", b""], dtype="S3")
+        keys = [bytes(key) for key in iter_keys(array)]
+        self.assertEqual(keys, [b"a", b"abc", b""])
+
+
+if __name__ == "__main__":
+    unittest.main()
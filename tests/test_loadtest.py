@@ -0,0 +1,99 @@
+import json
+import os
+import random
+import tempfile
+import unittest
+from unittest import mock
+
+from src.profusion import BloomException, MMCountingBloom
+from src.profusion.loadtest import (
+    _worker,
+    key_indexes,
+    latency_stats,
+    load_test,
+)
+
+
+def crashing_worker(config, worker, barrier, queue):
+    """Worker 0 dies without reporting, as when killed"""
+    if worker == 0:
+        os._exit(1)
+    _worker(config, worker, barrier, queue)
+
+
+class TestLoadTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.params = {
+            "dir": self.tmp.name,
+            "capacity": 10000,
+            "error_ratio": 1e-3,
+        }
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_load_test(self):
+        result = load_test(
+            processes=2, operations=300, keys=100, **self.params
+        )
+        json.dumps(result)
+        self.assertEqual(result["operations"], 600)
+        self.assertEqual(
+            result["add"]["calls"] + result["value"]["calls"], 600
+        )
+        self.assertEqual(result["lock_wait"]["calls"], 600)
+        self.assertGreater(result["ops_per_second"], 0)
+        self.assertEqual(result["count_loss"]["keys_lost"], 0)
+        self.assertEqual(result["count_loss"]["adds"], result["add"]["calls"])
+        self.assertEqual(os.listdir(self.tmp.name), [])
+
+    def test_existing_filter_batches(self):
+        bloom = MMCountingBloom("existing", **self.params)
+        bloom.add("key_1", 7)
+        result = load_test(
+            processes=2,
+            operations=400,
+            keys=50,
+            distribution="zipf",
+            add_ratio=1.0,
+            batch_size=10,
+            name="existing",
+            **self.params,
+        )
+        self.assertEqual(result["add"]["calls"], 80)
+        self.assertEqual(result["count_loss"]["keys_lost"], 0)
+        self.assertGreaterEqual(bloom.value("key_0"), 7)
+        self.assertTrue(os.path.isfile(bloom.path))
+
+    def test_dead_worker(self):
+        with mock.patch(
+            "src.profusion.loadtest._worker", crashing_worker
+        ), self.assertRaises(BloomException):
+            load_test(processes=2, operations=100, keys=10, **self.params)
+        self.assertEqual(os.listdir(self.tmp.name), [])
+
+    def test_key_indexes(self):
+        config = {"keys": 1000, "distribution": "zipf", "zipf_exponent": 2}
+        indexes = key_indexes(random.Random(0), config, 10000)
+        self.assertGreater(indexes.count(0), 5000)
+        config["distribution"] = "uniform"
+        indexes = key_indexes(random.Random(0), config, 10000)
+        self.assertLess(indexes.count(0), 100)
+
+    def test_latency_stats(self):
+        stats = latency_stats([i / 1e6 for i in range(1, 101)])
+        self.assertAlmostEqual(stats["p50_us"], 51)
+        self.assertAlmostEqual(stats["p99_us"], 100)
+        self.assertEqual(latency_stats([]), {"calls": 0})
+
+    def test_invalid_parameters(self):
+        with self.assertRaises(BloomException):
+            load_test(processes=0, **self.params)
+        with self.assertRaises(BloomException):
+            load_test(distribution="normal", **self.params)
+        with self.assertRaises(BloomException):
+            load_test(add_ratio=2, **self.params)
+        MMCountingBloom("other", **self.params)
+        with self.assertRaises(BloomException):
+            load_test(name="other", dir=self.tmp.name, capacity=10)
@@ -1,8 +1,9 @@
 import unittest
 import os
 import tempfile
+import zipfile
 
-from src.profusion import MMCountingBloom, BloomException
+from src.profusion import Bloom, MMCountingBloom, BloomException
 
 
 class TestMMCountingBloom(unittest.TestCase):
@@ -35,6 +36,35 @@ class TestMMCountingBloom(unittest.TestCase):
         self.assertEqual(self.bloom.value("test_element"), 3)
         self.assertEqual(self.bloom.value("non_existent_element"), 0)
 
+    def test_dedupe(self):
+        items = ["a", "b", "a", "c", "a"]
+        self.assertEqual(list(self.bloom.dedupe(items)), ["a", "b", "c"])
+        self.assertEqual(self.bloom.value("a"), 3)
+
+    def test_save_async(self):
+        self.bloom.add("test_element", amount=2)
+        path = os.path.join(self.temp_dir, "snapshot.zip")
+        self.bloom.save_async(path).result()
+        self.bloom.zero()
+        self.bloom.restore(path)
+        os.remove(path)
+        self.assertEqual(self.bloom.value("test_element"), 2)
+
+    def test_lock_waits(self):
+        waits = []
+        bloom = MMCountingBloom(
+            "test_bloom",
+            dir=self.temp_dir,
+            capacity=1000,
+            error_ratio=0.01,
+            lock_waits=waits,
+        )
+        bloom.add("a")
+        bloom.add_many(["b", "c"])
+        bloom.value("a")
+        self.assertEqual(len(waits), 3)
+        self.assertTrue(all(wait >= 0 for wait in waits))
+
     def test_zero(self):
         self.bloom.add("test_element", amount=5)
         self.bloom.zero()
@@ -68,6 +98,113 @@ class TestMMCountingBloom(unittest.TestCase):
         self.assertTrue(self.bloom.check("test_element", trigger=3))
         self.assertFalse(self.bloom.check("test_element", trigger=4))
 
+    def test_key_types(self):
+        self.bloom.add(b"bytes")
+        self.bloom.add(7, amount=2)
+        self.assertEqual(self.bloom.value("bytes"), 1)
+        self.assertEqual(self.bloom.value(memoryview(b"bytes")), 1)
+        self.assertEqual(self.bloom.value(7), 2)
+
+    def test_batch_operations(self):
+        self.bloom.add_many(["a", "b", "a"])
+        self.assertEqual(self.bloom.value_many(["a", "b", "c"]), [2, 1, 0])
+        self.assertEqual(
+            self.bloom.check_many(["a", "b"], trigger=2), [True, False]
+        )
+
+    def test_merge(self):
+        other = MMCountingBloom(
+            "other", dir=self.temp_dir, capacity=1000, error_ratio=0.01
+        )
+        self.bloom.add("test_element", amount=2)
+        other.add("test_element", amount=3)
+        self.bloom.merge(other)
+        self.assertEqual(self.bloom.value("test_element"), 5)
+        del other
+
+    def test_snapshot_and_restore(self):
+        path = os.path.join(self.temp_dir, "snapshot.zip")
+        self.bloom.add("test_element", amount=3)
+        self.bloom.snapshot(path)
+        self.bloom.zero()
+
+        self.bloom.restore(path)
+        self.assertEqual(self.bloom.value("test_element"), 3)
+
+    def test_snapshot_is_atomic(self):
+        path = os.path.join(self.temp_dir, "snapshot.zip")
+        with self.assertRaises(BloomException):
+            self.bloom.snapshot(None)
+        with self.assertRaises(BloomException):
+            self.bloom.save_async(None)
+
+        def failing_chunks():
+            yield b"\0"
+            raise OSError("disk full")
+
+        self.bloom._chunks = failing_chunks
+        with self.assertRaises(OSError):
+            self.bloom.snapshot(path)
+        self.assertEqual(os.listdir(self.temp_dir), ["test_bloom.mmcb"])
+
+    def test_to_bloom(self):
+        keys = [f"key_{i}" for i in range(300)]
+        for i, key in enumerate(keys[:200]):
+            self.bloom.add(key, i % 3 + 1)
+        path = os.path.join(self.temp_dir, "bloom.zip")
+        for trigger in (1, 2, 3):
+            self.bloom.to_bloom(trigger, path=path)
+            bloom = Bloom(path=path)
+            self.assertEqual(bloom.hash_scheme, "sha256")
+            self.assertEqual(
+                [bloom.check(key) for key in keys],
+                self.bloom.check_many(keys, trigger),
+            )
+            self.assertEqual(
+                bloom.check_many(keys), self.bloom.check_many(keys, trigger)
+            )
+
+    def test_restore_into_new_filter(self):
+        path = os.path.join(self.temp_dir, "snapshot.zip")
+        self.bloom.add("test_element", amount=2)
+        self.bloom.snapshot(path)
+
+        other = MMCountingBloom(
+            "restored", dir=self.temp_dir, capacity=1000, error_ratio=0.01
+        )
+        other.restore(path)
+        self.assertEqual(other.value("test_element"), 2)
+        del other
+
+    def test_restore_mismatched_parameters(self):
+        path = os.path.join(self.temp_dir, "snapshot.zip")
+        self.bloom.snapshot(path)
+
+        other = MMCountingBloom(
+            "mismatch", dir=self.temp_dir, capacity=2000, error_ratio=0.01
+        )
+        with self.assertRaises(BloomException):
+            other.restore(path)
+        del other
+
+    def test_restore_corrupt_snapshot(self):
+        path = os.path.join(self.temp_dir, "snapshot.zip")
+        self.bloom.add("test_element", amount=2)
+        self.bloom.snapshot(path)
+        with zipfile.ZipFile(path) as zf:
+            entries = {name: zf.read(name) for name in zf.namelist()}
+        counts = bytearray(entries["bf.bin"])
+        counts[0] ^= 1
+        entries["bf.bin"] = bytes(counts)
+        with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as zf:
+            for name, data in entries.items():
+                zf.writestr(name, data)
+
+        self.bloom.add("test_element")
+        with self.assertRaises(BloomException):
+            self.bloom.restore(path)
+        self.assertEqual(self.bloom.value("test_element"), 3)
+
     def test_bin_size_limit(self):
         max_bin_size = self.bloom.bin_size
         self.bloom.add("test_element", amount=max_bin_size + 10)
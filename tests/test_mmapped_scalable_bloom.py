@@ -0,0 +1,111 @@
+import json
+import multiprocessing
+import os
+import shutil
+import tempfile
+import unittest
+
+from src.profusion import BloomException, MMScalableBloom, ScalableBloom
+
+
+def dedupe_worker(temp_dir, keys):
+    bloom = MMScalableBloom(
+        "test_bloom", dir=temp_dir, initial_size=1000, max_error=0.01
+    )
+    return list(bloom.dedupe(keys, batch_size=100))
+
+
+class TestMMScalableBloom(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.bloom = self._open()
+
+    def tearDown(self):
+        self.bloom.close()
+        shutil.rmtree(self.temp_dir)
+
+    def _open(self, **kwargs):
+        return MMScalableBloom(
+            "test_bloom",
+            dir=self.temp_dir,
+            initial_size=kwargs.get("initial_size", 1000),
+            max_error=0.01,
+            growth_factor=2,
+        )
+
+    def test_initialization(self):
+        self.assertEqual(self.bloom.type, "mmapped scalable bloom")
+        self.assertEqual(self.bloom.blooms, 1)
+        with open(os.path.join(self.bloom.path, "manifest.json")) as fp:
+            manifest = json.load(fp)
+        self.assertEqual(manifest["bins_list"], self.bloom.bins_list)
+        self.assertEqual(manifest["initial_size"], 1000)
+
+    def test_add_and_check(self):
+        self.bloom.add("test_element")
+        self.assertTrue(self.bloom.check("test_element"))
+        self.assertFalse(self.bloom.check("non_existent_element"))
+        self.assertEqual(self.bloom.check_many(["test_element", "x"]), [1, 0])
+
+    def test_growth_is_visible_to_open_instances(self):
+        other = self._open(initial_size=5000)
+        self.assertEqual(other.initial_size, 1000)
+
+        keys = [f"key_{i}" for i in range(1000)]
+        self.bloom.add_many(keys)
+        self.assertGreater(self.bloom.blooms, 1)
+        self.assertEqual(self.bloom.elements, 1000)
+
+        self.assertTrue(all(other.check_many(keys)))
+        self.assertEqual(other.blooms, self.bloom.blooms)
+        self.assertEqual(other.elements, 1000)
+        self.assertTrue(other.check_then_add("key_999"))
+        self.assertFalse(other.check_then_add("new_key"))
+        self.assertTrue(self.bloom.check("new_key"))
+        other.close()
+
+    def test_new_bloom(self):
+        other = self._open()
+        self.bloom.new_bloom()
+        other.add("after_growth")
+        self.assertEqual(other.blooms, 2)
+        self.assertTrue(self.bloom.check("after_growth"))
+        other.close()
+
+    def test_dedupe_across_processes(self):
+        keys = [f"key_{i}" for i in range(2000)]
+        ctx = multiprocessing.get_context("fork")
+        with ctx.Pool(4) as pool:
+            results = pool.starmap(
+                dedupe_worker, [(self.temp_dir, keys[i:]) for i in range(4)]
+            )
+        # Each key is reported once at most, and only false positives lost
+        firsts = [s for result in results for s in result]
+        self.assertEqual(len(firsts), len(set(firsts)))
+        self.assertGreater(len(firsts), len(keys) * 0.97)
+        self.assertTrue(all(self.bloom.check_many(keys)))
+        self.assertGreater(self.bloom.blooms, 1)
+
+    def test_snapshot(self):
+        self.bloom.add_many(f"key_{i}" for i in range(1000))
+        path = os.path.join(self.temp_dir, "snapshot.zip")
+        self.bloom.save_async(path).result()
+
+        loaded = ScalableBloom(initial_size=1000, max_error=0.01)
+        loaded.load(path)
+        self.assertEqual(loaded.blooms, self.bloom.blooms)
+        self.assertEqual(loaded.threshold, self.bloom.threshold)
+        self.assertEqual(loaded.elements, self.bloom.elements)
+        self.assertTrue(all(loaded.check_many(f"key_{i}" for i in range(10))))
+
+    def test_share(self):
+        with self.assertRaises(BloomException):
+            self.bloom.share()
+
+    def test_sparse_rejected(self):
+        with self.assertRaises(BloomException):
+            MMScalableBloom("sparse", dir=self.temp_dir, sparse=True)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,115 @@
+from concurrent.futures import ThreadPoolExecutor
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from src.profusion import Bloom, BloomException, PartitionedBloom
+from src.profusion import partitioned_bloom
+
+
+class TestPartitionedBloom(unittest.TestCase):
+    def setUp(self):
+        self.bloom = PartitionedBloom(capacity=1000, error_ratio=0.01)
+        self.keys = [f"key_{i}" for i in range(1000)]
+
+    def test_initialization(self):
+        self.assertEqual(self.bloom.type, "partitioned bloom")
+        self.assertEqual(self.bloom.hashes, 7)
+        self.assertEqual(self.bloom.bins, 7 * self.bloom.slice_bins)
+        self.assertEqual(len(self.bloom.bf), 7 * self.bloom.slice_bytes)
+
+    def test_slices(self):
+        self.bloom.add("apple")
+        for i, (byte_index, _) in enumerate(self.bloom._indexes("apple")):
+            self.assertEqual(byte_index // self.bloom.slice_bytes, i)
+        self.assertTrue(self.bloom.check("apple"))
+        self.assertFalse(self.bloom.check("banana"))
+
+    def test_batches_match_single_adds(self):
+        self.bloom.add_many(self.keys)
+        single = PartitionedBloom(capacity=1000, error_ratio=0.01)
+        for s in self.keys:
+            single.add(s)
+        self.assertEqual(bytes(self.bloom.bf), bytes(single.bf))
+
+        others = [f"other_{i}" for i in range(1000)]
+        results = self.bloom.check_many(self.keys + others)
+        self.assertTrue(all(results[:1000]))
+        self.assertEqual(results[1000:], [single.check(s) for s in others])
+        self.assertLess(sum(results[1000:]), 30)
+
+        with ThreadPoolExecutor(4) as executor:
+            parallel = PartitionedBloom(capacity=1000, error_ratio=0.01)
+            parallel.add_many(self.keys, executor=executor)
+            self.assertEqual(
+                parallel.check_many(self.keys + others, executor=executor),
+                results,
+            )
+        self.assertEqual(bytes(parallel.bf), bytes(single.bf))
+
+    def test_without_numpy(self):
+        self.bloom.add_many(self.keys)
+        with mock.patch.object(partitioned_bloom, "np", None):
+            bloom = PartitionedBloom(capacity=1000, error_ratio=0.01)
+            bloom.add_many(self.keys)
+            self.assertTrue(all(bloom.check_many(self.keys)))
+        self.assertEqual(bytes(bloom.bf), bytes(self.bloom.bf))
+
+    def test_check_then_add_many(self):
+        self.assertEqual(
+            self.bloom.check_then_add_many(["a", "b", "a"]),
+            [False, False, True],
+        )
+        self.assertEqual(
+            list(self.bloom.dedupe(["a", "c", "c", "d"])), ["c", "d"]
+        )
+
+    def test_save_and_load(self):
+        self.bloom.add_many(self.keys)
+        with tempfile.TemporaryDirectory() as temp_dir:
+            path = os.path.join(temp_dir, "bloom.zip")
+            self.bloom.save(path)
+            loaded = PartitionedBloom(path=path)
+            self.assertEqual(loaded.slice_bins, self.bloom.slice_bins)
+            self.assertEqual(bytes(loaded.bf), bytes(self.bloom.bf))
+            self.assertTrue(all(loaded.check_many(self.keys)))
+
+            with self.assertRaises(BloomException):
+                Bloom().load(path)
+
+        view = Bloom.from_buffer(self.bloom.to_buffer(), self.bloom.metadata())
+        self.assertIsInstance(view, PartitionedBloom)
+        self.assertTrue(view.check("key_1"))
+
+    def test_fold(self):
+        bloom = PartitionedBloom(
+            capacity=1000, error_ratio=0.01, power_of_two=True
+        )
+        bloom.add_many(self.keys[:100])
+        slice_bins = bloom.slice_bins
+        bloom.fold(2)
+        self.assertEqual(bloom.slice_bins, slice_bins // 4)
+        self.assertEqual(len(bloom.bf), bloom.hashes * bloom.slice_bins // 8)
+        self.assertTrue(all(bloom.check_many(self.keys[:100])))
+
+        expected = PartitionedBloom(
+            capacity=250, error_ratio=0.01, power_of_two=True
+        )
+        expected.add_many(self.keys[:100])
+        self.assertEqual(bytes(bloom.bf), bytes(expected.bf))
+
+        with self.assertRaises(BloomException):
+            self.bloom.fold()
+
+    def test_thread_safe(self):
+        bloom = PartitionedBloom(
+            capacity=1000, error_ratio=0.01, thread_safe=True
+        )
+        bloom.add_many(self.keys)
+        self.bloom.add_many(self.keys)
+        self.assertEqual(bytes(bloom.bf), bytes(self.bloom.bf))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,171 @@
+import os
+import pickle
+import tempfile
+import time
+import unittest
+import zipfile
+
+from src.profusion import (
+    Bloom,
+    BloomException,
+    Checkpointer,
+    CountingBloom,
+    ScalableBloom,
+    inspect,
+)
+from src.profusion.persist import CHECKSUMS, verify, write_zip
+
+
+def corrupt(path, name="bf.bin"):
+    """Flip a bit of an entry, keeping the ZIP itself valid"""
+    with zipfile.ZipFile(path) as zf:
+        entries = {info.filename: zf.read(info) for info in zf.infolist()}
+    buffer = bytearray(entries[name])
+    buffer[-1] ^= 1
+    entries[name] = bytes(buffer)
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as zf:
+        for entry, data in entries.items():
+            zf.writestr(entry, data)
+
+
+class TestPersist(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "bloom.zip")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_write_zip(self):
+        write_zip(self.path, {"a": 1}, [("bf.bin", b"old")])
+        write_zip(self.path, {"a": 2}, [("bf.bin", b"new")])
+        with zipfile.ZipFile(self.path) as zf:
+            self.assertEqual(zf.read("bf.bin"), b"new")
+            self.assertEqual(zf.read("metadata.json"), b'{"a": 2}')
+        self.assertEqual(os.listdir(self.tmp.name), ["bloom.zip"])
+
+        with self.assertRaises(OSError):
+            write_zip(os.path.join(self.path, "x"), {}, [])
+
+    def test_save_async_all_types(self):
+        for bloom in (
+            CountingBloom(capacity=100, error_ratio=0.01),
+            ScalableBloom(initial_size=1000, max_error=0.01),
+        ):
+            bloom.add("apple")
+            bloom.save_async(self.path).result()
+            new_bloom = type(bloom)(capacity=1, error_ratio=0.5)
+            new_bloom.load(self.path)
+            self.assertEqual(
+                [bytes(bf) for bf in new_bloom._buffers()],
+                [bytes(bf) for bf in bloom._buffers()],
+            )
+
+    def test_inspect(self):
+        bloom = ScalableBloom(initial_size=1000, max_error=0.01)
+        bloom.add_many(range(2000))
+        bloom.save(self.path)
+
+        info = inspect(self.path)
+        self.assertEqual(info["type"], "scalable bloom")
+        self.assertEqual(info["blooms"], bloom.blooms)
+        self.assertTrue(info["checksums"])
+        self.assertEqual(
+            [entry["size"] for entry in info["entries"].values()],
+            [len(bf) for bf in bloom.bfs],
+        )
+        self.assertTrue(inspect(self.path, verify_checksums=True))
+
+        with open(self.path, "wb") as fp:
+            fp.write(b"not a zip")
+        with self.assertRaises(BloomException):
+            inspect(self.path)
+
+    def test_checksums(self):
+        bloom = Bloom(capacity=1000, error_ratio=0.01)
+        bloom.add("apple")
+        bloom.save(self.path)
+        self.assertTrue(verify(self.path))
+
+        corrupt(self.path)
+        with self.assertRaises(BloomException):
+            verify(self.path)
+        with self.assertRaises(BloomException):
+            Bloom().load(self.path)
+
+        unchecked = Bloom()
+        unchecked.load(self.path, verify=False)
+        self.assertTrue(unchecked.check("apple"))
+
+        lazy = Bloom()
+        lazy.load(self.path, verify="lazy")
+        self.assertTrue(lazy.check("apple"))
+        with self.assertRaises(BloomException):
+            lazy.verification.result()
+
+    def test_pickle_after_lazy_load(self):
+        bloom = Bloom(capacity=100, error_ratio=0.01)
+        bloom.add("apple")
+        bloom.save(self.path)
+        lazy = Bloom()
+        lazy.load(self.path, verify="lazy")
+        self.assertTrue(lazy.verification.result())
+        copy = pickle.loads(pickle.dumps(lazy))
+        self.assertTrue(copy.check("apple"))
+        self.assertIsNone(copy.verification)
+
+    def test_without_checksums(self):
+        bloom = CountingBloom(capacity=100, error_ratio=0.01)
+        bloom.add("apple", 3)
+        bloom.save(self.path)
+        with zipfile.ZipFile(self.path) as zf:
+            entries = {
+                name: zf.read(name)
+                for name in zf.namelist()
+                if name != CHECKSUMS
+            }
+        with zipfile.ZipFile(self.path, "w") as zf:
+            for name, data in entries.items():
+                zf.writestr(name, data)
+
+        self.assertFalse(verify(self.path))
+        self.assertFalse(inspect(self.path)["checksums"])
+        with self.assertRaises(BloomException):
+            inspect(self.path, verify_checksums=True)
+        new_bloom = CountingBloom(capacity=1, error_ratio=0.5)
+        new_bloom.load(self.path)
+        self.assertEqual(new_bloom.value("apple"), 3)
+
+    def test_checkpointer(self):
+        bloom = Bloom(capacity=1000, error_ratio=0.01)
+        with Checkpointer(bloom, interval=0.01, path=self.path) as saver:
+            for i in range(1000):
+                bloom.add(f"key_{i}")
+            deadline = time.monotonic() + 5
+            while saver.saves < 2 and time.monotonic() < deadline:
+                time.sleep(0.01)
+            self.assertGreaterEqual(saver.saves, 2)
+            bloom.add("last")
+
+        new_bloom = Bloom()
+        new_bloom.load(self.path)
+        self.assertTrue(new_bloom.check("last"))
+        self.assertIsNone(saver.last_error)
+
+    def test_checkpointer_errors(self):
+        errors = []
+        saver = Checkpointer(
+            Bloom(capacity=100, error_ratio=0.01),
+            path=os.path.join(self.path, "x"),
+            on_error=errors.append,
+        )
+        self.assertFalse(saver.save())
+        self.assertEqual(len(errors), 1)
+        self.assertIs(saver.last_error, errors[0])
+
+        with self.assertRaises(ValueError):
+            Checkpointer(Bloom(capacity=100, error_ratio=0.01), interval=0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,99 @@
+import unittest
+
+from src.profusion import (
+    Bloom,
+    BloomException,
+    CountingBloom,
+    PartitionedBloom,
+    ScalableBloom,
+    plan,
+)
+
+
+def buffer_bytes(bloom):
+    """Bytes held by every buffer attribute of a filter"""
+    total = 0
+    for value in vars(bloom).values():
+        values = value if isinstance(value, list) else [value]
+        for item in values:
+            if isinstance(item, (bytearray, memoryview)):
+                total += len(item)
+    return total
+
+
+class TestPlanner(unittest.TestCase):
+    def test_plan_capacity_and_error_ratio(self):
+        result = plan(capacity=10000, error_ratio=0.001, benchmark=False)
+        self.assertEqual(result.type, "bloom")
+        self.assertEqual(result.capacity, 10000)
+        self.assertLessEqual(result.error_ratio, 0.001)
+
+        bloom = Bloom.from_plan(result)
+        self.assertIsInstance(bloom, Bloom)
+        self.assertEqual(len(bloom.bf), result.bytes)
+        self.assertEqual(bloom.capacity, 10000)
+
+    def test_budget_relaxes_error_ratio(self):
+        result = plan(
+            capacity=100000,
+            error_ratio=1e-9,
+            max_bytes=100000,
+            benchmark=False,
+        )
+        self.assertLessEqual(result.bytes, 100000)
+        self.assertGreater(result.error_ratio, 1e-9)
+        self.assertEqual(len(result.build().bf), result.bytes)
+
+        # The lowest power of two error ratio that fits
+        tighter = result.params["error_ratio"] / 2
+        bloom = Bloom(capacity=100000, error_ratio=tighter)
+        self.assertGreater(len(bloom.bf), 100000)
+
+    def test_budget_sets_capacity(self):
+        result = plan(error_ratio=0.01, max_bytes=4096, benchmark=False)
+        self.assertLessEqual(result.bytes, 4096)
+        bigger = Bloom(capacity=result.capacity + 10, error_ratio=0.01)
+        self.assertGreater(len(bigger.bf), 4096)
+
+    def test_workloads(self):
+        counting = plan(capacity=1000, error_ratio=0.01, workload="count")
+        self.assertIsInstance(counting.build(), CountingBloom)
+        self.assertEqual(
+            counting.bytes, CountingBloom(**counting.params).bytes
+        )
+        self.assertEqual(set(counting.ops_per_second), {"add", "check"})
+
+        growing = plan(capacity=10**6, error_ratio=0.01, workload="grow")
+        self.assertIsInstance(growing.build(), ScalableBloom)
+        self.assertGreaterEqual(growing.capacity, 10**6)
+        self.assertLessEqual(growing.error_ratio, 0.01)
+
+        fixed = plan(capacity=1000, error_ratio=0.01)
+        self.assertIn(fixed.type, (Bloom.type, PartitionedBloom.type))
+        self.assertGreater(min(fixed.ops_per_second.values()), 0)
+
+    def test_grow_plan_allocates_planned_bytes(self):
+        result = plan(
+            capacity=10000,
+            error_ratio=0.01,
+            max_bytes=1 << 20,
+            workload="grow",
+            benchmark=False,
+        )
+        bloom = result.build()
+        self.assertEqual(buffer_bytes(bloom), result.bytes)
+        self.assertLessEqual(result.bytes, 1 << 20)
+
+    def test_invalid(self):
+        with self.assertRaises(BloomException):
+            plan()
+        with self.assertRaises(BloomException):
+            plan(capacity=1000, workload="unknown")
+        with self.assertRaises(BloomException):
+            plan(capacity=10**6, max_bytes=10, benchmark=False)
+        with self.assertRaises(BloomException):
+            plan(capacity=10**6, max_bytes=10, workload="grow")
+
+
+if __name__ == "__main__":
+    unittest.main()
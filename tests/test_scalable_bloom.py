@@ -1,8 +1,10 @@
 import os
+import pickle
 import tempfile
 import unittest
 
-from src.profusion import ScalableBloom
+from src.profusion import BloomException, ScalableBloom
+from src.profusion.sparse import SparseBits
 
 
 class TestScalableBloom(unittest.TestCase):
@@ -30,6 +32,15 @@ class TestScalableBloom(unittest.TestCase):
         self.assertFalse(self.bloom.check_then_add("new_item"))
         self.assertTrue(self.bloom.check_then_add("new_item"))
 
+    def test_dedupe(self):
+        items = [f"key_{i % 500}" for i in range(2000)]
+        firsts = list(self.bloom.dedupe(items, batch_size=100))
+        self.assertGreater(self.bloom.blooms, 1)
+        self.assertEqual(len(firsts), len(set(firsts)))
+        self.assertGreater(len(firsts), 490)
+        self.assertEqual(self.bloom.elements, len(firsts))
+        self.assertEqual(list(self.bloom.dedupe(items)), [])
+
     def test_scaling(self):
         initial_blooms = self.bloom.blooms
         initial_threshold = self.bloom.threshold
@@ -80,6 +91,135 @@ class TestScalableBloom(unittest.TestCase):
 
         os.unlink(tmp.name)
 
+    def test_thread_safe_rejected(self):
+        with self.assertRaises(BloomException):
+            ScalableBloom(thread_safe=True)
+
+    def test_power_of_two_rejected(self):
+        with self.assertRaises(BloomException):
+            ScalableBloom(power_of_two=True)
+
+    def test_hash_scheme_rejected(self):
+        with self.assertRaises(BloomException):
+            ScalableBloom(hash_scheme="sha256")
+
+    def test_sparse(self):
+        bloom = ScalableBloom(
+            initial_size=1000,
+            max_error=0.01,
+            error_decay_rate=0.5,
+            growth_factor=2,
+            sparse=True,
+        )
+        keys = []
+        while bloom.blooms < 3:
+            keys.append(f"item_{len(keys)}")
+            bloom.add(keys[-1])
+            self.bloom.add(keys[-1])
+        self.assertEqual(bloom.bfs, self.bloom.bfs)
+        self.assertIsInstance(bloom.bfs[-1], SparseBits)
+        self.assertIsInstance(bloom.bfs[0], bytearray)
+        self.assertTrue(all(bloom.check_many(keys)))
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "scalable.zip")
+            bloom.save(path)
+            new_bloom = ScalableBloom(sparse=True)
+            new_bloom.load(path)
+            self.assertEqual(new_bloom.bfs, self.bloom.bfs)
+            self.assertIsInstance(new_bloom.bfs[-1], SparseBits)
+
+    def test_checkpoint_replays_growth(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "scalable.zip")
+            self.bloom.add("base")
+            self.bloom.save(path)
+
+            for i in range(int(self.bloom.threshold * 2)):
+                self.bloom.add(f"item_{i}")
+            self.bloom.checkpoint()
+
+            new_bloom = ScalableBloom()
+            new_bloom.load(path)
+            self.assertEqual(self.bloom.blooms, new_bloom.blooms)
+            self.assertEqual(self.bloom.elements, new_bloom.elements)
+            self.assertEqual(self.bloom.threshold, new_bloom.threshold)
+            self.assertEqual(self.bloom.bfs, new_bloom.bfs)
+
+    def test_stale_delta_log_skipped(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "scalable.zip")
+            self.bloom.save(path)
+            self.bloom.add("b")
+            self.bloom.checkpoint()
+            with open(path + ".delta", "rb") as fp:
+                stale = fp.read()
+            for i in range(int(self.bloom.threshold * 2)):
+                self.bloom.add(f"item_{i}")
+            self.bloom.save(path)
+
+            # Crash after replacing the base file, before removing the log
+            with open(path + ".delta", "wb") as fp:
+                fp.write(stale)
+
+            new_bloom = ScalableBloom()
+            new_bloom.load(path)
+            self.assertEqual(self.bloom.blooms, new_bloom.blooms)
+            self.assertEqual(self.bloom.elements, new_bloom.elements)
+            self.assertEqual(self.bloom.bfs, new_bloom.bfs)
+
+    def test_index_cache_across_growth(self):
+        bloom = ScalableBloom(
+            initial_size=1000,
+            max_error=0.01,
+            growth_factor=2,
+            cache_size=64,
+            cache_policy="clock",
+        )
+        bloom.add("hot")
+        self.assertTrue(bloom.check("hot"))
+        for i in range(int(bloom.threshold * 2)):
+            bloom.add(f"item_{i}")
+        self.assertGreater(bloom.blooms, 1)
+        self.assertTrue(bloom.check("hot"))
+        self.assertEqual(
+            list(bloom._indexes("hot")), list(bloom._hash_indexes("hot"))
+        )
+
+    def test_add_many_and_check_many(self):
+        self.bloom.add_many(["a", b"b", 3])
+        self.assertEqual(
+            self.bloom.check_many(["a", "b", 3, "d"]),
+            [True, True, True, False],
+        )
+
+    def test_share_and_from_buffer(self):
+        self.bloom.add("before")
+        handle = self.bloom.share()
+        try:
+            attached = pickle.loads(pickle.dumps(self.bloom))
+            self.assertIsInstance(attached, ScalableBloom)
+            attached.add("after")
+            self.assertTrue(self.bloom.check("after"))
+
+            # Subfilters added after sharing get their own segments
+            self.bloom.add_many(f"key_{i}" for i in range(1000))
+            self.assertGreater(self.bloom.blooms, len(handle.names))
+            self.assertEqual(len(self.bloom.handle().names), self.bloom.blooms)
+            attached.unshare()
+        finally:
+            self.bloom.unshare()
+        self.assertTrue(all(self.bloom.check_many(["before", "key_999"])))
+
+        copy = ScalableBloom.from_buffer(
+            [bytearray(view) for view in self.bloom.to_buffer()],
+            self.bloom.metadata(),
+        )
+        self.assertEqual(copy.blooms, self.bloom.blooms)
+        self.assertTrue(copy.check("key_500"))
+        copy.add("copied")
+        self.assertFalse(self.bloom.check("copied"))
+
     def test_capacity(self):
         total_capacity = 0
         for i in range(self.bloom.blooms):
@@ -0,0 +1,65 @@
+import random
+import unittest
+from unittest import mock
+
+from src.profusion.sparse import SparseBits, dense, set_bits
+
+
+class TestSparseBits(unittest.TestCase):
+    def test_bytes(self):
+        bits = SparseBits(20000)
+        expected = bytearray(20000)
+        for index, value in ((0, 1), (3, 0x81), (9000, 0xFF), (-1, 2)):
+            bits[index] = value
+            expected[index] = value
+        bits[3] = 0x80
+        expected[3] = 0x80
+        self.assertEqual(bits, expected)
+        self.assertEqual(bits[3], 0x80)
+        self.assertEqual(bits[4], 0)
+        self.assertEqual(bits.count, 11)
+        self.assertEqual(len(bits.containers), 3)
+
+        bits[9000] = 0
+        self.assertEqual(len(bits.containers), 2)
+        with self.assertRaises(IndexError):
+            bits[20000]
+        with self.assertRaises(ValueError):
+            bits[0] = 256
+
+    def test_slices(self):
+        rnd = random.Random(1)
+        size = 50000
+        expected = bytearray(size)
+        bits = SparseBits(size)
+        for _ in range(50):
+            start = rnd.randrange(size)
+            end = min(size, start + rnd.randrange(20000))
+            chunk = bytes(
+                rnd.choice([0, 0, 0, 1, 0x90]) for _ in range(end - start)
+            )
+            expected[start:end] = chunk
+            bits[start:end] = chunk
+            self.assertEqual(bits[start:end], chunk)
+        self.assertEqual(bits.to_bytearray(), expected)
+        self.assertEqual(bits.count, sum(bin(b).count("1") for b in expected))
+        self.assertEqual(SparseBits.from_buffer(expected), bits)
+        with self.assertRaises(ValueError):
+            bits[0:2] = b"\0"
+
+    def test_without_numpy(self):
+        buffer = bytes([0, 3, 0, 0x80] * 100)
+        positions = set_bits(buffer)
+        with mock.patch("src.profusion.sparse.np", None):
+            self.assertEqual(set_bits(buffer), positions)
+            bits = SparseBits.from_buffer(buffer)
+            self.assertEqual(bits.to_bytearray(), buffer)
+        self.assertEqual(positions[:3], [8, 9, 31])
+
+    def test_dense(self):
+        bits = SparseBits(16)
+        bits[1] = 4
+        self.assertEqual(dense(bits), bytearray(b"\0\4" + bytes(14)))
+        buffer = bytearray(4)
+        self.assertIs(dense(buffer), buffer)
+        self.assertEqual(bits.saturation(), 1 / 128)
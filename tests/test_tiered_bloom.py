@@ -0,0 +1,113 @@
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from src.profusion import Bloom, BloomException, TieredBloom
+from src.profusion import tiered_bloom
+
+
+class TestTieredBloom(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.bloom = self._open()
+
+    def tearDown(self):
+        self.bloom.close()
+        shutil.rmtree(self.temp_dir)
+
+    def _open(self, **kwargs):
+        return TieredBloom(
+            "test_bloom",
+            dir=self.temp_dir,
+            capacity=10000,
+            error_ratio=0.01,
+            hot_capacity=100,
+            **kwargs,
+        )
+
+    def test_create_error_not_hidden(self):
+        missing = os.path.join(self.temp_dir, "missing")
+        with self.assertRaises(FileNotFoundError) as context:
+            TieredBloom("test_bloom", dir=missing)
+        # Not raised again while removing the temporary file
+        self.assertIsNone(context.exception.__context__)
+
+    def test_add_and_check(self):
+        self.bloom.add("apple")
+        self.assertTrue(self.bloom.check("apple"))
+        self.assertFalse(self.bloom.check("banana"))
+        self.assertIn("apple", self.bloom)
+        self.assertFalse(any(self.bloom.cold.bf))
+
+        self.assertEqual(self.bloom.merge(), 1)
+        self.assertFalse(any(self.bloom.hot.bf))
+        self.assertTrue(self.bloom.cold.check("apple"))
+        self.assertTrue(self.bloom.check("apple"))
+        self.assertEqual(self.bloom.merge(), 0)
+
+    def test_cold_matches_bloom(self):
+        keys = [f"key_{i}" for i in range(250)]
+        self.bloom.add_many(keys[:150])
+        for s in keys[150:]:
+            self.bloom.add(s)
+        # Merged automatically every 100 elements
+        self.assertEqual(self.bloom._unmerged, 50)
+        self.assertTrue(all(self.bloom.check_many(keys)))
+
+        self.bloom.merge()
+        bloom = Bloom(capacity=10000, error_ratio=0.01)
+        bloom.add_many(keys)
+        self.assertEqual(bytes(self.bloom.cold.bf), bytes(bloom.bf))
+
+    def test_without_numpy(self):
+        keys = [f"key_{i}" for i in range(150)]
+        with mock.patch.object(tiered_bloom, "np", None):
+            self.bloom.add_many(keys)
+            self.assertEqual(self.bloom.check_many(keys), [True] * 150)
+            self.bloom.merge()
+        bloom = Bloom(capacity=10000, error_ratio=0.01)
+        bloom.add_many(keys)
+        self.assertEqual(bytes(self.bloom.cold.bf), bytes(bloom.bf))
+
+    def test_check_then_add_many(self):
+        self.assertEqual(
+            self.bloom.check_then_add_many(["a", "b", "a"]),
+            [False, False, True],
+        )
+        self.assertTrue(self.bloom.check_then_add("b"))
+
+    def test_shared_cold_tier(self):
+        other = self._open()
+        self.bloom.add("apple")
+        self.assertFalse(other.check("apple"))
+        self.bloom.merge()
+        self.assertTrue(other.check("apple"))
+
+        other.add("banana")
+        other.close()
+        self.assertTrue(self.bloom.check("banana"))
+
+        with self.assertRaises(BloomException):
+            TieredBloom("test_bloom", dir=self.temp_dir, capacity=20000)
+
+    def test_snapshot(self):
+        self.bloom.add_many(["apple", "banana"])
+        path = os.path.join(self.temp_dir, "snapshot.zip")
+        self.bloom.save_async(path).result()
+
+        loaded = Bloom()
+        loaded.load(path)
+        self.assertTrue(loaded.check("apple"))
+        self.assertEqual(bytes(loaded.bf), bytes(self.bloom.cold.bf))
+
+    def test_invalid_parameters(self):
+        with self.assertRaises(BloomException):
+            TieredBloom("x", dir=self.temp_dir, hot_capacity=0)
+        with self.assertRaises(BloomException):
+            TieredBloom("x", dir=self.temp_dir, capacity=0)
+
+
+if __name__ == "__main__":
+    unittest.main()